@@ -1,7 +1,23 @@
 # shop/admin.py
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Product, Purchase
+from .deletion import delete_employees, delete_in_batches
+from .forms import SalaryAdjustmentForm
+from .models import (
+    OutboxEvent, OutboxOffset, PaymentPeriod, Position, Product, Purchase, PurchaseArchive, ReportJob,
+    SalaryAdjustment,
+)
+from .live import notify_payroll_changed
+from .reports import delete_report_file
+from .salary_adjustment import apply_adjustment, preview_adjustment, validate_preview
+from .search import search_employees, search_payments
 
 
 @admin.register(Product)
@@ -9,25 +25,28 @@ class ProductAdmin(admin.ModelAdmin):
     # Отображение в списке
     list_display = (
         'name',
-        'position',
+        'position_ref',
         'employee_type_display',
         'salary_display',
         'experience_display',
         'employee_status',
     )
     
-    list_filter = ('employee_type',)
-    search_fields = ('name', 'position')
-    list_editable = ('position',)  # Позицию можно редактировать прямо в списке
+    # Действующий уровень и должность — индексированные колонки БД
+    list_filter = ('level', 'position_ref')
+    search_fields = ('name', 'position_ref__name')  # Ищем через индекс, см. get_search_results
+    list_editable = ('position_ref',)  # Должность можно менять прямо в списке
+    list_select_related = ('position_ref',)
+    ordering = ('name', 'id')  # Стабильный порядок для постраничного автодополнения
     
     # Группировка полей в форме редактирования
     fieldsets = (
         ('Личная информация', {
-            'fields': ('name', 'position'),
+            'fields': ('name', 'position_ref'),
             'description': 'Основные данные сотрудника'
         }),
         ('Классификация', {
-            'fields': ('employee_type',),
+            'fields': ('employee_type', 'level'),
             'description': 'Уровень сотрудника'
         }),
         ('Финансовая информация', {
@@ -43,6 +62,8 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
     
+    readonly_fields = ('level',)
+    
     # Кастомизация полей
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
@@ -50,15 +71,30 @@ class ProductAdmin(admin.ModelAdmin):
         form.base_fields['name'].help_text = 'Введите ФИО сотрудника полностью'
         form.base_fields['price'].help_text = 'Основной оклад в рублях'
         form.base_fields['quantity'].help_text = 'Стаж работы в годах'
-        form.base_fields['position'].help_text = 'Например: Разработчик, Менеджер, Аналитик'
+        form.base_fields['position_ref'].help_text = 'Например: Разработчик, Менеджер, Аналитик'
         form.base_fields['employee_type'].help_text = 'Если не выбран, определится по стажу автоматически'
         return form
     
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'position_ref':
+            # Список должностей читается один раз на запрос, а не в каждой
+            # строке list_editable
+            if not hasattr(request, '_position_choices'):
+                request._position_choices = list(field.choices)
+            field.choices = request._position_choices
+        return field
+    
+    # Поиск по триграммному индексу (PostgreSQL) или FTS5 (SQLite).
+    # Его же использует автодополнение поля "Сотрудник" в форме выплаты.
+    def get_search_results(self, request, queryset, search_term):
+        return search_employees(queryset, search_term), False
+    
     # Методы для красивого отображения
     def employee_type_display(self, obj):
         return obj.calculated_employee_type
     employee_type_display.short_description = 'Уровень'
-    employee_type_display.admin_order_field = 'employee_type'
+    employee_type_display.admin_order_field = 'level'
     
     def salary_display(self, obj):
         return f"{obj.price:.2f} руб."
@@ -86,22 +122,145 @@ class ProductAdmin(admin.ModelAdmin):
     employee_status.short_description = 'Статус'
     
     # Действия в админке
-    actions = ['set_as_junior', 'set_as_middle', 'set_as_senior']
+    actions = ['set_as_junior', 'set_as_middle', 'set_as_senior', 'set_level_by_service', 'adjust_salaries']
     
+    # update() не трогает auto_now, поэтому updated_at (версия данных
+    # для условных GET-запросов) выставляем явно, и сигналов не шлет —
+    # живые обновления уведомляем сами
     def set_as_junior(self, request, queryset):
-        updated = queryset.update(employee_type='JUNIOR')
+        updated = queryset.update(employee_type='JUNIOR', updated_at=timezone.now())
+        notify_payroll_changed()
         self.message_user(request, f"{updated} сотрудников установлены как Junior")
     set_as_junior.short_description = "Установить уровень: Junior"
     
     def set_as_middle(self, request, queryset):
-        updated = queryset.update(employee_type='MIDDLE')
+        updated = queryset.update(employee_type='MIDDLE', updated_at=timezone.now())
+        notify_payroll_changed()
         self.message_user(request, f"{updated} сотрудников установлены как Middle")
     set_as_middle.short_description = "Установить уровень: Middle"
     
     def set_as_senior(self, request, queryset):
-        updated = queryset.update(employee_type='SENIOR')
+        updated = queryset.update(employee_type='SENIOR', updated_at=timezone.now())
+        notify_payroll_changed()
         self.message_user(request, f"{updated} сотрудников установлены как Senior")
     set_as_senior.short_description = "Установить уровень: Senior"
+    
+    def set_level_by_service(self, request, queryset):
+        updated = queryset.update(employee_type=None, updated_at=timezone.now())
+        notify_payroll_changed()
+        self.message_user(request, f"{updated} сотрудников: уровень определяется по стажу")
+    set_level_by_service.short_description = "Определять уровень по стажу"
+    
+    # Массовое изменение окладов: промежуточная страница с правилом и
+    # предпросмотром (один агрегатный запрос), применение — один UPDATE.
+    # Выбор "все N сотрудников" (select_across) учитывает фильтры списка.
+    def adjust_salaries(self, request, queryset):
+        form = SalaryAdjustmentForm(request.POST if 'preview' in request.POST or 'apply' in request.POST else None)
+        preview = None
+        if form.is_bound and form.is_valid():
+            try:
+                preview = preview_adjustment(queryset, **form.cleaned_data)
+                validate_preview(preview)
+                if 'apply' in request.POST:
+                    adjustment = apply_adjustment(
+                        queryset,
+                        selection={
+                            'select_across': request.POST.get('select_across') == '1',
+                            'filters': request.GET.dict(),
+                        },
+                        user=request.user,
+                        source='admin',
+                        **form.cleaned_data,
+                    )
+                    self.message_user(
+                        request,
+                        f"Оклады изменены у {adjustment.employees_count} сотрудников: фонд "
+                        f"{adjustment.fund_before} -> {adjustment.fund_after} руб. ({adjustment.fund_delta:+})",
+                    )
+                    return None
+            except ValidationError as e:
+                form.add_error(None, e)
+                preview = None
+        
+        return TemplateResponse(request, 'admin/shop/product/adjust_salaries.html', {
+            **self.admin_site.each_context(request),
+            'title': "Изменение окладов",
+            'opts': self.model._meta,
+            'form': form,
+            'preview': preview,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+        })
+    adjust_salaries.short_description = "Изменить оклады (процент, надбавка, округление)"
+    adjust_salaries.allowed_permissions = ('change',)
+    
+    # Удаление — через shop.deletion: выплаты удаляются пачками до
+    # сотрудника, а не одним каскадом в общей транзакции
+    def delete_model(self, request, obj):
+        delete_employees(Product.objects.filter(pk=obj.pk))
+    
+    def delete_queryset(self, request, queryset):
+        delete_employees(queryset)
+    
+    def get_deleted_objects(self, objs, request):
+        """Подтверждение удаления: выплаты показываются числом, а не
+        списком (сборщик Django загрузил бы каждую)"""
+        employees = list(objs)
+        ids = [employee.pk for employee in employees]
+        model_count = {Product._meta.verbose_name_plural: len(employees)}
+        perms_needed = set()
+        for model in (Purchase, PurchaseArchive):
+            count = model.objects.filter(product_id__in=ids).aggregate(count=Count('id'))['count']
+            if not count:
+                continue
+            model_count[model._meta.verbose_name_plural] = count
+            if not request.user.has_perm(f'{model._meta.app_label}.delete_{model._meta.model_name}'):
+                perms_needed.add(model._meta.verbose_name)
+        return [str(employee) for employee in employees], model_count, perms_needed, []
+
+
+@admin.register(Position)
+class PositionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'employees_count')
+    search_fields = ('name',)
+    ordering = ('name',)
+    actions = ['merge_positions']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(employees_count=Count('employees'))
+    
+    def employees_count(self, obj):
+        return obj.employees_count
+    employees_count.short_description = 'Сотрудников'
+    employees_count.admin_order_field = 'employees_count'
+    
+    # Название выводится в списках сотрудников: сдвигаем их updated_at,
+    # чтобы условные GET-запросы не отдали старое название
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            obj.employees.update(updated_at=timezone.now())
+    
+    # Опечатки дают лишние должности: выбранные сливаются в самую
+    # многочисленную, сотрудники переносятся одним UPDATE по целому ключу
+    def merge_positions(self, request, queryset):
+        positions = sorted(queryset, key=lambda position: (-position.employees_count, position.pk))
+        if len(positions) < 2:
+            self.message_user(request, "Выберите хотя бы две должности", level=messages.WARNING)
+            return
+        target, duplicates = positions[0], positions[1:]
+        with transaction.atomic():
+            moved = Product.objects.filter(position_ref__in=duplicates).update(
+                position_ref=target, updated_at=timezone.now(),
+            )
+            Position.objects.filter(pk__in=[position.pk for position in duplicates]).delete()
+        self.message_user(
+            request,
+            f"Должности объединены в «{target}»: перенесено сотрудников {moved}, удалено должностей {len(duplicates)}",
+        )
+    merge_positions.short_description = "Объединить выбранные должности"
+    merge_positions.allowed_permissions = ('change',)
 
 
 @admin.register(Purchase)
@@ -116,9 +275,12 @@ class PurchaseAdmin(admin.ModelAdmin):
     )
     
     list_filter = ('payment_type', 'date')
-    search_fields = ('product__name', 'address')
+    search_fields = ('product__name', 'address')  # Ищем через индекс, см. get_search_results
     date_hierarchy = 'date'
     list_per_page = 20
+    # Вместо <select> со всеми сотрудниками — постраничный поиск по индексу
+    autocomplete_fields = ('product',)
+    readonly_fields = ('base_salary', 'final_amount')
     
     # Группировка полей в форме
     fieldsets = (
@@ -127,8 +289,8 @@ class PurchaseAdmin(admin.ModelAdmin):
             'description': 'Выберите сотрудника и тип выплаты'
         }),
         ('Финансовая информация', {
-            'fields': ('person',),
-            'description': 'Сумма премии (если есть)'
+            'fields': ('person', 'deductions', 'base_salary', 'final_amount'),
+            'description': 'Сумма премии (если есть) и удержания; оклад фиксируется при создании выплаты'
         }),
         ('Дополнительно', {
             'fields': ('address',),
@@ -146,6 +308,9 @@ class PurchaseAdmin(admin.ModelAdmin):
         form.base_fields['payment_type'].help_text = 'Выберите тип выплаты'
         return form
     
+    def get_search_results(self, request, queryset, search_term):
+        return search_payments(queryset, search_term), False
+    
     # Методы отображения
     def employee_display(self, obj):
         return obj.product.name
@@ -166,12 +331,13 @@ class PurchaseAdmin(admin.ModelAdmin):
         else:
             return format_html('<span style="color: red;">{} руб.</span>', f"{bonus:.2f}")
     bonus_display.short_description = 'Премия'
+    bonus_display.admin_order_field = 'bonus_amount'
     
     def total_salary_display(self, obj):
         total = obj.final_salary
         return format_html('<b>{} руб.</b>', f"{total:.2f}")
     total_salary_display.short_description = 'Итого'
-    total_salary_display.admin_order_field = 'person'
+    total_salary_display.admin_order_field = 'final_amount'
     
     def date_display(self, obj):
         return obj.date.strftime('%d.%m.%Y %H:%M')
@@ -189,11 +355,14 @@ class PurchaseAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         # Предзагружаем связанные объекты для оптимизации
-        return qs.select_related('product')
+        return qs.select_related('product__position_ref')
     
     # Экспорт данных
     actions = ['export_as_csv']
     
+    def delete_queryset(self, request, queryset):
+        delete_in_batches(queryset.order_by('pk'))
+    
     def export_as_csv(self, request, queryset):
         import csv
         from django.http import HttpResponse
@@ -202,17 +371,109 @@ class PurchaseAdmin(admin.ModelAdmin):
         response['Content-Disposition'] = 'attachment; filename="payments.csv"'
         
         writer = csv.writer(response)
-        writer.writerow(['Сотрудник', 'Тип выплаты', 'Премия', 'Итого', 'Дата', 'Комментарий'])
+        writer.writerow(['Сотрудник', 'Тип выплаты', 'Оклад', 'Премия', 'Удержания', 'Итого', 'Дата', 'Комментарий'])
         
-        for payment in queryset:
+        # Суммы зафиксированы в выплате; из сотрудника нужно только имя
+        for payment in queryset.select_related(None).annotate(employee_name=F('product__name')):
             writer.writerow([
-                payment.product.name,
+                payment.employee_name,
                 payment.calculated_payment_type,
-                payment.bonus,
-                payment.final_salary,
+                payment.base_salary,
+                payment.bonus_amount,
+                payment.deductions,
+                payment.final_amount,
                 payment.date.strftime('%d.%m.%Y %H:%M'),
                 payment.address or ""
             ])
         
         return response
-    export_as_csv.short_description = "Экспортировать выбранные в CSV"
\ No newline at end of file
+    export_as_csv.short_description = "Экспортировать выбранные в CSV"
+
+
+# =========== АРХИВ ЗАКРЫТЫХ ПЕРИОДОВ ===========
+class ReadOnlyAdminMixin:
+    """Архив пополняется только командой archive_payments"""
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PurchaseArchive)
+class PurchaseArchiveAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'product', 'payment_type', 'bonus_amount', 'final_amount', 'date', 'address')
+    list_filter = ('payment_type',)
+    search_fields = ('product__name', 'address')
+    date_hierarchy = 'date'
+    list_per_page = 20
+    list_select_related = ('product__position_ref',)
+
+
+@admin.register(PaymentPeriod)
+class PaymentPeriodAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    list_display = ('month', 'payments_count', 'closed_at')
+
+
+@admin.register(SalaryAdjustment)
+class SalaryAdjustmentAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    """Журнал пишется действием "Изменить оклады" и командой adjust_salaries"""
+    list_display = ('created_at', 'percent', 'amount', 'round_to', 'employees_count',
+                    'fund_before', 'fund_after', 'fund_delta_display', 'source', 'created_by')
+    list_filter = ('source',)
+    list_select_related = ('created_by',)
+    date_hierarchy = 'created_at'
+    
+    def fund_delta_display(self, obj):
+        return f"{obj.fund_delta:+}"
+    fund_delta_display.short_description = 'Изменение фонда'
+
+
+# =========== ФОНОВЫЕ ОТЧЕТЫ ===========
+@admin.register(ReportJob)
+class ReportJobAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    """Отчеты заказываются на странице /reports/, здесь — обзор и удаление"""
+    list_display = ('id', 'kind', 'format', 'status', 'progress_display', 'created_by', 'created_at', 'download_link')
+    list_filter = ('status', 'kind', 'format')
+    list_select_related = ('created_by',)
+    date_hierarchy = 'created_at'
+    list_per_page = 20
+    
+    def progress_display(self, obj):
+        if obj.progress is None:
+            return '—'
+        return f"{obj.progress:.0%} ({obj.rows_done} из {obj.rows_total})"
+    progress_display.short_description = 'Прогресс'
+    
+    def download_link(self, obj):
+        if obj.status != ReportJob.DONE:
+            return ''
+        return format_html('<a href="{}">Скачать</a>', reverse('report_download', args=[obj.pk]))
+    download_link.short_description = 'Файл'
+    
+    # Вместе с заданием удаляется и его файл
+    def delete_model(self, request, obj):
+        delete_report_file(obj)
+        super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        for job in queryset:
+            delete_report_file(job)
+        super().delete_queryset(request, queryset)
+
+
+# =========== OUTBOX СОБЫТИЙ ===========
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    """События пишутся вместе с выплатами и окладами, доставляет outbox_dispatcher"""
+    list_display = ('id', 'topic', 'employee_id', 'created_at', 'delivered_at')
+    list_filter = ('topic',)
+    list_per_page = 50
+    # Без COUNT(*) по всей таблице: она растет до очистки
+    show_full_result_count = False
+
+
+@admin.register(OutboxOffset)
+class OutboxOffsetAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    list_display = ('sink', 'last_event_id', 'delivered_count', 'updated_at')
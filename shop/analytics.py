@@ -0,0 +1,436 @@
+"""Аналитика зарплат для страницы salary_analytics.
+
+Два бэкенда возвращают один и тот же словарь analytics:
+- 'sql' — группировки, STDDEV, PERCENTILE_CONT и CORR считает БД; для SQLite
+  медиана и корреляция считаются переносимыми запросами;
+- 'pandas' — исходный расчет через DataFrame (эталон для сверки);
+- 'snapshot' — тот же расчет по последнему снимку Parquet (shop.snapshot),
+  без обращения к БД;
+- 'streaming' — обход таблиц пачками со сливаемыми накопителями
+  (shop.streaming): память постоянна, медиана и квартили приближенные.
+Бэкенд выбирается настройкой SHOP_ANALYTICS_BACKEND.
+
+Разделы по выплатам можно ограничить периодом [start, end): диапазон дат
+уходит в каждый запрос выплат (индексы по date) и задевает только нужные
+таблицы архива, так что время растет с размером периода, а не истории.
+Статистика окладов — всегда по текущему штату. Разделы выплат закрытого
+периода в SQL берутся из кэша: архив закрытых месяцев не меняется.
+"""
+import calendar
+import logging
+import math
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Avg, Count, F, FloatField, Max, Min, StdDev, Sum, Window
+from django.db.models.functions import Cast, PercentRank, Rank, RowNumber
+from django.utils import timezone
+
+from .archive import archive_horizon, group_payments, payment_querysets, top_employees_by_bonus
+from .expressions import Corr, PercentileCont
+from .models import Product, Purchase
+from .streaming import salary_analytics_streaming
+
+logger = logging.getLogger(__name__)
+
+# Квартили оклада: доли распределения
+QUARTILES = {'q1': 0.25, 'q2': 0.5, 'q3': 0.75}
+# Сколько сотрудников в "Топ по бонусам"
+TOP_BONUS_EMPLOYEES = 10
+
+
+def compute_salary_analytics(backend=None, date_from=None, date_to=None, compare=None):
+    """Словарь analytics выбранным бэкендом; выплаты — за даты
+    date_from..date_to включительно (None — без границы). compare
+    ('previous' или 'year') добавляет сравнение с прошлым периодом"""
+    backend = backend or settings.SHOP_ANALYTICS_BACKEND
+    start, end = period_bounds(date_from, date_to)
+    if backend == 'sql':
+        analytics = salary_analytics_sql(start, end)
+    elif backend == 'pandas':
+        analytics = salary_analytics_pandas(start, end)
+    elif backend == 'snapshot':
+        analytics = salary_analytics_snapshot(start, end)
+    elif backend == 'streaming':
+        analytics = salary_analytics_streaming(start=start, end=end)
+    else:
+        raise ValueError(f"Неизвестный бэкенд аналитики: {backend}")
+
+    if analytics and (date_from or date_to):
+        analytics['period'] = {'from': date_from, 'to': date_to}
+    if analytics and compare:
+        previous_from, previous_to = previous_period(date_from, date_to, compare)
+        # Для сравнения нужны только разделы выплат — они же и кэшируются
+        previous = payment_sections(*period_bounds(previous_from, previous_to))
+        analytics['comparison'] = {
+            'from': previous_from,
+            'to': previous_to,
+            'metrics': compare_payments(analytics, previous),
+        }
+    return analytics
+
+
+def with_position_rank(employees):
+    """Место по окладу (1 — самый высокий) и перцентиль внутри должности
+    (доля коллег с меньшим окладом) — оконные функции"""
+    return employees.annotate(
+        position_rank=Window(Rank(), partition_by=[F('position_ref')], order_by=F('price').desc()),
+        position_percentile=Window(PercentRank(), partition_by=[F('position_ref')], order_by=F('price').asc()),
+    )
+
+
+# =========== ПЕРИОДЫ ===========
+# compare: предыдущий период той же длины или тот же период год назад
+PERIOD_COMPARISONS = ('previous', 'year')
+
+# Показатели сравнения: (название, функция разделов выплат)
+COMPARISON_METRICS = (
+    ("Количество выплат", lambda sections: sum(
+        group['count'] for group in sections.get('by_payment_type', {}).values()
+    )),
+    ("Сумма выплат", lambda sections: sum(
+        group['sum'] for group in sections.get('by_payment_type', {}).values()
+    )),
+    ("Сумма премий", lambda sections: sections.get('bonus_stats', {}).get('total_bonuses', 0.0)),
+    ("Средняя премия", lambda sections: sections.get('bonus_stats', {}).get('avg_bonus', 0.0)),
+)
+
+
+def analytics_period(params, today=None):
+    """(date_from, date_to, compare) из GET-параметров from, to (ГГГГ-ММ-ДД,
+    включительно) и compare. Неверные значения — ValueError"""
+    date_from = date.fromisoformat(params['from']) if params.get('from') else None
+    date_to = date.fromisoformat(params['to']) if params.get('to') else None
+    compare = params.get('compare') or None
+    if date_from and date_to and date_from > date_to:
+        raise ValueError("Начало периода позже конца")
+    if compare is not None:
+        if compare not in PERIOD_COMPARISONS:
+            raise ValueError(f"Неизвестное сравнение: {compare}")
+        if date_from is None:
+            raise ValueError("Для сравнения нужно начало периода")
+        # Открытый период сравнивается как период по сегодняшний день
+        date_to = date_to or today or timezone.localdate()
+    return date_from, date_to, compare
+
+
+def period_bounds(date_from=None, date_to=None):
+    """Даты включительно -> [start, end) в начале суток по местному времени"""
+    start = _day_start(date_from) if date_from else None
+    end = _day_start(date_to + timedelta(days=1)) if date_to else None
+    return start, end
+
+
+def previous_period(date_from, date_to, compare):
+    """Период сравнения: год назад или предыдущий той же длины — целые
+    месяцы сдвигаются на месяцы (квартал -> прошлый квартал)"""
+    if compare == 'year':
+        return _shift_months(date_from, -12), _shift_months(date_to, -12)
+    months = _whole_months(date_from, date_to)
+    if months:
+        return _shift_months(date_from, -months), date_from - timedelta(days=1)
+    length = date_to - date_from + timedelta(days=1)
+    return date_from - length, date_from - timedelta(days=1)
+
+
+def period_shortcuts(today=None):
+    """Готовые периоды для ссылок страницы: {название: (from, to)}"""
+    today = today or timezone.localdate()
+    month = today.replace(day=1)
+    quarter = month.replace(month=(month.month - 1) // 3 * 3 + 1)
+    previous_month = _shift_months(month, -1)
+    return {
+        "Этот месяц": (month, today),
+        "Прошлый месяц": (previous_month, month - timedelta(days=1)),
+        "Этот квартал": (quarter, today),
+        "Этот год": (month.replace(month=1), today),
+    }
+
+
+def compare_payments(current, previous):
+    """Строки сравнения: показатель, значения за оба периода, изменение в %"""
+    rows = []
+    for label, metric in COMPARISON_METRICS:
+        now, before = float(metric(current)), float(metric(previous))
+        rows.append({
+            'label': label,
+            'current': now,
+            'previous': before,
+            'change': (now - before) / before * 100 if before else None,
+        })
+    return rows
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime(day.year, day.month, day.day))
+
+
+def _shift_months(day, months):
+    """Та же дата months месяцев спустя; нет такого дня — последний день месяца"""
+    index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(index, 12)
+    month += 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _whole_months(date_from, date_to):
+    """Сколько целых месяцев в периоде, если он из них состоит, иначе 0"""
+    following = date_to + timedelta(days=1)
+    if date_from.day != 1 or following.day != 1:
+        return 0
+    return (following.year - date_from.year) * 12 + following.month - date_from.month
+
+
+# =========== SQL ===========
+def salary_analytics_sql(start=None, end=None):
+    employees = Product.objects.order_by()
+    salary = Cast('price', FloatField())
+    postgres = connections[employees.db].vendor == 'postgresql'
+
+    aggregates = {
+        'count': Count('id'),
+        'mean': Avg(salary),
+        'min': Min(salary),
+        'max': Max(salary),
+    }
+    if postgres:
+        aggregates['std'] = StdDev(salary, sample=True)
+        aggregates.update({name: PercentileCont(salary, q) for name, q in QUARTILES.items()})
+        aggregates['corr'] = Corr('quantity', 'price')
+    else:
+        # Отклонение и корреляция Пирсона из сумм — работает на любой СУБД
+        service = Cast('quantity', FloatField())
+        aggregates.update(
+            sum_x=Sum(service), sum_y=Sum(salary),
+            sum_xx=Sum(service * service), sum_yy=Sum(salary * salary),
+            sum_xy=Sum(service * salary),
+        )
+    totals = employees.aggregate(**aggregates)
+    if not totals['count']:
+        return {}
+
+    if not postgres:
+        totals.update(_quantiles_by_rank(employees, totals['count'], QUARTILES))
+        totals['std'] = _sample_std_from_sums(totals)
+        totals['corr'] = _pearson_from_sums(totals)
+
+    # Группировка по целому ключу должности; название — агрегат группы
+    by_position = employees.values('position_ref').annotate(
+        name=Min('position_ref__name'), count=Count('id'), mean=Avg(salary), sum=Sum(salary),
+    )
+    by_type = employees.values('level').annotate(mean=Avg(salary))
+
+    analytics = {
+        'total_employees': totals['count'],
+        'by_position': {
+            'count': {row['name']: row['count'] for row in by_position},
+            'mean': {row['name']: row['mean'] for row in by_position},
+            'sum': {row['name']: row['sum'] for row in by_position},
+        },
+        'by_type': {row['level']: row['mean'] for row in by_type},
+        'salary_stats': {
+            'mean': totals['mean'],
+            'median': totals['q2'],
+            'std': totals['std'],
+            'min': totals['min'],
+            'max': totals['max'],
+        },
+        'salary_quartiles': {name: totals[name] for name in QUARTILES},
+        'correlation_exp_salary': totals['corr'],
+    }
+
+    # Выплаты — за период (по умолчанию за всю историю): оперативная таблица
+    # и архив закрытых месяцев
+    analytics.update(payment_sections(start, end))
+    return analytics
+
+
+def payment_sections(start=None, end=None):
+    """Разделы analytics по выплатам за [start, end): bonus_stats,
+    by_payment_type и top_employees_by_bonus. Период, целиком лежащий в
+    архиве, закрыт — его разделы берутся из кэша"""
+    if end is None:
+        return _payment_sections_sql(payment_querysets(start, end))
+    horizon = archive_horizon()
+    sources = payment_querysets(start, end, horizon)
+    if horizon is None or end > horizon:
+        return _payment_sections_sql(sources)
+
+    # Архив меняют только удаления (срок хранения, увольнения): число выплат
+    # периода в ключе сбрасывает кэш после них. COUNT идет по индексу date.
+    # v2 — топ по премиям хранится списком пар
+    archived = sources[0].count()
+    key = f"shop:analytics:payments:v2:{start.isoformat() if start else ''}:{end.isoformat()}:{archived}"
+    sections = cache.get(key)
+    if sections is None:
+        sections = _payment_sections_sql(sources)
+        cache.set(key, sections, settings.SHOP_ANALYTICS_CACHE_SECONDS)
+    return sections
+
+
+def _payment_sections_sql(sources):
+    # Один GROUP BY по типу на таблицу дает и разбивку, и итоги по премиям
+    sections = {}
+    by_payment_type = group_payments(
+        'payment_type', sources, key=Purchase.payment_type_label,
+        count=Count('id'), amount=Sum('final_amount'),
+        bonus=Sum('bonus_amount'), max_bonus=Max('bonus_amount'), min_bonus=Min('bonus_amount'),
+    )
+    if by_payment_type:
+        groups = by_payment_type.values()
+        payments_count = sum(group['count'] for group in groups)
+        total_bonuses = float(sum(group['bonus'] for group in groups))
+        sections['bonus_stats'] = {
+            'total_bonuses': total_bonuses,
+            'avg_bonus': total_bonuses / payments_count,
+            'max_bonus': float(max(group['max_bonus'] for group in groups)),
+            'min_bonus': float(min(group['min_bonus'] for group in groups)),
+        }
+        sections['by_payment_type'] = {
+            label: {
+                'count': group['count'],
+                'sum': float(group['amount']),
+                'mean': float(group['amount']) / group['count'],
+            }
+            for label, group in sorted(by_payment_type.items(), key=lambda item: -item[1]['amount'])
+        }
+        # Список пар, а не словарь: у однофамильцев одинаковые ФИО
+        sections['top_employees_by_bonus'] = [
+            (name, float(total)) for name, total in top_employees_by_bonus(sources, TOP_BONUS_EMPLOYEES)
+        ]
+    return sections
+
+
+def _quantiles_by_rank(employees, count, quantiles):
+    """Квантили без PERCENTILE_CONT (линейная интерполяция, как в pandas):
+    один запрос, БД нумерует строки по окладу и отдает только соседние ранги"""
+    positions = {name: q * (count - 1) for name, q in quantiles.items()}
+    ranks = {rank for position in positions.values() for rank in (math.floor(position), math.ceil(position))}
+    salaries = dict(
+        employees.annotate(rank=Window(RowNumber(), order_by=[F('price').asc(), F('id').asc()]) - 1)
+        .filter(rank__in=ranks).values_list('rank', 'price')
+    )
+    result = {}
+    for name, position in positions.items():
+        low, high = float(salaries[math.floor(position)]), float(salaries[math.ceil(position)])
+        result[name] = low + (high - low) * (position - math.floor(position))
+    return result
+
+
+def _sample_std_from_sums(totals):
+    n = totals['count']
+    if n < 2:
+        return None
+    var_y = (totals['sum_yy'] - totals['sum_y'] ** 2 / n) / (n - 1)
+    return math.sqrt(max(var_y, 0.0))
+
+
+def _pearson_from_sums(totals):
+    n = totals['count']
+    cov = totals['sum_xy'] - totals['sum_x'] * totals['sum_y'] / n
+    var_x = totals['sum_xx'] - totals['sum_x'] ** 2 / n
+    var_y = totals['sum_yy'] - totals['sum_y'] ** 2 / n
+    if var_x <= 0 or var_y <= 0:
+        return None
+    return cov / math.sqrt(var_x * var_y)
+
+
+# =========== PANDAS ===========
+def salary_analytics_pandas(start=None, end=None):
+    employees = Product.objects.select_related('position_ref')
+    payment_sources = payment_querysets(start, end)
+
+    if not employees:
+        return {}
+
+    # Создаем DataFrame для анализа
+    data = []
+    for emp in employees:
+        data.append({
+            'name': emp.name,
+            'position': emp.position,
+            'base_salary': float(emp.base_salary),
+            'years_of_service': emp.years_of_service,
+            'employee_type': emp.level
+        })
+
+    # Анализ выплат
+    payment_data = []
+    for payments in payment_sources:
+        for p in payments.select_related('product'):
+            payment_data.append({
+                'employee_id': p.product_id,
+                'employee_name': p.product.name,
+                'payment_type': p.payment_type,
+                'bonus': p.get_bonus(),
+                'amount': p.calculate_final_salary(),
+                'date': p.date,
+                'description': p.address
+            })
+
+    return _analytics_from_frames(pd.DataFrame(data), pd.DataFrame(payment_data, columns=PAYMENT_FRAME_COLUMNS))
+
+
+def salary_analytics_snapshot(start=None, end=None):
+    """Расчет pandas по последнему снимку Parquet вместо ORM"""
+    from .snapshot import latest_snapshot, read_snapshot
+
+    path = latest_snapshot()
+    if path is None:
+        # Снимок еще не выгружен — лучше посчитать в БД, чем отдать пустую страницу
+        logger.warning("Снимков нет, аналитика считается в БД: выполните export_snapshot")
+        return salary_analytics_sql(start, end)
+    df, payments = read_snapshot(str(path), start, end)
+    if df.empty:
+        return {}
+    return _analytics_from_frames(df, payments)
+
+
+# Колонки таблицы выплат, которую ожидает _analytics_from_frames
+PAYMENT_FRAME_COLUMNS = ['employee_id', 'employee_name', 'payment_type', 'bonus', 'amount']
+
+
+def _analytics_from_frames(df, payments):
+    """Словарь analytics по таблицам сотрудников и выплат"""
+    analytics = {
+        'total_employees': len(df),
+        'by_position': df.groupby('position')['base_salary'].agg(['count', 'mean', 'sum']).to_dict(),
+        'by_type': df.groupby('employee_type')['base_salary'].mean().to_dict(),
+        'salary_stats': {
+            'mean': df['base_salary'].mean(),
+            'median': df['base_salary'].median(),
+            'std': df['base_salary'].std(),
+            'min': df['base_salary'].min(),
+            'max': df['base_salary'].max(),
+        },
+        'salary_quartiles': {
+            name: df['base_salary'].quantile(q) for name, q in QUARTILES.items()
+        },
+        'correlation_exp_salary': df['years_of_service'].corr(df['base_salary']),
+    }
+
+    if not payments.empty:
+        bonuses = payments['bonus']
+        analytics['bonus_stats'] = {
+            'total_bonuses': bonuses.sum(),
+            'avg_bonus': bonuses.mean(),
+            'max_bonus': bonuses.max(),
+            'min_bonus': bonuses.min(),
+        }
+
+        by_payment_type = payments.groupby(payments['payment_type'].map(Purchase.payment_type_label))['amount']
+        analytics['by_payment_type'] = {
+            label: {'count': int(row['count']), 'sum': row['sum'], 'mean': row['mean']}
+            for label, row in by_payment_type.agg(['count', 'sum', 'mean']).sort_values('sum', ascending=False).iterrows()
+        }
+
+        totals = payments.groupby('employee_id').agg(name=('employee_name', 'first'), total=('bonus', 'sum'))
+        top = totals[totals['total'] > 0].reset_index().sort_values(
+            ['total', 'employee_id'], ascending=[False, True],
+        ).head(TOP_BONUS_EMPLOYEES)
+        analytics['top_employees_by_bonus'] = list(zip(top['name'], top['total']))
+
+    return analytics
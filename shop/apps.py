@@ -1,6 +1,32 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+def restore_search_indexes(sender, using, **kwargs):
+    """SQLite теряет триггеры FTS при пересоздании таблиц — восстанавливаем"""
+    from django.db import connections
+    from .search import install_search_indexes
+    connection = connections[using]
+    if 'shop_product' in connection.introspection.table_names():
+        install_search_indexes(connection)
 
 
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        from .live import employees_changed, payment_saved
+        from .outbox import payment_created, salary_saved
+        from .models import Product, Purchase
+        from .slowlog import install_slow_query_wrapper
+        post_migrate.connect(restore_search_indexes, sender=self)
+        connection_created.connect(install_slow_query_wrapper)
+        # Живые обновления (SSE): события уходят после коммита
+        post_save.connect(payment_saved, sender=Purchase)
+        post_save.connect(employees_changed, sender=Product)
+        post_delete.connect(employees_changed, sender=Product)
+        # Outbox для внешних систем: в транзакции изменения (см. shop.outbox)
+        post_save.connect(payment_created, sender=Purchase)
+        post_save.connect(salary_saved, sender=Product)
@@ -0,0 +1,177 @@
+"""Архивирование закрытых месяцев выплат и выборки "за всю историю".
+
+Оперативная таблица Purchase хранит только незакрытые месяцы, закрытые
+переносятся в PurchaseArchive с теми же колонками и id. Граница между ними
+("горизонт") — начало месяца, следующего за последним закрытым периодом.
+Запрос с диапазоном дат обращается только к тем таблицам, которые этот
+диапазон задевает; отчеты "за всё время" объединяют обе.
+
+Схема одна для всех СУБД: декларативное секционирование PostgreSQL требует
+первичного ключа, включающего колонку секционирования, а Purchase в Django
+адресуется одноколоночным id.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import PaymentPeriod, Product, Purchase, PurchaseArchive
+
+ARCHIVE_BATCH_SIZE = 5000
+
+
+def month_start(value):
+    """Начало месяца (локальное время) для даты или datetime"""
+    if isinstance(value, datetime):
+        value = timezone.localtime(value) if timezone.is_aware(value) else value
+    return timezone.make_aware(datetime(value.year, value.month, 1))
+
+
+def next_month(value):
+    return month_start(month_start(value).replace(day=28) + timedelta(days=4))
+
+
+def archive_horizon():
+    """Начало первого незакрытого месяца или None, если архив пуст"""
+    last_closed = PaymentPeriod.objects.aggregate(month=Max('month'))['month']
+    return next_month(last_closed) if last_closed else None
+
+
+# =========== ВЫБОРКИ ===========
+def payment_querysets(start=None, end=None, horizon=None):
+    """Querysets выплат в диапазоне [start, end) — только задетые таблицы"""
+    if horizon is None:
+        horizon = archive_horizon()
+
+    querysets = []
+    if horizon is None or end is None or end > horizon:
+        querysets.append(Purchase.objects.all())
+    if horizon is not None and (start is None or start < horizon):
+        querysets.append(PurchaseArchive.objects.all())
+
+    if start is not None:
+        querysets = [qs.filter(date__gte=start) for qs in querysets]
+    if end is not None:
+        querysets = [qs.filter(date__lt=end) for qs in querysets]
+    return querysets
+
+
+def aggregate_payments(start=None, end=None, **aggregates):
+    """Агрегаты по выплатам всех задетых таблиц.
+
+    Поддерживаются только слияемые Count, Sum, Max и Min; среднее считается
+    вызывающим кодом как сумма / количество.
+    """
+    parts = [qs.aggregate(**aggregates) for qs in payment_querysets(start, end)]
+    return _merge_aggregates(aggregates, parts)
+
+
+def group_payments(field, querysets, key=None, **aggregates):
+    """Агрегаты выплат querysets по группам field — один GROUP BY на таблицу.
+    key(значение field) объединяет группы (например, коды в названия)"""
+    parts = {}
+    for queryset in querysets:
+        for row in queryset.order_by().values(field).annotate(**aggregates):
+            group = key(row[field]) if key else row[field]
+            parts.setdefault(group, []).append(row)
+    return {group: _merge_aggregates(aggregates, rows) for group, rows in parts.items()}
+
+
+def top_employees_by_bonus(querysets, limit):
+    """[(ФИО, сумма премий)] limit сотрудников с наибольшей суммой премий
+    по выплатам querysets. Один запрос, сортировка и LIMIT — в БД.
+
+    Одна таблица (период не задевает архив) — GROUP BY по ее выплатам:
+    работа растет с размером периода. Обе таблицы — сумма по каждой
+    коррелированным подзапросом по индексам (product, bonus_amount) и
+    (product, date)."""
+    if len(querysets) == 1:
+        rows = (
+            querysets[0].order_by().values('product')
+            .annotate(name=Min('product__name'), total_bonus=Sum('bonus_amount'))
+            .filter(total_bonus__gt=0).order_by('-total_bonus', 'product')
+        )
+        return [(row['name'], row['total_bonus']) for row in rows[:limit]]
+
+    money = DecimalField(max_digits=16, decimal_places=2)
+    total = None
+    for queryset in querysets:
+        bonuses = Subquery(
+            queryset.filter(product=OuterRef('pk')).order_by().values('product')
+            .annotate(total=Sum('bonus_amount')).values('total'),
+            output_field=money,
+        )
+        part = Coalesce(bonuses, Value(Decimal('0')), output_field=money)
+        total = part if total is None else ExpressionWrapper(total + part, output_field=money)
+    if total is None:
+        return []
+    # Без премий сотрудники в конце списка: отсекаем их после LIMIT, чтобы
+    # подзапросы не повторялись в WHERE
+    rows = Product.objects.annotate(total_bonus=total).order_by('-total_bonus', 'id')
+    return [(name, bonus) for name, bonus in rows.values_list('name', 'total_bonus')[:limit] if bonus > 0]
+
+
+def _merge_aggregates(aggregates, parts):
+    """Слить результаты одних и тех же агрегатов по разным таблицам"""
+    result = {}
+    for name, aggregate in aggregates.items():
+        values = [part[name] for part in parts if part[name] is not None]
+        if isinstance(aggregate, (Count, Sum)):
+            result[name] = sum(values) if values else (0 if isinstance(aggregate, Count) else None)
+        elif isinstance(aggregate, Max):
+            result[name] = max(values) if values else None
+        elif isinstance(aggregate, Min):
+            result[name] = min(values) if values else None
+        else:
+            raise TypeError(f"Агрегат {aggregate!r} нельзя слить между таблицами")
+    return result
+
+
+# =========== ЗАКРЫТИЕ ПЕРИОДОВ ===========
+def close_periods(before, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """Переносит в архив все выплаты раньше начала месяца before.
+
+    Возвращает {месяц: перенесено строк}. Текущий месяц закрыть нельзя:
+    новые выплаты всегда датируются "сейчас" и должны попадать за горизонт.
+    """
+    before = month_start(before)
+    if before > month_start(timezone.now()):
+        raise ValueError("Нельзя закрыть текущий или будущий месяц")
+
+    moved = {}
+    oldest = Purchase.objects.filter(date__lt=before).aggregate(date=Min('date'))['date']
+    month = month_start(oldest) if oldest else before
+    while month < before:
+        moved[month.date()] = archive_month(month, batch_size, progress)
+        month = next_month(month)
+    return moved
+
+
+def archive_month(month, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """Переносит выплаты месяца в архив пачками по batch_size в коротких транзакциях"""
+    start, end = month_start(month), next_month(month)
+    fields = [field.attname for field in Purchase._meta.concrete_fields]
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Purchase.objects.filter(date__gte=start, date__lt=end)
+                .order_by('id').values(*fields)[:batch_size]
+            )
+            if not rows:
+                break
+            PurchaseArchive.objects.bulk_create(
+                [PurchaseArchive(**row) for row in rows], ignore_conflicts=True,
+            )
+            Purchase.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+        if progress:
+            progress(f"{start:%m.%Y}: перенесено {moved}")
+
+    period, _ = PaymentPeriod.objects.get_or_create(month=start.date())
+    period.payments_count = PurchaseArchive.objects.filter(date__gte=start, date__lt=end).count()
+    period.save()
+    return moved
@@ -0,0 +1,118 @@
+"""Условные GET-запросы (ETag / Last-Modified) для страниц и JSON-эндпоинтов.
+
+Валидатор строится из дешевой "версии данных": число строк, максимальный id
+и время последнего изменения (updated_at) сотрудников, выплат и архива выплат.
+Правка строки сдвигает updated_at, удаление — число строк. Это три агрегатных
+запроса по индексированным полям, поэтому ответ 304 отдается до тяжелых
+вычислений. Страницы, зависящие от текущей даты, добавляют ее в валидатор.
+
+Поздно зафиксированная правка с updated_at меньше известного максимума
+версию не меняет, поэтому валидатор действует не дольше интервала
+SHOP_HTTP_VALIDATOR_SECONDS: номер интервала входит в ETag, а
+Last-Modified не раньше его начала.
+"""
+import hashlib
+from datetime import datetime, time, timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import Product, Purchase, PurchaseArchive
+
+
+def data_version(request):
+    """Версия данных, кешируется на объекте запроса (ETag и Last-Modified считают её один раз)"""
+    version = getattr(request, '_shop_data_version', None)
+    if version is None:
+        version = {
+            'employees': Product.objects.aggregate(
+                count=Count('id'), max_id=Max('id'), changed=Max('updated_at'),
+            ),
+            'payments': Purchase.objects.aggregate(
+                count=Count('id'), max_id=Max('id'), changed=Max('updated_at'),
+            ),
+            'archive': PurchaseArchive.objects.aggregate(
+                count=Count('id'), max_id=Max('id'), changed=Max('updated_at'),
+            ),
+        }
+        request._shop_data_version = version
+    return version
+
+
+def data_etag(request, *args, **kwargs):
+    """ETag: хэш версии данных"""
+    return _etag(request)
+
+
+def daily_etag(request, *args, **kwargs):
+    """ETag страницы, которая меняется и с датой (периоды "по сегодня")"""
+    return _etag(request, timezone.localdate().isoformat())
+
+
+def _validator_period():
+    """Начало текущего интервала действия валидаторов"""
+    seconds = settings.SHOP_HTTP_VALIDATOR_SECONDS
+    now = timezone.now().timestamp()
+    return datetime.fromtimestamp(now - now % seconds, tz=dt_timezone.utc)
+
+
+def _etag(request, *extra):
+    version = data_version(request)
+    raw = '|'.join([
+        *(
+            f"{table}:{stats['count']}:{stats['max_id']}:{stats['changed'].isoformat() if stats['changed'] else ''}"
+            for table, stats in sorted(version.items())
+        ),
+        _validator_period().isoformat(),
+        *extra,
+    ])
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def data_last_modified(request, *args, **kwargs):
+    """Last-Modified: самое позднее изменение сотрудников или выплат,
+    но не раньше начала интервала действия валидаторов.
+
+    Удаление строк это время не сдвигает, поэтому главным валидатором
+    остается ETag (при наличии If-None-Match заголовок If-Modified-Since
+    игнорируется).
+    """
+    changes = [stats['changed'] for stats in data_version(request).values() if stats['changed']]
+    return max([*changes, _validator_period()])
+
+
+def daily_last_modified(request, *args, **kwargs):
+    """Last-Modified не раньше начала текущих суток"""
+    today = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    return max(data_last_modified(request), today)
+
+
+def conditional_page(view=None, *, daily=False):
+    """Декоратор представления: 304 по ETag/Last-Modified и заголовок Cache-Control.
+
+    daily=True — страница зависит от текущей даты: @conditional_page(daily=True)
+    """
+    if view is None:
+        return lambda view: conditional_page(view, daily=daily)
+    conditional_view = condition(
+        etag_func=daily_etag if daily else data_etag,
+        last_modified_func=daily_last_modified if daily else data_last_modified,
+    )(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = conditional_view(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=settings.SHOP_HTTP_CACHE_MAX_AGE,
+                must_revalidate=True,
+            )
+        return response
+
+    return wrapper
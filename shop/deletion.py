@@ -0,0 +1,101 @@
+"""Удаление сотрудников и выплат пачками.
+
+Product.delete() и массовое удаление в админке отдают каскад по
+Purchase.product сборщику Django: он удаляет все выплаты сотрудника одним
+DELETE ... WHERE product_id IN (...) в той же транзакции, что и сотрудника,
+а страница подтверждения в админке еще и загружает каждую выплату, чтобы
+показать ее в списке. Для сотрудника с многолетней историей это минуты
+блокировок.
+
+Здесь выплаты удаляются заранее пачками по DELETE_BATCH_SIZE: id пачки
+выбираются по индексу (product, date) или (date), каждая пачка —
+SELECT id ... LIMIT и DELETE ... WHERE id IN в своей короткой транзакции.
+Когда у сотрудников выплат не осталось, сами они удаляются обычным
+delete(), и каскаду удалять уже нечего.
+"""
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .archive import month_start, next_month, payment_querysets
+from .models import PaymentPeriod, Product, Purchase, PurchaseArchive
+
+DELETE_BATCH_SIZE = 5000
+# Сотрудников за один проход: их выплаты удаляются вместе
+EMPLOYEE_BATCH_SIZE = 100
+
+
+def delete_in_batches(queryset, batch_size=DELETE_BATCH_SIZE, progress=None, label=None):
+    """Удалить строки queryset пачками; порядок queryset задает индекс,
+    по которому выбираются id. Возвращает число удаленных строк"""
+    model = queryset.model
+    label = label or model._meta.verbose_name_plural
+    deleted = 0
+    while True:
+        with transaction.atomic(using=queryset.db):
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            count, _ = model._base_manager.using(queryset.db).filter(pk__in=ids).delete()
+        deleted += count
+        if progress:
+            progress(f"{label}: удалено {deleted}")
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+def delete_employee_payments(employee_ids, batch_size=DELETE_BATCH_SIZE, progress=None):
+    """Удалить выплаты сотрудников из оперативной таблицы и архива"""
+    deleted = 0
+    for model in (Purchase, PurchaseArchive):
+        payments = model.objects.filter(product_id__in=employee_ids).order_by('product', 'date')
+        deleted += delete_in_batches(payments, batch_size, progress)
+    return deleted
+
+
+def delete_employees(employees, batch_size=DELETE_BATCH_SIZE, progress=None):
+    """Удалить сотрудников queryset вместе с выплатами, не загружая выплаты
+    в память. Возвращает (сотрудников, выплат)"""
+    employee_ids = list(employees.order_by('id').values_list('id', flat=True))
+    employees_deleted = payments_deleted = 0
+    for start in range(0, len(employee_ids), EMPLOYEE_BATCH_SIZE):
+        chunk = employee_ids[start:start + EMPLOYEE_BATCH_SIZE]
+        payments_deleted += delete_employee_payments(chunk, batch_size, progress)
+        # Выплаты, добавленные за это время, удалит обычный каскад
+        _, counts = Product.objects.filter(id__in=chunk).delete()
+        employees_deleted += counts.get(Product._meta.label, 0)
+        payments_deleted += counts.get(Purchase._meta.label, 0) + counts.get(PurchaseArchive._meta.label, 0)
+        if progress:
+            progress(f"Сотрудники: удалено {employees_deleted} из {len(employee_ids)}")
+    return employees_deleted, payments_deleted
+
+
+# =========== СРОК ХРАНЕНИЯ ===========
+def years_ago(years, now=None):
+    """Начало дня, отстоящего на years лет назад (29 февраля -> 28-е)"""
+    now = timezone.localtime(now or timezone.now())
+    day = now.date()
+    try:
+        day = day.replace(year=day.year - years)
+    except ValueError:
+        day = day.replace(year=day.year - years, day=28)
+    return timezone.make_aware(datetime(day.year, day.month, day.day))
+
+
+def purge_payments(before, batch_size=DELETE_BATCH_SIZE, progress=None):
+    """Удалить выплаты раньше before из оперативной таблицы и архива.
+
+    Закрытые периоды остаются закрытыми (горизонт архива не сдвигается),
+    у затронутых пересчитывается число выплат. Возвращает число удаленных.
+    """
+    deleted = 0
+    for payments in payment_querysets(end=before):
+        deleted += delete_in_batches(payments.order_by('date'), batch_size, progress)
+
+    for period in PaymentPeriod.objects.filter(month__lt=before.date()):
+        start = month_start(period.month)
+        period.payments_count = PurchaseArchive.objects.filter(date__gte=start, date__lt=next_month(start)).count()
+        period.save(update_fields=['payments_count'])
+    return deleted
@@ -0,0 +1,26 @@
+"""Выражения и агрегаты БД, общие для ведомости и аналитики"""
+from django.db.models import Aggregate, FloatField
+from django.db.models.functions import Cast
+
+# Премия вводится строкой (Purchase.person): нечисловые значения считаем нулем
+# (models.parse_bonus; миграция 0008 — тем же правилом в SQL)
+BONUS_PATTERN = r'^-?[0-9]+(\.[0-9]+)?$'
+
+
+class PercentileCont(Aggregate):
+    """Упорядоченный агрегат PERCENTILE_CONT (PostgreSQL)"""
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile, **extra):
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+class Corr(Aggregate):
+    """Коэффициент корреляции Пирсона CORR(y, x) (PostgreSQL)"""
+    function = 'CORR'
+    output_field = FloatField()
+
+    def __init__(self, y, x, **extra):
+        super().__init__(Cast(y, FloatField()), Cast(x, FloatField()), **extra)
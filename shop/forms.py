@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+from django import forms
+from django.core.exceptions import ValidationError
+
+from .models import Position, Product, Purchase, ReportJob
+from .reports import xlsx_available
+
+
+class ReportJobForm(forms.Form):
+    """Заказ фонового отчета; пустые фильтры не применяются"""
+    kind = forms.ChoiceField(label="Данные", choices=ReportJob.KINDS)
+    format = forms.ChoiceField(label="Формат", choices=ReportJob.FORMATS, initial='csv')
+    # Выплаты
+    date_from = forms.DateField(label="Выплаты с", required=False)
+    date_to = forms.DateField(label="по", required=False)
+    employee = forms.IntegerField(label="ID сотрудника", required=False, min_value=1)
+    payment_type = forms.ChoiceField(
+        label="Тип выплаты", choices=[('', 'Все')] + Purchase.PAYMENT_TYPES, required=False,
+    )
+    # Сотрудники
+    level = forms.ChoiceField(label="Уровень", choices=[('', 'Все')] + Product.EMPLOYEE_TYPES, required=False)
+    position = forms.ModelChoiceField(
+        label="Должность", queryset=Position.objects.all(), required=False, empty_label="Все",
+    )
+    min_salary = forms.DecimalField(label="Оклад от", required=False, max_digits=12, decimal_places=2)
+    max_salary = forms.DecimalField(label="до", required=False, max_digits=12, decimal_places=2)
+
+    FILTERS = {
+        'payments': ('date_from', 'date_to', 'employee', 'payment_type'),
+        'employees': ('level', 'position', 'min_salary', 'max_salary'),
+    }
+
+    def clean_format(self):
+        value = self.cleaned_data['format']
+        if value == 'xlsx' and not xlsx_available():
+            raise ValidationError("XLSX недоступен: на сервере не установлен openpyxl")
+        return value
+
+    def clean(self):
+        cleaned = super().clean()
+        date_from, date_to = cleaned.get('date_from'), cleaned.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise ValidationError("Начало периода позже конца")
+        return cleaned
+
+    def job_filters(self):
+        """Фильтры выбранного вида отчета в виде, пригодном для JSONField"""
+        filters = {}
+        for name in self.FILTERS[self.cleaned_data['kind']]:
+            value = self.cleaned_data.get(name)
+            if value in (None, ''):
+                continue
+            if isinstance(value, Position):
+                value = value.pk
+            filters[name] = value if isinstance(value, (int, str)) else str(value)
+        return filters
+
+
+class PaymentForm(forms.Form):
+    """Премия и удержания выплаты: в пределах колонок numeric(12,2)"""
+    bonus = forms.DecimalField(max_digits=12, decimal_places=2)
+    deductions = forms.DecimalField(max_digits=12, decimal_places=2)
+
+
+class SalaryAdjustmentForm(forms.Form):
+    """Правило массового изменения окладов"""
+    percent = forms.DecimalField(
+        label="Изменение, %", initial=Decimal('0'), max_digits=7, decimal_places=3, min_value=Decimal('-99.999'),
+    )
+    amount = forms.DecimalField(label="Надбавка, руб.", initial=Decimal('0'), max_digits=12, decimal_places=2)
+    round_to = forms.DecimalField(
+        label="Округлить до", initial=Decimal('100'), max_digits=12, decimal_places=2, min_value=Decimal('0.01'),
+        help_text="Новый оклад будет кратен этому числу",
+    )
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get('percent') == 0 and cleaned.get('amount') == 0:
+            raise ValidationError("Задайте изменение в процентах и/или надбавку")
+        return cleaned
@@ -0,0 +1,134 @@
+"""Ведомость выплат сотрудника: нарастающий итог, сумма с начала года и
+изменение к прошлому месяцу считаются оконными функциями SQL.
+
+Все запросы ограничены одним сотрудником и идут по индексу (product, date).
+Постраничность — по ключу (date, id): нарастающий итог строки зависит только
+от более ранних выплат, а они всегда попадают под условие "раньше курсора",
+поэтому окна на каждой странице считаются верно без OFFSET.
+
+Выплаты закрытых месяцев лежат в архиве: страница продолжается в нем, а для
+оперативных строк к окнам добавляются архивные суммы (одна группировка).
+"""
+from datetime import datetime, timedelta
+
+from django.db.models import F, Q, RowRange, Sum, Window
+from django.db.models.functions import ExtractYear, Lag, TruncMonth
+from django.utils import timezone
+
+from .archive import archive_horizon
+from .models import Purchase, PurchaseArchive
+
+LEDGER_PAGE_SIZE = 50
+
+
+def encode_cursor(payment):
+    return f"{payment['date'].isoformat()}_{payment['id']}"
+
+
+def decode_cursor(cursor):
+    """Курсор "<дата ISO>_<id>"; ValueError при неверном формате"""
+    date_str, id_str = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(date_str), int(id_str)
+
+
+def employee_ledger(employee, before=None, limit=LEDGER_PAGE_SIZE):
+    """Страница выплат сотрудника (новые сверху) и помесячные итоги для неё"""
+    cursor = decode_cursor(before) if before else None
+    horizon = archive_horizon()
+
+    # Сначала оперативная таблица, затем архив: архивные выплаты всегда старше
+    rows = _ledger_rows(Purchase, employee, cursor, limit + 1)
+    if horizon is not None:
+        _add_archived_totals(employee, rows)
+        if len(rows) <= limit:
+            rows += _ledger_rows(PurchaseArchive, employee, cursor, limit + 1 - len(rows))
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    monthly = _monthly_totals(employee, rows, horizon)
+    payment_types = dict(Purchase.PAYMENT_TYPES)
+    for row in rows:
+        row['payment_type_display'] = payment_types.get(row['payment_type'], "Зарплата")
+        row.update(monthly.get(row['month'], {}))
+
+    return {
+        'payments': rows,
+        'months': sorted(monthly.values(), key=lambda m: m['month'], reverse=True),
+        'next_cursor': encode_cursor(rows[-1]) if has_more else None,
+    }
+
+
+def _ledger_rows(model, employee, cursor, limit):
+    payments = model.objects.filter(product=employee)
+    if cursor:
+        before_date, before_id = cursor
+        payments = payments.filter(Q(date__lt=before_date) | Q(date=before_date, id__lt=before_id))
+
+    chronological = [F('date').asc(), F('id').asc()]
+    up_to_current_row = RowRange(start=None, end=0)
+    return list(
+        payments
+        .annotate(
+            amount=F('final_amount'),
+            running_total=Window(Sum('final_amount'), order_by=chronological, frame=up_to_current_row),
+            year_to_date=Window(
+                Sum('final_amount'), partition_by=[ExtractYear('date')],
+                order_by=chronological, frame=up_to_current_row,
+            ),
+            month=TruncMonth('date'),
+        )
+        .values('id', 'date', 'month', 'payment_type', 'address',
+                'bonus_amount', 'amount', 'running_total', 'year_to_date')
+        .order_by('-date', '-id')[:limit]
+    )
+
+
+def _add_archived_totals(employee, rows):
+    """Окна оперативной таблицы не видят архив — добавляем его суммы по годам"""
+    if not rows:
+        return
+    archived = dict(
+        PurchaseArchive.objects.filter(product=employee)
+        .annotate(year=ExtractYear('date')).values_list('year')
+        .annotate(total=Sum('final_amount')).order_by()
+    )
+    archived_total = sum(archived.values())
+    for row in rows:
+        row['running_total'] += archived_total
+        row['year_to_date'] += archived.get(timezone.localtime(row['date']).year, 0)
+
+
+def _monthly_totals(employee, rows, horizon):
+    """Итоги месяцев, попавших на страницу, и изменение к предыдущему месяцу
+    с выплатами (LAG по сгруппированным итогам)"""
+    if not rows:
+        return {}
+    newest_month, oldest_month = rows[0]['month'], rows[-1]['month']
+    # Берем и месяц до самого старого на странице, чтобы LAG было с чем сравнить
+    previous_month = (oldest_month - timedelta(days=1)).replace(day=1)
+    next_month = (newest_month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    # Месяц целиком лежит в одной таблице, поэтому итоги просто объединяются
+    months = []
+    for model in (PurchaseArchive, Purchase) if horizon is not None else (Purchase,):
+        months += list(
+            model.objects
+            .filter(product=employee, date__gte=previous_month, date__lt=next_month)
+            .annotate(month=TruncMonth('date'))
+            .values('month')
+            .annotate(month_total=Sum('final_amount'))
+            .annotate(previous_total=Window(Lag('month_total'), order_by=F('month').asc()))
+            .order_by('month')
+        )
+
+    result = {}
+    for i, month in enumerate(months):
+        # Первый месяц оперативной таблицы сравниваем с последним архивным
+        if month['previous_total'] is None and i > 0:
+            month['previous_total'] = months[i - 1]['month_total']
+        if month['month'] < oldest_month:
+            continue
+        previous = month['previous_total']
+        month['month_delta'] = month['month_total'] - previous if previous is not None else None
+        result[month['month']] = month
+    return result
@@ -0,0 +1,277 @@
+"""Живые обновления аналитики по Server-Sent Events.
+
+Изменения сотрудников и выплат (сигналы моделей, массовые операции через
+notify_payroll_changed) после коммита превращаются в небольшие события:
+    payment — новая выплата (из сохраненного объекта, без запросов);
+    payroll — фонд, средний/медианный оклад и численность по уровням
+              с разницей к предыдущему снимку.
+Снимок payroll считает один фоновый поток процесса: всплеск изменений
+сливается в один расчет, а готовое событие одной строкой рассылается всем
+подписчикам. Новый подписчик сразу получает последний снимок без расчета,
+поэтому N зрителей стоят один расчет на изменение, а не N перезагрузок.
+
+Рассылка — через брокер в памяти процесса (SHOP_LIVE_BACKEND = 'local').
+Если воркеров несколько, 'postgres' передает события через
+NOTIFY/LISTEN: изменивший данные процесс считает событие и делает
+pg_notify, а каждый процесс с подписчиками слушает канал в своем потоке.
+
+Эндпоинт live_events асинхронный и держит соединение открытым, поэтому
+работает только под ASGI (tplab2.asgi).
+"""
+import asyncio
+import itertools
+import json
+import logging
+import select
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .roster import get_roster
+
+logger = logging.getLogger(__name__)
+
+LIVE_CHANNEL = 'shop_live'
+LIVE_HISTORY_SIZE = 100
+LIVE_QUEUE_SIZE = 100
+LIVE_HEARTBEAT_SECONDS = 15
+# Окно слияния: изменения в пределах окна дают один снимок payroll
+LIVE_COALESCE_SECONDS = 0.5
+
+
+# =========== БРОКЕР ===========
+def _offer(queue, event):
+    """Положить событие в очередь подписчика; медленный клиент теряет старые"""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class Subscription:
+    def __init__(self, loop, backlog):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.backlog = backlog
+
+
+class LiveBroker:
+    """Рассылка событий подписчикам из любых потоков; подписчики — корутины
+    ASGI, каждая со своей очередью в своем цикле событий"""
+
+    def __init__(self, history_size=LIVE_HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self.latest = {}
+
+    def publish(self, event_type, data):
+        with self._lock:
+            event = {
+                'id': next(self._ids),
+                'event': event_type,
+                'data': json.dumps(data, ensure_ascii=False, default=str),
+            }
+            self._history.append(event)
+            self.latest[event_type] = event
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(_offer, subscription.queue, event)
+            except RuntimeError:
+                # Цикл событий уже закрыт — подписчик отключился
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribe(self, last_event_id=None):
+        """Подписка из корутины. С last_event_id (переподключение) в backlog —
+        пропущенные события из истории, иначе — последние снимки"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if last_event_id is not None:
+                backlog = [event for event in self._history if event['id'] > last_event_id]
+            else:
+                backlog = sorted(self.latest.values(), key=lambda event: event['id'])
+            subscription = Subscription(loop, backlog)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+broker = LiveBroker()
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {event['data']}\n\n"
+
+
+# =========== ДОСТАВКА МЕЖДУ ПРОЦЕССАМИ ===========
+class LocalBackend:
+    """Только подписчики этого процесса"""
+
+    def send(self, event_type, data):
+        broker.publish(event_type, data)
+
+    def start_listening(self):
+        pass
+
+
+class PostgresBackend:
+    """NOTIFY/LISTEN: события доходят до подписчиков всех процессов"""
+
+    def __init__(self):
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def send(self, event_type, data):
+        payload = json.dumps({'event': event_type, 'data': data}, ensure_ascii=False, default=str)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [LIVE_CHANNEL, payload])
+
+    def start_listening(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='live-listen', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        from django.db import connections
+        while True:
+            # Отдельное соединение вне пула Django: оно все время ждет уведомлений
+            db = connections.create_connection('default')
+            try:
+                db.connect()
+                db.connection.autocommit = True
+                with db.connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {LIVE_CHANNEL}')
+                raw = db.connection
+                while True:
+                    if select.select([raw], [], [], LIVE_HEARTBEAT_SECONDS) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        message = json.loads(raw.notifies.pop(0).payload)
+                        broker.publish(message['event'], message['data'])
+            except Exception:
+                logger.exception("Канал живых обновлений прерван, переподключение")
+                time.sleep(LIVE_HEARTBEAT_SECONDS)
+            finally:
+                db.close()
+
+
+LIVE_BACKENDS = {'local': LocalBackend, 'postgres': PostgresBackend}
+_backends = {}
+
+
+def live_backend():
+    name = settings.SHOP_LIVE_BACKEND
+    if name not in _backends:
+        _backends[name] = LIVE_BACKENDS[name]()
+    return _backends[name]
+
+
+# =========== СНИМОК ФОНДА ===========
+def payroll_snapshot():
+    """Сводка по штату из массивов в памяти (см. shop.roster)"""
+    roster = get_roster()
+    snapshot = roster.salary_summary() or {
+        'total_salary_fund': 0, 'average_salary': None, 'median_salary': None,
+        'max_salary': None, 'min_salary': None,
+    }
+    snapshot['employee_count'] = len(roster)
+    snapshot['levels'] = roster.level_counts()
+    return snapshot
+
+
+class PayrollPublisher:
+    """Фоновый поток: пересчитывает снимок, когда данные изменились"""
+
+    def __init__(self):
+        self._dirty = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._previous = None
+
+    def mark_dirty(self):
+        self._dirty.set()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='live-payroll', daemon=True)
+                self._thread.start()
+
+    def publish_pending(self):
+        """Посчитать и разослать снимок, если были изменения"""
+        if not self._dirty.is_set():
+            return None
+        self._dirty.clear()
+        if isinstance(live_backend(), LocalBackend) and not broker.subscriber_count:
+            # Слушать некому: не считаем, а забываем устаревший снимок —
+            # первый подписчик запросит свежий
+            broker.latest.pop('payroll', None)
+            self._previous = None
+            return None
+        snapshot = payroll_snapshot()
+        previous = self._previous
+        # Разница — к предыдущему снимку этого процесса (у первого ее нет)
+        if previous is None:
+            snapshot['fund_delta'] = snapshot['employee_count_delta'] = None
+        else:
+            snapshot['fund_delta'] = snapshot['total_salary_fund'] - previous['total_salary_fund']
+            snapshot['employee_count_delta'] = snapshot['employee_count'] - previous['employee_count']
+        self._previous = snapshot
+        live_backend().send('payroll', snapshot)
+        return snapshot
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(LIVE_COALESCE_SECONDS)
+            try:
+                self.publish_pending()
+            except Exception:
+                logger.exception("Не удалось разослать снимок фонда")
+            finally:
+                # Поток живет долго — не держим соединение между расчетами
+                connection.close()
+
+
+publisher = PayrollPublisher()
+
+
+# =========== ИСТОЧНИКИ СОБЫТИЙ ===========
+def notify_payroll_changed():
+    """Сотрудники изменились: снимок пересчитается после коммита.
+    Вызывать после массовых update(), которые не шлют сигналы моделей"""
+    transaction.on_commit(publisher.mark_dirty)
+
+
+def payment_event(payment):
+    return {
+        'id': payment.pk,
+        'employee_id': payment.product_id,
+        'employee_name': payment.product.name,
+        'payment_type': payment.payment_type,
+        'bonus_amount': payment.bonus_amount,
+        'final_amount': payment.final_amount,
+        'date': payment.date,
+    }
+
+
+def payment_saved(sender, instance, created, **kwargs):
+    if created:
+        data = payment_event(instance)
+        transaction.on_commit(lambda: live_backend().send('payment', data))
+
+
+def employees_changed(sender, **kwargs):
+    notify_payroll_changed()
@@ -0,0 +1,187 @@
+"""Нагрузочный тест по HTTP на asyncio, без внешних зависимостей.
+
+Сценарий — взвешенная смесь запросов (DEFAULT_MIX). concurrency корутин
+отправляют запросы один за другим, пока не истечет duration секунд или не
+будет отправлено requests запросов. Каждый запрос — отдельное соединение
+с "Connection: close": так ведет себя и синхронный воркер gunicorn, а время
+ответа включает чтение всего тела.
+
+Ошибка — сбой соединения, таймаут или статус 4xx/5xx.
+"""
+import asyncio
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from importlib import import_module
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+
+REQUEST_TIMEOUT = 30
+
+
+# =========== СЦЕНАРИИ ===========
+# Каждый сценарий по генератору случайных чисел и id сотрудников
+# возвращает (метод, путь, тело формы или None)
+SCENARIOS = {
+    'index': lambda rng, ids: ('GET', '/', None),
+    'analytics': lambda rng, ids: ('GET', '/analytics/', None),
+    'payment_form': lambda rng, ids: ('GET', f'/buy/{rng.choice(ids)}/', None),
+    'payment_post': lambda rng, ids: ('POST', f'/buy/{rng.choice(ids)}/', {
+        'bonus': rng.randrange(0, 50000, 500),
+        'deductions': rng.randrange(0, 5000, 100),
+        'description': 'Нагрузочный тест',
+    }),
+    'admin_employees': lambda rng, ids: ('GET', '/admin/shop/product/', None),
+    'admin_payments': lambda rng, ids: ('GET', '/admin/shop/purchase/', None),
+}
+
+DEFAULT_MIX = {
+    'index': 40,
+    'analytics': 10,
+    'payment_form': 15,
+    'payment_post': 15,
+    'admin_employees': 10,
+    'admin_payments': 10,
+}
+
+
+def parse_mix(value):
+    """"index=40,analytics=10" -> {'index': 40, 'analytics': 10}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in SCENARIOS:
+            raise ValueError(f"Неизвестный сценарий {name!r}; доступны: {', '.join(SCENARIOS)}")
+        try:
+            mix[name] = int(weight)
+        except ValueError:
+            raise ValueError(f"Вес сценария {name!r} должен быть целым числом")
+        if mix[name] < 0:
+            raise ValueError(f"Вес сценария {name!r} не может быть отрицательным")
+    if not any(mix.values()):
+        raise ValueError("В смеси нет ни одного сценария с положительным весом")
+    return mix
+
+
+def admin_session(username='loadtest'):
+    """Ключ сессии суперпользователя для запросов к админке (без входа по паролю)"""
+    User = get_user_model()
+    user, created = User.objects.get_or_create(
+        username=username, defaults={'is_staff': True, 'is_superuser': True},
+    )
+    if created:
+        user.set_unusable_password()
+        user.save()
+
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return session.session_key
+
+
+# =========== КЛИЕНТ ===========
+async def fetch(host, port, method, path, form=None, cookie=None, timeout=REQUEST_TIMEOUT):
+    """Один запрос HTTP/1.1; возвращает статус ответа"""
+    body = urlencode(form).encode() if form else b''
+    headers = [
+        f'{method} {path} HTTP/1.1',
+        f'Host: {host}:{port}',
+        'Connection: close',
+        'User-Agent: shop-loadtest',
+    ]
+    if form:
+        headers += ['Content-Type: application/x-www-form-urlencoded', f'Content-Length: {len(body)}']
+    if cookie:
+        headers.append(f'Cookie: {cookie}')
+
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + body)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def run_load(base_url, employee_ids, mix=None, concurrency=10, duration=None,
+                   requests=None, session_key=None, seed=0):
+    """Гоняет смесь запросов и возвращает сводку summarize()"""
+    if duration is None and requests is None:
+        raise ValueError("Нужно задать duration или requests")
+    mix = {name: weight for name, weight in (mix or DEFAULT_MIX).items() if weight}
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    admin_cookie = f'{settings.SESSION_COOKIE_NAME}={session_key}' if session_key else None
+
+    samples = []
+    remaining = [requests]
+    deadline = time.perf_counter() + duration if duration is not None else None
+
+    async def worker(number):
+        rng = random.Random(seed + number)
+        names, weights = list(mix), list(mix.values())
+        while deadline is None or time.perf_counter() < deadline:
+            if remaining[0] is not None:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            name = rng.choices(names, weights)[0]
+            method, path, form = SCENARIOS[name](rng, employee_ids)
+            cookie = admin_cookie if path.startswith('/admin/') else None
+
+            started = time.perf_counter()
+            try:
+                status = await fetch(host, port, method, path, form, cookie)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                status = None
+            samples.append((name, time.perf_counter() - started, status))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+# =========== СВОДКА ===========
+def percentile(sorted_values, p):
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, elapsed):
+    """Пропускная способность, задержки (мс) и ошибки — всего и по сценариям"""
+    def stats(items):
+        latencies = sorted(seconds * 1000 for _, seconds, _ in items)
+        errors = sum(1 for _, _, status in items if status is None or status >= 400)
+        return {
+            'requests': len(items),
+            'errors': errors,
+            'error_rate': errors / len(items) if items else 0.0,
+            'throughput_rps': len(items) / elapsed if elapsed else 0.0,
+            'latency_ms': {
+                'mean': sum(latencies) / len(latencies) if latencies else None,
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1] if latencies else None,
+            },
+            'statuses': dict(Counter(str(status or 'error') for _, _, status in items)),
+        }
+
+    by_scenario = defaultdict(list)
+    for sample in samples:
+        by_scenario[sample[0]].append(sample)
+    return {
+        'elapsed_seconds': elapsed,
+        'total': stats(samples),
+        'scenarios': {name: stats(items) for name, items in sorted(by_scenario.items())},
+    }
@@ -0,0 +1,86 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Position, Product, position_key
+from shop.salary_adjustment import DEFAULT_GROUP_BY, apply_adjustment, preview_adjustment, validate_preview
+
+
+def decimal_argument(value):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(value)
+
+
+class Command(BaseCommand):
+    help = (
+        'Массовое изменение окладов одним UPDATE: например, +7%% для MIDDLE '
+        'с округлением до 100. Без --apply только показывает предпросмотр'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--percent', type=decimal_argument, default=Decimal('0'), help='Изменение в процентах')
+        parser.add_argument('--amount', type=decimal_argument, default=Decimal('0'), help='Надбавка в рублях')
+        parser.add_argument('--round-to', type=decimal_argument, default=Decimal('0.01'), help='Округлять до кратного')
+        parser.add_argument('--level', action='append', default=[], help='Действующий уровень (можно несколько)')
+        parser.add_argument('--position', action='append', default=[], help='Должность (можно несколько)')
+        parser.add_argument(
+            '--group-by', default=','.join(DEFAULT_GROUP_BY),
+            help='Группировка предпросмотра: поля через запятую (level, position)',
+        )
+        parser.add_argument('--apply', action='store_true', help='Применить изменение')
+
+    def handle(self, *args, **options):
+        if not options['percent'] and not options['amount']:
+            raise CommandError("Укажите --percent и/или --amount")
+        group_by = tuple(field.strip() for field in options['group_by'].split(',') if field.strip())
+        if not set(group_by) <= {'level', 'position'}:
+            raise CommandError("--group-by: допустимы только level и position")
+
+        employees = Product.objects.all()
+        selection = {}
+        if options['level']:
+            selection['level'] = [level.upper() for level in options['level']]
+            employees = employees.filter(level__in=selection['level'])
+        if options['position']:
+            selection['position'] = options['position']
+            keys = [position_key(name) for name in selection['position']]
+            employees = employees.filter(position_ref__in=Position.objects.filter(key__in=keys))
+        rule = {key: options[key] for key in ('percent', 'amount', 'round_to')}
+
+        try:
+            preview = preview_adjustment(employees, group_by=group_by, **rule)
+            validate_preview(preview)
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+        self.report(preview, group_by)
+
+        if not options['apply']:
+            self.stdout.write("Предпросмотр; для применения добавьте --apply")
+            return
+        try:
+            adjustment = apply_adjustment(
+                employees, selection=selection, source='command', group_by=group_by, **rule,
+            )
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+        self.stdout.write(self.style.SUCCESS(
+            f"Изменено окладов: {adjustment.employees_count}; фонд {adjustment.fund_before} -> "
+            f"{adjustment.fund_after} ({adjustment.fund_delta:+}), запись журнала #{adjustment.pk}"
+        ))
+
+    def report(self, preview, group_by):
+        header = ' / '.join(group_by)
+        self.stdout.write(f"{header:<40} {'сотр.':>7} {'фонд до':>16} {'фонд после':>16} {'разница':>14}")
+        for group in preview['groups']:
+            name = ' / '.join(str(group[field] or '—') for field in group_by)
+            self.stdout.write(
+                f"{name[:40]:<40} {group['employees']:>7} {group['fund_before']:>16} "
+                f"{group['fund_after']:>16} {group['delta']:>+14}"
+            )
+        self.stdout.write(
+            f"{'ИТОГО':<40} {preview['employees']:>7} {preview['fund_before']:>16} "
+            f"{preview['fund_after']:>16} {preview['delta']:>+14}"
+        )
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop.archive import ARCHIVE_BATCH_SIZE, close_periods, month_start
+
+
+class Command(BaseCommand):
+    help = 'Закрывает прошедшие месяцы: переносит их выплаты из Purchase в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before',
+            help='Закрыть все месяцы раньше указанного (ГГГГ-ММ); по умолчанию — до текущего',
+        )
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = datetime.strptime(options['before'], '%Y-%m')
+            except ValueError:
+                raise CommandError("--before ожидает месяц в формате ГГГГ-ММ")
+        else:
+            before = month_start(timezone.now())
+
+        try:
+            moved = close_periods(before, options['batch_size'], progress=self.stdout.write)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for month, count in moved.items():
+            self.stdout.write(f"{month:%m.%Y}: закрыт, перенесено {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: закрыто месяцев {len(moved)}, перенесено выплат {sum(moved.values())}"
+        ))
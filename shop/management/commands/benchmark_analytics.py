@@ -0,0 +1,55 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.analytics import compute_salary_analytics
+from shop.seeding import seed_payroll
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает скорость бэкендов аналитики (sql и pandas) на синтетическом '
+        'штате. Данные создаются в транзакции и откатываются в конце.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=1_000_000)
+        parser.add_argument('--payments', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=3, help='Берется лучший из N запусков')
+        parser.add_argument('--backends', default='sql,pandas')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        backends = [b.strip() for b in options['backends'].split(',') if b.strip()]
+        results = {
+            'employees': options['employees'],
+            'payments': options['payments'],
+            'seconds': {},
+        }
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            seed_payroll(options['employees'], options['payments'], progress=self.stdout.write)
+            self.stdout.write(f"Данные созданы за {time.perf_counter() - started:.1f} c")
+
+            for backend in backends:
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    compute_salary_analytics(backend)
+                    timings.append(time.perf_counter() - started)
+                results['seconds'][backend] = min(timings)
+                self.stdout.write(f"{backend:>8}: {min(timings):.3f} c")
+
+            transaction.set_rollback(True)
+
+        seconds = results['seconds']
+        if 'sql' in seconds and 'pandas' in seconds and seconds['sql']:
+            results['speedup'] = seconds['pandas'] / seconds['sql']
+            self.stdout.write(self.style.SUCCESS(f"Ускорение sql относительно pandas: x{results['speedup']:.1f}"))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,65 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.template.loader import get_template
+from django.test import RequestFactory
+
+from shop.management.commands.benchmark_templates import sample_employees
+from shop.middleware import CompressionMiddleware, brotli
+
+ENCODINGS = ('identity', 'gzip', 'br')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает размер страницы списка сотрудников без сжатия, с gzip и '
+        'Brotli (через CompressionMiddleware) и время ее передачи по каналам'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--bandwidth', default='1,10,100', help='Скорости канала, Мбит/с, через запятую')
+        parser.add_argument('--repeat', type=int, default=3, help='Берется лучший из N запусков сжатия')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        html = get_template('shop/employee_list.html').render({'employees': sample_employees(options['rows'])})
+        content = html.encode('utf-8')
+        bandwidths = [float(value) for value in options['bandwidth'].split(',') if value.strip()]
+        middleware = CompressionMiddleware(lambda request: None)
+        factory = RequestFactory()
+
+        results = []
+        for encoding in ENCODINGS:
+            if encoding == 'br' and brotli is None:
+                self.stdout.write("br: пакет Brotli не установлен, пропущено")
+                continue
+            best, size = None, len(content)
+            for _ in range(options['repeat']):
+                request = factory.get('/', headers={'Accept-Encoding': encoding})
+                response = HttpResponse(content, content_type='text/html; charset=utf-8')
+                started = time.perf_counter()
+                response = middleware.process_response(request, response)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+                size = len(response.content)
+            transfer = {f"{mbit:g}": size * 8 / (mbit * 1_000_000) for mbit in bandwidths}
+            results.append({
+                'rows': options['rows'],
+                'encoding': encoding,
+                'bytes': size,
+                'ratio': len(content) / size,
+                'compress_seconds': best if encoding != 'identity' else 0.0,
+                'transfer_seconds': transfer,
+            })
+            self.stdout.write(
+                f"{encoding:>8}: {size / 1024:9.1f} КБ (x{len(content) / size:4.1f}), "
+                f"сжатие {results[-1]['compress_seconds'] * 1000:6.1f} мс; передача "
+                + ", ".join(f"{seconds * 1000:.0f} мс при {mbit} Мбит/с" for mbit, seconds in transfer.items())
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
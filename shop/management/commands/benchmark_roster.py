@@ -0,0 +1,66 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from shop.models import Product
+from shop.roster import ROSTER_COMMIT_WINDOW, load_roster, refresh_roster
+from shop.seeding import seed_payroll
+
+
+class Command(BaseCommand):
+    help = (
+        'Память и стоимость обновления штата в массивах (shop.roster) на '
+        'синтетических данных. Данные создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=1_000_000)
+        parser.add_argument('--changes', type=int, default=1000, help='Сколько сотрудников изменить')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ids = seed_payroll(options['employees'], progress=self.stdout.write)
+            # Как в рабочей базе: штат изменен давно, вне окна дочитывания
+            Product.objects.update(updated_at=timezone.now() - 2 * ROSTER_COMMIT_WINDOW)
+
+            started = time.perf_counter()
+            roster = load_roster()
+            full_load = time.perf_counter() - started
+
+            started = time.perf_counter()
+            refresh_roster(roster)
+            unchanged = time.perf_counter() - started
+
+            changed_ids = ids[::max(len(ids) // max(options['changes'], 1), 1)][:options['changes']]
+            Product.objects.filter(id__in=changed_ids).update(price=F('price') + 100, updated_at=timezone.now())
+            started = time.perf_counter()
+            refreshed = refresh_roster(roster)
+            incremental = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+
+        results = {
+            'employees': len(roster),
+            'bytes': roster.nbytes,
+            'bytes_per_employee': roster.nbytes / max(len(roster), 1),
+            'full_load_seconds': full_load,
+            'unchanged_refresh_seconds': unchanged,
+            'changed_employees': len(changed_ids),
+            'incremental_refresh_seconds': incremental,
+            'salary_fund_delta': (int(refreshed.salary.sum()) - int(roster.salary.sum())) / 100,
+        }
+        self.stdout.write(f"Сотрудников: {results['employees']}, память {roster.nbytes / 2**20:.1f} МБ "
+                          f"({results['bytes_per_employee']:.0f} байт на сотрудника)")
+        self.stdout.write(f"Полная загрузка: {full_load:.3f} c; проверка без изменений: {unchanged * 1000:.1f} мс")
+        self.stdout.write(self.style.SUCCESS(
+            f"Обновление после изменения {len(changed_ids)} сотрудников: {incremental * 1000:.1f} мс"
+        ))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
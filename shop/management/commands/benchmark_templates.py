@@ -0,0 +1,76 @@
+import json
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.template.loader import get_template
+
+from shop.models import Product
+
+TEMPLATES = ('shop/_employee_rows.html', 'shop/employee_list.html')
+
+
+def sample_employees(count):
+    """Несохраненные сотрудники: замеряется только рендер, без БД"""
+    positions = ['Разработчик', 'Аналитик', 'Тестировщик', 'Дизайнер', 'Менеджер проекта']
+    levels = [None, None, 'LEAD', 'MANAGER']
+    return [
+        Product(
+            id=n + 1,
+            name=f"Сотрудник {n} <{n % 7}>",
+            price=Decimal(30000 + n % 90000) + Decimal('0.55'),
+            quantity=n % 12,
+            position=positions[n % len(positions)],
+            employee_type=levels[n % len(levels)],
+        )
+        for n in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость рендера больших списков шаблонами Django и Jinja2'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='1000,10000,100000', help='Размеры списков через запятую')
+        parser.add_argument('--repeat', type=int, default=3, help='Берется лучший из N запусков')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        from shop.jinja_env import comparable_html
+
+        if 'jinja2' not in engines.templates:
+            raise CommandError("Движок jinja2 не настроен: pip install jinja2")
+
+        results = []
+        for rows in [int(value) for value in options['rows'].split(',') if value.strip()]:
+            employees = sample_employees(rows)
+            for name in TEMPLATES:
+                timings, outputs = {}, {}
+                for engine in ('django', 'jinja2'):
+                    template = get_template(name, using=engine)
+                    best = None
+                    for _ in range(options['repeat']):
+                        started = time.perf_counter()
+                        outputs[engine] = template.render({'employees': employees})
+                        elapsed = time.perf_counter() - started
+                        best = elapsed if best is None else min(best, elapsed)
+                    timings[engine] = best
+
+                same = comparable_html(outputs['django']) == comparable_html(outputs['jinja2'])
+                results.append({
+                    'rows': rows,
+                    'template': name,
+                    'seconds': timings,
+                    'speedup': timings['django'] / timings['jinja2'],
+                    'same_output': same,
+                })
+                self.stdout.write(
+                    f"{name} x {rows}: django {timings['django']:.3f} c, jinja2 {timings['jinja2']:.3f} c "
+                    f"(x{timings['django'] / timings['jinja2']:.1f})"
+                    + ("" if same else self.style.ERROR(" — ВЫВОД РАЗЛИЧАЕТСЯ"))
+                )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,27 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.snapshot import SNAPSHOT_CHUNK_SIZE, export_snapshot, prune_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Выгружает сотрудников и выплаты в секционированный снимок Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Каталог снимков; по умолчанию SHOP_SNAPSHOT_DIR')
+        parser.add_argument('--chunk-size', type=int, default=SNAPSHOT_CHUNK_SIZE)
+        parser.add_argument('--keep', type=int, help='Оставить только N последних снимков')
+
+    def handle(self, *args, **options):
+        try:
+            manifest = export_snapshot(options['output'], options['chunk_size'], progress=self.stdout.write)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        if options['keep']:
+            for name in prune_snapshots(options['keep'], options['output']):
+                self.stdout.write(f"Удален снимок {name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Снимок {manifest['name']}: сотрудников {manifest['employees']}, "
+            f"выплат {manifest['payments']}, секций {len(manifest['partitions'])}"
+        ))
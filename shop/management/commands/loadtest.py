@@ -0,0 +1,130 @@
+import asyncio
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.loadtest import DEFAULT_MIX, admin_session, parse_mix, run_load
+from shop.models import Product
+from shop.seeding import seed_payroll
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест: поднимает gunicorn tplab2.wsgi на текущей БД '
+        '(DATABASE_URL) и гоняет смесь запросов к страницам и админке'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Нагружать уже запущенный сервер вместо запуска gunicorn')
+        parser.add_argument('--bind', default='127.0.0.1:8765')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument('--worker-class', default='sync')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--duration', type=float, default=30, help='Секунд нагрузки')
+        parser.add_argument('--requests', type=int, help='Ограничить числом запросов вместо времени')
+        parser.add_argument(
+            '--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+            help='Веса сценариев: index=40,analytics=10,...',
+        )
+        parser.add_argument('--migrate', action='store_true', help='Применить миграции перед тестом')
+        parser.add_argument('--seed-employees', type=int, default=0)
+        parser.add_argument('--seed-payments', type=int, default=0)
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['migrate']:
+            call_command('migrate', verbosity=0)
+        if options['seed_employees']:
+            seed_payroll(options['seed_employees'], options['seed_payments'], progress=self.stdout.write)
+
+        employee_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:1000])
+        if not employee_ids:
+            raise CommandError("В БД нет сотрудников: используйте --seed-employees")
+        session_key = admin_session()
+
+        server = None
+        url = options['url']
+        if not url:
+            server = self.start_gunicorn(options)
+            url = f"http://{options['bind']}"
+        try:
+            self.stdout.write(f"Нагрузка на {url}: {options['concurrency']} параллельных клиентов")
+            results = asyncio.run(run_load(
+                url, employee_ids, mix,
+                concurrency=options['concurrency'],
+                duration=None if options['requests'] else options['duration'],
+                requests=options['requests'],
+                session_key=session_key,
+            ))
+        finally:
+            if server:
+                self.stop_gunicorn(server)
+
+        self.report(results)
+        if options['output']:
+            config = {
+                key: options[key]
+                for key in ('url', 'workers', 'threads', 'worker_class', 'concurrency', 'duration', 'requests')
+            }
+            config['mix'] = mix
+            config['database'] = settings.DATABASES['default']['ENGINE']
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'config': config, 'results': results}, f, ensure_ascii=False, indent=2)
+
+    def start_gunicorn(self, options):
+        if importlib.util.find_spec('gunicorn') is None:
+            raise CommandError("gunicorn не установлен: pip install gunicorn или укажите --url")
+        command = [
+            sys.executable, '-m', 'gunicorn', 'tplab2.wsgi:application',
+            '--bind', options['bind'],
+            '--workers', str(options['workers']),
+            '--threads', str(options['threads']),
+            '--worker-class', options['worker_class'],
+            '--log-level', 'warning',
+        ]
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=os.environ.copy())
+
+        host, _, port = options['bind'].rpartition(':')
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"gunicorn завершился с кодом {server.returncode}")
+            try:
+                socket.create_connection((host, int(port)), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        self.stop_gunicorn(server)
+        raise CommandError("gunicorn не начал принимать соединения за 30 секунд")
+
+    def stop_gunicorn(self, server):
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    def report(self, results):
+        rows = [('ВСЕГО', results['total'])] + list(results['scenarios'].items())
+        self.stdout.write(f"{'сценарий':<16} {'запр.':>7} {'RPS':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'ошибки':>7}")
+        for name, stats in rows:
+            latency = stats['latency_ms']
+            self.stdout.write(
+                f"{name:<16} {stats['requests']:>7} {stats['throughput_rps']:>8.1f} "
+                f"{latency['p50'] or 0:>8.1f} {latency['p95'] or 0:>8.1f} {latency['p99'] or 0:>8.1f} "
+                f"{stats['error_rate']:>7.1%}"
+            )
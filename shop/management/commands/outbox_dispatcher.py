@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from shop.outbox import OUTBOX_BATCH_SIZE, OUTBOX_SINKS, dispatch_batch, outbox_sink, prune_delivered
+
+
+class Command(BaseCommand):
+    help = (
+        'Диспетчер outbox: доставляет события о выплатах и окладах пачками '
+        'в приемник SHOP_OUTBOX_SINK и удаляет доставленные по сроку хранения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Доставить накопленное и выйти')
+        parser.add_argument('--sink', choices=sorted(OUTBOX_SINKS), help='Приемник (по умолчанию SHOP_OUTBOX_SINK)')
+        parser.add_argument('--target', help='Файл, сокет или URL (по умолчанию SHOP_OUTBOX_TARGET)')
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=1, help='Секунд между проверками пустой очереди')
+        parser.add_argument('--prune-interval', type=float, default=600, help='Секунд между очистками')
+
+    def handle(self, *args, **options):
+        sink = outbox_sink(options['sink'], options['target'])
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size должен быть положительным")
+
+        last_prune = None
+        while True:
+            if last_prune is None or time.monotonic() - last_prune >= options['prune_interval']:
+                pruned = prune_delivered()
+                if pruned:
+                    self.stdout.write(f"Удалено доставленных событий: {pruned}")
+                last_prune = time.monotonic()
+
+            try:
+                delivered = dispatch_batch(sink, batch_size)
+            except OSError as error:
+                # Приемник недоступен: пачка осталась в очереди
+                if options['once']:
+                    raise CommandError(f"Приемник {sink.kind} недоступен: {error}")
+                self.stderr.write(f"Приемник {sink.kind} недоступен: {error}")
+                delivered = 0
+            if delivered:
+                self.stdout.write(f"Доставлено событий: {delivered}")
+            if delivered == batch_size:
+                # Очередь, вероятно, не пуста — следующая пачка сразу
+                continue
+
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop.archive import payment_querysets
+from shop.deletion import DELETE_BATCH_SIZE, purge_payments, years_ago
+
+
+class Command(BaseCommand):
+    help = 'Удаляет выплаты старше срока хранения (оперативные и архивные) пачками'
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group(required=True)
+        cutoff.add_argument('--older-than-years', type=int, help='Удалить выплаты старше N лет')
+        cutoff.add_argument('--before', help='Удалить выплаты раньше даты (ГГГГ-ММ-ДД)')
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, ничего не удалять')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = timezone.make_aware(datetime.strptime(options['before'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError("--before ожидает дату в формате ГГГГ-ММ-ДД")
+        else:
+            if options['older_than_years'] < 1:
+                raise CommandError("--older-than-years должен быть положительным")
+            before = years_ago(options['older_than_years'])
+
+        if options['dry_run']:
+            total = sum(payments.count() for payments in payment_querysets(end=before))
+            self.stdout.write(f"Выплат раньше {before:%d.%m.%Y}: {total} (ничего не удалено)")
+            return
+
+        deleted = purge_payments(before, options['batch_size'], progress=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Готово: удалено выплат раньше {before:%d.%m.%Y}: {deleted}"))
@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from shop.models import JUNIOR_SERVICE_LIMIT, MIDDLE_SERVICE_LIMIT, Product
+
+# Диапазоны стажа, при которых уровень совпадает с автоопределенным
+SERVICE_RANGES = {
+    'JUNIOR': Q(quantity__lt=JUNIOR_SERVICE_LIMIT),
+    'MIDDLE': Q(quantity__gte=JUNIOR_SERVICE_LIMIT, quantity__lt=MIDDLE_SERVICE_LIMIT),
+    'SENIOR': Q(quantity__gte=MIDDLE_SERVICE_LIMIT),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Массовая переклассификация: сбрасывает уровни, сохраненные по стажу '
+        'старым Product.save() и уже не совпадающие со стажем, чтобы '
+        'действующий уровень (колонка level) снова следовал за стажем. '
+        'Совпадающие уровни (в т.ч. заданные действиями админки) '
+        'сохраняются, если не указан --all'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--levels', default='JUNIOR,MIDDLE,SENIOR',
+            help='Какие сохраненные уровни сбрасывать (через запятую)',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Сбросить все сохраненные уровни из --levels, а не только расходящиеся со стажем',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, у скольких сотрудников будет сброшен уровень',
+        )
+
+    def handle(self, *args, **options):
+        levels = [code.strip().upper() for code in options['levels'].split(',') if code.strip()]
+        unknown = set(levels) - set(SERVICE_RANGES)
+        if unknown:
+            raise CommandError(
+                f"Сбрасывать можно только уровни по стажу: {', '.join(SERVICE_RANGES)}; "
+                f"получено: {', '.join(sorted(unknown))}"
+            )
+
+        saved = Product.objects.filter(employee_type__in=levels)
+        stale = Q()
+        for code in levels:
+            stale |= Q(employee_type=code) & ~SERVICE_RANGES[code]
+        queryset = saved if options['all'] else saved.filter(stale)
+        self.stdout.write(
+            f"Сохраненных уровней {', '.join(levels)}: {saved.count()}, "
+            f"из них не совпадает со стажем: {saved.filter(stale).count()}; "
+            f"будет сброшено: {queryset.count()}"
+        )
+        self._print_levels('До')
+
+        if options['dry_run']:
+            return
+
+        # Пачками по первичному ключу: короткие транзакции, без блокировки всей таблицы
+        reset = 0
+        last_id = 0
+        while True:
+            ids = list(
+                queryset.filter(id__gt=last_id).order_by('id')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                reset += Product.objects.filter(id__in=ids).update(
+                    employee_type=None, updated_at=timezone.now(),
+                )
+            last_id = ids[-1]
+            self.stdout.write(f"  сброшено {reset}")
+
+        self._print_levels('После')
+        self.stdout.write(self.style.SUCCESS(f"Готово: {reset} сотрудников переклассифицировано"))
+
+    def _print_levels(self, title):
+        counts = Product.objects.order_by().values_list('level').annotate(count=Count('id'))
+        summary = ', '.join(f"{level}: {count}" for level, count in sorted(counts))
+        self.stdout.write(f"{title}: {summary or 'нет сотрудников'}")
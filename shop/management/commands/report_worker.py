@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shop.reports import REPORT_CHUNK_SIZE, claim_next_job, cleanup_reports, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        'Обработчик фоновых отчетов: забирает задания ReportJob из очереди и '
+        'формирует файлы в SHOP_REPORT_DIR; заодно удаляет истекшие отчеты'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Обработать очередь и выйти')
+        parser.add_argument('--poll-interval', type=float, default=2, help='Секунд между проверками пустой очереди')
+        parser.add_argument('--cleanup-interval', type=float, default=600, help='Секунд между очистками')
+        parser.add_argument('--chunk-size', type=int, default=REPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        last_cleanup = None
+        while True:
+            if last_cleanup is None or time.monotonic() - last_cleanup >= options['cleanup_interval']:
+                self.cleanup()
+                last_cleanup = time.monotonic()
+
+            job = claim_next_job()
+            if job is not None:
+                self.stdout.write(f"Отчет #{job.pk}: {job.kind}, {job.format}, фильтры {job.filters}")
+                job = run_job(job, options['chunk_size'])
+                if job.status == job.DONE:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Отчет #{job.pk} готов: строк {job.rows_done}, {job.file_size} байт"
+                    ))
+                else:
+                    self.stderr.write(f"Отчет #{job.pk} не сформирован: {job.error}")
+                close_old_connections()
+                continue
+
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(options['poll_interval'])
+
+    def cleanup(self):
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь брошенных заданий: {requeued}")
+        expired = cleanup_reports()
+        if expired:
+            self.stdout.write(f"Удалено истекших отчетов: {expired}")
@@ -0,0 +1,41 @@
+import glob
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.slowlog import aggregate_log
+
+
+class Command(BaseCommand):
+    help = 'Сводка журнала медленных запросов по отпечаткам (с учетом ротированных файлов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=settings.SHOP_SLOW_QUERY_LOG)
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help='Вывести сводку в JSON')
+
+    def handle(self, *args, **options):
+        paths = sorted(glob.glob(glob.escape(options['log']) + '*'))
+        if not paths:
+            raise CommandError(f"Журнал {options['log']} не найден")
+
+        lines = []
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                lines.extend(f)
+        groups = aggregate_log(lines)[:options['top']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(groups, ensure_ascii=False, indent=2))
+            return
+        for group in groups:
+            sources = ', '.join(f"{name} ×{count}" for name, count in group['sources'].items())
+            self.stdout.write(self.style.WARNING(
+                f"[{group['fingerprint']}] {group['count']} раз, всего {group['total_ms']:.0f} мс, "
+                f"среднее {group['mean_ms']:.1f}, максимум {group['max_ms']:.1f}"
+            ))
+            self.stdout.write(f"  {group['sql']}")
+            self.stdout.write(f"  источники: {sources}")
+            for line in group['plan'] or []:
+                self.stdout.write(f"    {line}")
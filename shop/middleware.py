@@ -0,0 +1,202 @@
+import json
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, JsonResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # без пакета Brotli остается только gzip
+    brotli = None
+
+from .profiling import ProfileBusy, profile_call
+from .routers import read_from_replica, replica_configured
+from .slowlog import reset_query_source, set_query_source
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """Разрешает чтение с реплики для безопасных запросов.
+
+    После собственной записи (любой небезопасный метод с успешным ответом)
+    пользователь получает cookie и SHOP_REPLICA_PIN_SECONDS секунд читает с
+    основной БД — чтобы увидеть свое изменение, пока реплика догоняет.
+    """
+    cookie_name = 'shop_primary_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        is_write = request.method not in SAFE_METHODS
+        pinned = is_write or self.cookie_name in request.COOKIES
+        with read_from_replica(not pinned):
+            response = self.get_response(request)
+
+        if is_write and response.status_code < 400:
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=settings.SHOP_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class ProfilingMiddleware:
+    """Профиль запроса для персонала по ?_profile=1 или заголовку X-Profile.
+
+    По умолчанию вместо страницы возвращается JSON-отчет; со значением
+    "store" страница отдается как обычно, а отчет сохраняется в
+    SHOP_PROFILE_DIR (имя файла — в заголовке X-Profile-Report).
+    Без параметра и заголовка запрос проходит без изменений.
+    """
+    query_param = '_profile'
+    header = 'X-Profile'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.GET.get(self.query_param) or request.headers.get(self.header)
+        if not mode or not request.user.is_staff:
+            return self.get_response(request)
+
+        # Иначе условный GET ответит 304 и профилировать будет нечего
+        request.META.pop('HTTP_IF_NONE_MATCH', None)
+        request.META.pop('HTTP_IF_MODIFIED_SINCE', None)
+        try:
+            response, report = profile_call(self.render_response, request)
+        except ProfileBusy as e:
+            return JsonResponse({'error': str(e)}, status=409)
+
+        report.update(
+            path=request.get_full_path(),
+            method=request.method,
+            status=response.status_code,
+            created_at=timezone.now().isoformat(),
+        )
+        if mode != 'store':
+            return JsonResponse(report)
+
+        os.makedirs(settings.SHOP_PROFILE_DIR, exist_ok=True)
+        name = f"{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.json"
+        with open(os.path.join(settings.SHOP_PROFILE_DIR, name), 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        response['X-Profile-Report'] = name
+        return response
+
+    def render_response(self, request):
+        response = self.get_response(request)
+        if response.streaming and not response.is_async:
+            # Потоковый ответ формируется при чтении — читаем его под профилем
+            response.streaming_content = [b''.join(response.streaming_content)]
+        return response
+
+
+class QuerySourceMiddleware:
+    """Запоминает, какое представление (или действие админки) выполняет
+    запросы — для журнала медленных запросов"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = set_query_source(None)
+        try:
+            return self.get_response(request)
+        finally:
+            reset_query_source(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        source = match.view_name if match else f"{view_func.__module__}.{view_func.__qualname__}"
+        # Действия админки приходят POST-ом формы на список объектов
+        if match and match.app_name == 'admin' and source.endswith('_changelist') and request.method == 'POST':
+            action = request.POST.get('action')
+            if action:
+                source = f"{source}:{action}"
+        set_query_source(source)
+
+
+# =========== СЖАТИЕ ОТВЕТОВ ===========
+# Сжимаются только страницы и данные; статику сжатой отдает WhiteNoise,
+# а text/event-stream (live_events) сжатие задержало бы в буфере
+COMPRESSIBLE_TYPES = ('text/html', 'application/json', 'text/plain')
+# Ответы короче не сжимаются: заголовки сжатия съедят выигрыш
+MIN_COMPRESS_LENGTH = 200
+# Для страниц, сжимаемых на лету: 5 почти вдвое быстрее 11 при близком размере
+BROTLI_QUALITY = 5
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+
+def brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        # Каждая часть потока уходит клиенту сразу, как и в gzip Django
+        yield compressor.process(item) + compressor.flush()
+    yield compressor.finish()
+
+
+async def brotli_async_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    async for item in sequence:
+        yield compressor.process(item) + compressor.flush()
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Сжатие HTML и JSON: Brotli, если клиент его принимает и пакет
+    установлен, иначе gzip (GZipMiddleware Django). Большие таблицы
+    сотрудников сжимаются примерно в 10 раз, потоковые ответы сжимаются
+    по частям без буферизации.
+
+    Против BREACH: CSRF-токен в формах Django маскирует заново на каждый
+    ответ, а gzip дополнительно получает случайное заполнение заголовка.
+    """
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').split(';')[0].strip() not in COMPRESSIBLE_TYPES:
+            return response
+        # Файлы для скачивания (отчеты) идут как есть: sendfile и
+        # Content-Length — прогресс загрузки в браузере
+        if isinstance(response, FileResponse) or response.get('Content-Disposition', '').startswith('attachment'):
+            return response
+        accepts = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is None or not re_accepts_brotli.search(accepts):
+            return super().process_response(request, response)
+
+        # Те же условия, что у GZipMiddleware
+        if not response.streaming and len(response.content) < MIN_COMPRESS_LENGTH:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = brotli_async_sequence(response.streaming_content)
+            else:
+                response.streaming_content = brotli_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Сжатое тело — уже другое представление: сильный ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
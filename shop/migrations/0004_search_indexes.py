@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# Схема поиска на момент этой миграции; SQL зафиксирован здесь, чтобы
+# последующие изменения shop.search не меняли историю
+POSTGRESQL_TRIGRAM_INDEXES = (
+    ('shop_product', 'name'),
+    ('shop_product', 'position'),
+    ('shop_purchase', 'address'),
+)
+SQLITE_FTS_TABLES = {
+    'shop_product_fts': ('shop_product', ('name', 'position')),
+    'shop_purchase_fts': ('shop_purchase', ('address',)),
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for table, column in POSTGRESQL_TRIGRAM_INDEXES:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm '
+                    f'ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+                )
+        elif connection.vendor == 'sqlite':
+            for fts_table, (table, columns) in SQLITE_FTS_TABLES.items():
+                column_list = ', '.join(columns)
+                new_values = ', '.join(f'new.{c}' for c in columns)
+                old_values = ', '.join(f'old.{c}' for c in columns)
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+                    f"{column_list}, content='{table}', content_rowid='id', tokenize='trigram')"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN "
+                    f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN "
+                    f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) "
+                    f"VALUES ('delete', old.id, {old_values}); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE ON {table} BEGIN "
+                    f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) "
+                    f"VALUES ('delete', old.id, {old_values}); "
+                    f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+                )
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for table, column in POSTGRESQL_TRIGRAM_INDEXES:
+                cursor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+        elif connection.vendor == 'sqlite':
+            for fts_table in SQLITE_FTS_TABLES:
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {fts_table}_{suffix}')
+                cursor.execute(f'DROP TABLE IF EXISTS {fts_table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='level',
+            field=models.GeneratedField(choices=[('JUNIOR', 'Junior (стаж < 2 лет)'), ('MIDDLE', 'Middle (стаж 2-5 лет)'), ('SENIOR', 'Senior (стаж > 5 лет)'), ('LEAD', 'Team Lead'), ('MANAGER', 'Менеджер'), ('OTHER', 'Другое')], db_index=True, db_persist=True, expression=models.Case(models.When(employee_type__in=['JUNIOR', 'MIDDLE', 'SENIOR', 'LEAD', 'MANAGER', 'OTHER'], then=models.F('employee_type')), models.When(quantity__lt=2, then=models.Value('JUNIOR')), models.When(quantity__lt=5, then=models.Value('MIDDLE')), default=models.Value('SENIOR')), output_field=models.CharField(choices=[('JUNIOR', 'Junior (стаж < 2 лет)'), ('MIDDLE', 'Middle (стаж 2-5 лет)'), ('SENIOR', 'Senior (стаж > 5 лет)'), ('LEAD', 'Team Lead'), ('MANAGER', 'Менеджер'), ('OTHER', 'Другое')], max_length=20), verbose_name='Действующий уровень'),
+        ),
+    ]
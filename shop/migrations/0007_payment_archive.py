@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_purchase_product_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц')),
+                ('payments_count', models.PositiveIntegerField(default=0, verbose_name='Выплат в архиве')),
+                ('closed_at', models.DateTimeField(auto_now=True, verbose_name='Закрыт')),
+            ],
+            options={
+                'verbose_name': 'Закрытый период',
+                'verbose_name_plural': 'Закрытые периоды',
+                'ordering': ('-month',),
+            },
+        ),
+        migrations.CreateModel(
+            name='PurchaseArchive',
+            fields=[
+                ('person', models.CharField(help_text='Введите сумму премии в рублях', max_length=200, verbose_name='Сумма премии')),
+                ('address', models.CharField(help_text='Например: Зарплата за январь, Премия за проект', max_length=200, verbose_name='Описание выплаты')),
+                ('payment_type', models.CharField(blank=True, choices=[('SALARY', 'Зарплата'), ('BONUS', 'Премия'), ('ADVANCE', 'Аванс'), ('VACATION', 'Отпускные'), ('SICK_LEAVE', 'Больничный'), ('MATERNITY', 'Декретные'), ('OTHER', 'Другое')], default='SALARY', max_length=20, null=True, verbose_name='Тип выплаты')),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID выплаты')),
+                ('date', models.DateTimeField(verbose_name='Дата выплаты')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shop.product', verbose_name='Сотрудник')),
+            ],
+            options={
+                'verbose_name': 'Архивная выплата',
+                'verbose_name_plural': 'Архив выплат',
+                'indexes': [models.Index(fields=['product', 'date'], name='shop_archive_product_date'), models.Index(fields=['date'], name='shop_archive_date')],
+            },
+        ),
+    ]
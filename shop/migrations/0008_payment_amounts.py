@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast
+
+# Копия shop.expressions.BONUS_PATTERN: миграция не должна зависеть от кода приложения
+BONUS_PATTERN = r'^-?[0-9]+(\.[0-9]+)?$'
+
+
+def backfill_amounts(apps, schema_editor):
+    """Суммы существующих выплат: оклада на дату выплаты уже не узнать,
+    поэтому берется текущий оклад сотрудника. Два UPDATE на таблицу."""
+    Product = apps.get_model('shop', 'Product')
+    money = DecimalField(max_digits=12, decimal_places=2)
+    for model_name in ('Purchase', 'PurchaseArchive'):
+        model = apps.get_model('shop', model_name)
+        model.objects.update(
+            base_salary=Subquery(Product.objects.filter(id=OuterRef('product_id')).values('price')[:1]),
+            bonus_amount=Case(
+                When(person__regex=BONUS_PATTERN, then=Cast('person', money)),
+                default=Value(Decimal('0.00')),
+                output_field=money,
+            ),
+            deductions=Decimal('0.00'),
+        )
+        model.objects.update(final_amount=F('base_salary') + F('bonus_amount') - F('deductions'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_payment_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='base_salary',
+            field=models.DecimalField(blank=True, decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Оклад на дату выплаты'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='bonus_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Премия, руб.'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='deductions',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Удержания'),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='final_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Итого к выплате'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='purchasearchive',
+            name='base_salary',
+            field=models.DecimalField(blank=True, decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Оклад на дату выплаты'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='purchasearchive',
+            name='bonus_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Премия, руб.'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='purchasearchive',
+            name='deductions',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Удержания'),
+        ),
+        migrations.AddField(
+            model_name='purchasearchive',
+            name='final_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Итого к выплате'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_amounts, migrations.RunPython.noop),
+    ]
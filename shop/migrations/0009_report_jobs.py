@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_payment_amounts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('payments', 'Выплаты'), ('employees', 'Сотрудники')], max_length=20, verbose_name='Данные')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel (XLSX)'), ('json', 'JSON')], default='csv', max_length=10, verbose_name='Формат')),
+                ('filters', models.JSONField(blank=True, default=dict, verbose_name='Фильтры')),
+                ('status', models.CharField(choices=[('PENDING', 'В очереди'), ('RUNNING', 'Формируется'), ('DONE', 'Готов'), ('FAILED', 'Ошибка'), ('EXPIRED', 'Удален по сроку')], default='PENDING', max_length=10, verbose_name='Статус')),
+                ('rows_total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Строк всего')),
+                ('rows_done', models.PositiveIntegerField(default=0, verbose_name='Строк готово')),
+                ('file_name', models.CharField(blank=True, max_length=200, verbose_name='Файл')),
+                ('file_size', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Размер, байт')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начат')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='Последний прогресс')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершен')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Хранится до')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Заказал')),
+            ],
+            options={
+                'verbose_name': 'Отчет',
+                'verbose_name_plural': 'Отчеты',
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['status', 'created_at'], name='shop_reportjob_queue')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:51
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_report_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalaryAdjustment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('percent', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=7, verbose_name='Изменение, %')),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12, verbose_name='Надбавка, руб.')),
+                ('round_to', models.DecimalField(decimal_places=2, default=Decimal('0.01'), max_digits=12, verbose_name='Округление до')),
+                ('selection', models.JSONField(blank=True, default=dict, verbose_name='Отбор сотрудников')),
+                ('employees_count', models.PositiveIntegerField(verbose_name='Сотрудников')),
+                ('fund_before', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='Фонд до')),
+                ('fund_after', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='Фонд после')),
+                ('groups', models.JSONField(blank=True, default=list, verbose_name='По группам')),
+                ('source', models.CharField(choices=[('admin', 'Админка'), ('command', 'Команда adjust_salaries')], default='admin', max_length=20, verbose_name='Источник')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Применено')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Кто применил')),
+            ],
+            options={
+                'verbose_name': 'Изменение окладов',
+                'verbose_name_plural': 'Изменения окладов',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
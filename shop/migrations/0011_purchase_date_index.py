@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_salary_adjustments'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['date'], name='shop_purchase_date'),
+        ),
+    ]
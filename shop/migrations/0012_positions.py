@@ -0,0 +1,173 @@
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 5000
+DEFAULT_POSITION = "Специалист"
+
+
+def _clean(name):
+    return ' '.join(str(name or '').split()) or DEFAULT_POSITION
+
+
+def _key(name):
+    return _clean(name).casefold()
+
+
+def fill_positions(apps, schema_editor):
+    """Справочник из свободного текста: варианты, отличающиеся регистром и
+    пробелами, — одна должность с самым частым написанием. Сотрудники
+    получают ссылку пачками по id, каждая пачка — своя транзакция."""
+    Position = apps.get_model('shop', 'Position')
+    Product = apps.get_model('shop', 'Product')
+    db = schema_editor.connection.alias
+
+    variants = defaultdict(Counter)
+    rows = Product.objects.using(db).values('position').annotate(n=models.Count('id')).order_by()
+    for row in rows:
+        variants[_key(row['position'])][_clean(row['position'])] += row['n']
+    position_ids = {}
+    for key, names in variants.items():
+        name = min(names, key=lambda variant: (-names[variant], variant))
+        position_ids[key] = Position.objects.using(db).get_or_create(key=key, defaults={'name': name})[0].pk
+
+    last_id = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(
+                Product.objects.using(db).filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'position')[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            by_position = defaultdict(list)
+            for pk, name in batch:
+                by_position[position_ids[_key(name)]].append(pk)
+            for position_id, pks in by_position.items():
+                Product.objects.using(db).filter(id__in=pks).update(position_ref_id=position_id)
+        last_id = batch[-1][0]
+
+
+def fill_position_names(apps, schema_editor):
+    Position = apps.get_model('shop', 'Position')
+    Product = apps.get_model('shop', 'Product')
+    db = schema_editor.connection.alias
+    for position_id, name in Position.objects.using(db).values_list('id', 'name'):
+        Product.objects.using(db).filter(position_ref_id=position_id).update(position=name)
+
+
+def drop_product_search_index(apps, schema_editor):
+    """Старый индекс сотрудников включал колонку position"""
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS shop_product_position_trgm')
+        elif connection.vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS shop_product_fts_{suffix}')
+            cursor.execute('DROP TABLE IF EXISTS shop_product_fts')
+
+
+# Поисковые индексы после переноса должности в справочник (таблица FTS5 или
+# триграммный индекс -> исходная таблица, колонка); SQL зафиксирован
+# здесь, чтобы последующие изменения shop.search не меняли историю
+SEARCH_INDEXES = {
+    'shop_product_fts': ('shop_product', 'name'),
+    'shop_position_fts': ('shop_position', 'name'),
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for table, column in SEARCH_INDEXES.values():
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm '
+                    f'ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+                )
+        elif connection.vendor == 'sqlite':
+            for fts_table, (table, column) in SEARCH_INDEXES.items():
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+                    f"{column}, content='{table}', content_rowid='id', tokenize='trigram')"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN "
+                    f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN "
+                    f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) "
+                    f"VALUES ('delete', old.id, old.{column}); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE ON {table} BEGIN "
+                    f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) "
+                    f"VALUES ('delete', old.id, old.{column}); "
+                    f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END"
+                )
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+def drop_position_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS shop_position_name_trgm')
+        elif connection.vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS shop_position_fts_{suffix}')
+            cursor.execute('DROP TABLE IF EXISTS shop_position_fts')
+
+
+class Migration(migrations.Migration):
+    # Пачки сотрудников коммитятся по отдельности
+    atomic = False
+
+    dependencies = [
+        ('shop', '0011_purchase_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Position',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('key', models.CharField(editable=False, max_length=100, unique=True, verbose_name='Ключ')),
+            ],
+            options={
+                'verbose_name': 'Должность',
+                'verbose_name_plural': 'Должности',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='position_ref',
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.PROTECT,
+                related_name='employees', to='shop.position', verbose_name='Должность',
+                help_text='Например: Разработчик, Менеджер, Аналитик',
+            ),
+        ),
+        migrations.RunPython(fill_positions, fill_position_names),
+        migrations.RunPython(drop_product_search_index, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='product',
+            name='position',
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='position_ref',
+            field=models.ForeignKey(
+                blank=True, on_delete=django.db.models.deletion.PROTECT,
+                related_name='employees', to='shop.position', verbose_name='Должность',
+                help_text='Например: Разработчик, Менеджер, Аналитик',
+            ),
+        ),
+        migrations.RunPython(create_search_indexes, drop_position_search_index),
+    ]
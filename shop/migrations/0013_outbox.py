@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:11
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_positions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxOffset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sink', models.CharField(max_length=255, unique=True, verbose_name='Приемник')),
+                ('last_event_id', models.BigIntegerField(default=0, verbose_name='Последнее доставленное событие')),
+                ('delivered_count', models.PositiveBigIntegerField(default=0, verbose_name='Доставлено событий')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Смещение outbox',
+                'verbose_name_plural': 'Смещения outbox',
+            },
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(choices=[('payment.created', 'Выплата'), ('salary.changed', 'Изменение оклада')], max_length=50, verbose_name='Тема')),
+                ('employee_id', models.BigIntegerField(verbose_name='Сотрудник')),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Данные')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='Доставлено')),
+            ],
+            options={
+                'verbose_name': 'Событие outbox',
+                'verbose_name_plural': 'События outbox',
+                'ordering': ('id',),
+                'indexes': [models.Index(condition=models.Q(('delivered_at__isnull', True)), fields=['id'], name='shop_outbox_pending'), models.Index(fields=['delivered_at'], name='shop_outbox_delivered')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['product', 'bonus_amount'], name='shop_purchase_product_bonus'),
+        ),
+        migrations.AddIndex(
+            model_name='purchasearchive',
+            index=models.Index(fields=['product', 'bonus_amount'], name='shop_archive_product_bonus'),
+        ),
+    ]
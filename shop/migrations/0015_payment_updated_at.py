@@ -0,0 +1,41 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_updated_at(apps, schema_editor):
+    """Существующие выплаты не менялись после проведения"""
+    db = schema_editor.connection.alias
+    for name in ('Purchase', 'PurchaseArchive'):
+        model = apps.get_model('shop', name)
+        model.objects.using(db).update(updated_at=models.F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_bonus_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Изменена'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='purchasearchive',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Изменена'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['updated_at'], name='shop_purchase_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='purchasearchive',
+            index=models.Index(fields=['updated_at'], name='shop_archive_updated'),
+        ),
+    ]
@@ -1,5 +1,81 @@
 # shop/models.py
-from django.db import models
+import re
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.db.models import Case, F, Value, When
+
+from .expressions import BONUS_PATTERN
+
+# =========== УРОВЕНЬ ПО СТАЖУ ===========
+# Единое правило автоопределения уровня: по нему считается и колонка
+# Product.level в БД, и calculated_employee_type в Python
+JUNIOR_SERVICE_LIMIT = 2  # стаж < 2 лет -> Junior
+MIDDLE_SERVICE_LIMIT = 5  # стаж < 5 лет -> Middle, иначе Senior
+
+
+def level_by_service(years):
+    """Уровень, определенный только по стажу"""
+    if years < JUNIOR_SERVICE_LIMIT:
+        return 'JUNIOR'
+    elif years < MIDDLE_SERVICE_LIMIT:
+        return 'MIDDLE'
+    return 'SENIOR'
+
+
+# =========== СПРАВОЧНИК ДОЛЖНОСТЕЙ ===========
+DEFAULT_POSITION = "Специалист"
+
+
+def clean_position_name(name):
+    """Название должности без лишних пробелов"""
+    return ' '.join(str(name).split())
+
+
+def position_key(name):
+    """Ключ дедупликации: регистр и пробелы не различают должности"""
+    return clean_position_name(name).casefold()
+
+
+class PositionManager(models.Manager):
+    def resolve(self, name):
+        """Должность по названию; новая создается"""
+        position, _ = self.get_or_create(
+            key=position_key(name), defaults={'name': clean_position_name(name)},
+        )
+        return position
+
+
+class Position(models.Model):
+    """Должность. Сотрудники ссылаются на нее целым ключом, поэтому
+    группировки и фильтры по должности идут по индексу position_ref"""
+    name = models.CharField("Название", max_length=100)
+    key = models.CharField("Ключ", max_length=100, unique=True, editable=False)
+    
+    objects = PositionManager()
+    
+    class Meta:
+        verbose_name = "Должность"
+        verbose_name_plural = "Должности"
+        ordering = ('name',)
+    
+    def save(self, *args, **kwargs):
+        self.name = clean_position_name(self.name)
+        self.key = position_key(self.name)
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return self.name
+
+
+def position_names(ids=None):
+    """{id: название} — подписи для группировок по position_ref"""
+    positions = Position.objects.all()
+    if ids is not None:
+        positions = positions.filter(id__in=[pk for pk in ids if pk is not None])
+    return dict(positions.values_list('id', 'name'))
 
 
 class Product(models.Model):
@@ -9,12 +85,14 @@ class Product(models.Model):
     quantity = models.PositiveIntegerField("Стаж (лет)", default=1)
     
     # =========== НОВЫЕ ПОЛЯ ===========
-    position = models.CharField(
-        "Должность",
-        max_length=100,
-        blank=True,
-        null=True,
-        help_text="Например: Разработчик, Менеджер, Аналитик"
+    # Строка должности — свойство position (см. ниже)
+    position_ref = models.ForeignKey(
+        Position,
+        on_delete=models.PROTECT,
+        blank=True,  # пустая станет DEFAULT_POSITION в save()
+        related_name='employees',
+        verbose_name="Должность",
+        help_text="Например: Разработчик, Менеджер, Аналитик",
     )
     
     EMPLOYEE_TYPES = [
@@ -35,7 +113,53 @@ class Product(models.Model):
         help_text="Выберите уровень или оставьте пустым для автоопределения"
     )
     
+    # Действующий уровень считает сама БД: явно заданный employee_type,
+    # иначе — по стажу. Колонка пересчитывается при каждом изменении
+    # quantity (в т.ч. через update()) и индексирована для группировок.
+    level = models.GeneratedField(
+        expression=Case(
+            When(employee_type__in=[code for code, _ in EMPLOYEE_TYPES], then=F('employee_type')),
+            When(quantity__lt=JUNIOR_SERVICE_LIMIT, then=Value('JUNIOR')),
+            When(quantity__lt=MIDDLE_SERVICE_LIMIT, then=Value('MIDDLE')),
+            default=Value('SENIOR'),
+        ),
+        output_field=models.CharField(max_length=20, choices=EMPLOYEE_TYPES),
+        db_persist=True,
+        db_index=True,
+        choices=EMPLOYEE_TYPES,
+        verbose_name="Действующий уровень",
+    )
+    
+    # Отметка последнего изменения: по ней (вместе с числом строк)
+    # считается версия данных для условных GET-запросов
+    updated_at = models.DateTimeField("Изменено", auto_now=True, db_index=True)
+    
+    # Название должности, заданное строкой и еще не сохраненное
+    _position_name = None
+    # Оклад, прочитанный из БД: по нему outbox узнает об изменении оклада
+    _saved_price = None
+    
     # =========== СВОЙСТВА ДЛЯ ОБРАТНОЙ СОВМЕСТИМОСТИ ===========
+    @property
+    def position(self):
+        """Название должности. Для списков выбирайте сотрудников с
+        select_related('position_ref'), иначе каждое обращение — запрос"""
+        if self._position_name is not None:
+            return self._position_name
+        if self.position_ref_id is None:
+            return None
+        return self.position_ref.name
+    
+    @position.setter
+    def position(self, name):
+        """Должность строкой (Product(position="...")); запись в справочник — в save()"""
+        if name:
+            self._position_name = clean_position_name(name)
+        else:
+            # Пустая должность — при сохранении станет DEFAULT_POSITION
+            self._position_name = None
+            self.position_ref_id = None
+    
     @property
     def employee_name(self):
         """ФИО сотрудника"""
@@ -60,36 +184,40 @@ class Product(models.Model):
             return f"Специалист {self.name.split()[0]}"
         return "Специалист"
     
+    @property
+    def effective_level(self):
+        """Код действующего уровня — то же правило, что у колонки level.
+        Считается в Python, чтобы не перечитывать объект после save()"""
+        if self.employee_type in dict(self.EMPLOYEE_TYPES):
+            return self.employee_type
+        return level_by_service(self.quantity)
+    
     @property
     def calculated_employee_type(self):
         """Тип сотрудника: либо заданный, либо автоопределяемый"""
-        if self.employee_type:
-            for code, name in self.EMPLOYEE_TYPES:
-                if code == self.employee_type:
-                    return name.split(' (')[0]
-        
-        if self.quantity < 2:
-            return "Junior"
-        elif self.quantity < 5:
-            return "Middle"
-        else:
-            return "Senior"
+        return dict(self.EMPLOYEE_TYPES)[self.effective_level].split(' (')[0]
     
     # =========== МЕТОДЫ ===========
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_price = instance.__dict__.get('price')
+        return instance
+    
     def save(self, *args, **kwargs):
         """Автозаполнение полей при сохранении"""
-        if not self.position:
-            self.position = "Специалист"
+        if self._position_name:
+            self.position_ref = Position.objects.resolve(self._position_name)
+            self._position_name = None
+        elif self.position_ref_id is None:
+            self.position_ref = Position.objects.resolve(DEFAULT_POSITION)
         
-        if not self.employee_type:
-            if self.quantity < 2:
-                self.employee_type = 'JUNIOR'
-            elif self.quantity < 5:
-                self.employee_type = 'MIDDLE'
-            else:
-                self.employee_type = 'SENIOR'
+        # employee_type больше не заполняем: пустое значение означает
+        # "по стажу", и колонка level пересчитывается вместе со стажем
         
-        super().save(*args, **kwargs)
+        # Событие outbox (сигнал post_save) — в той же транзакции
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self)), savepoint=False):
+            super().save(*args, **kwargs)
     
     def calculate_salary(self, bonus=0, deductions=0):
         """Расчет итоговой зарплаты с премией и удержаниями"""
@@ -101,7 +229,20 @@ class Product(models.Model):
         return f"{self.name}"
 
 
-class Purchase(models.Model):
+def parse_bonus(value):
+    """Премия из строки Purchase.person: нечисловое значение — ноль"""
+    if value is not None and re.match(BONUS_PATTERN, str(value)):
+        return Decimal(value).quantize(Decimal('0.01'))
+    return Decimal('0.00')
+
+
+class PaymentBase(models.Model):
+    """Общие поля и методы выплаты: оперативной (Purchase) и архивной.
+
+    Суммы фиксируются на момент выплаты: оклад копируется из сотрудника,
+    поэтому изменение оклада не переписывает историю, а спискам, сортировке
+    по итогу и выгрузкам не нужен join с Product.
+    """
     # =========== НАСТРОЙКИ ВЫПЛАТ ===========
     PAYMENT_TYPES = [
         ('SALARY', 'Зарплата'),
@@ -130,6 +271,9 @@ class Purchase(models.Model):
         help_text="Например: Зарплата за январь, Премия за проект"
     )
     date = models.DateTimeField("Дата выплаты", auto_now_add=True)
+    # Время последнего изменения строки — для ETag страниц (shop.conditional);
+    # массовые update() выплат должны выставлять его явно
+    updated_at = models.DateTimeField("Изменена", auto_now=True)
     
     payment_type = models.CharField(
         "Тип выплаты",
@@ -140,28 +284,52 @@ class Purchase(models.Model):
         null=True,
     )
     
+    # =========== СУММЫ НА МОМЕНТ ВЫПЛАТЫ ===========
+    base_salary = models.DecimalField("Оклад на дату выплаты", max_digits=12, decimal_places=2, blank=True)
+    bonus_amount = models.DecimalField("Премия, руб.", max_digits=12, decimal_places=2, blank=True)
+    deductions = models.DecimalField("Удержания", max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    final_amount = models.DecimalField("Итого к выплате", max_digits=12, decimal_places=2, blank=True)
+    
+    class Meta:
+        abstract = True
+    
+    def fill_amounts(self):
+        """Оклад берется у сотрудника только для новой выплаты; премия
+        разбирается из person, итог пересчитывается"""
+        if self.base_salary is None:
+            self.base_salary = self.product.price
+        self.bonus_amount = parse_bonus(self.person)
+        self.deductions = Decimal(self.deductions or 0).quantize(Decimal('0.01'))
+        self.final_amount = Decimal(self.base_salary) + self.bonus_amount - self.deductions
+    
+    def save(self, *args, **kwargs):
+        self.fill_amounts()
+        # Событие outbox (сигнал post_save) — в той же транзакции
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self)), savepoint=False):
+            super().save(*args, **kwargs)
+    
     # =========== МЕТОДЫ ===========
     def get_bonus(self):
         """Получить сумму премии как число"""
-        try:
-            return float(self.person)
-        except (ValueError, TypeError):
-            return 0.0
+        if self.bonus_amount is not None:
+            return float(self.bonus_amount)
+        return float(parse_bonus(self.person))
+    
+    @classmethod
+    def payment_type_label(cls, code):
+        """Название типа выплаты; пустой или неизвестный код — зарплата"""
+        return dict(cls.PAYMENT_TYPES).get(code, "Зарплата")
     
     def get_payment_type_display_name(self):
         """Получить читаемое название типа выплаты"""
-        if self.payment_type:
-            for code, name in self.PAYMENT_TYPES:
-                if code == self.payment_type:
-                    return name
-        return "Зарплата"
+        return self.payment_type_label(self.payment_type)
     
     def calculate_final_salary(self):
-        """Рассчитать итоговую зарплату с учетом премии"""
+        """Итоговая сумма, зафиксированная при выплате"""
+        if self.final_amount is not None:
+            return float(self.final_amount)
         try:
-            base = float(self.product.price)
-            bonus = self.get_bonus()
-            return base + bonus
+            return float(self.product.price) + self.get_bonus() - float(self.deductions or 0)
         except (AttributeError, ValueError):
             return 0.0
     
@@ -200,4 +368,225 @@ class Purchase(models.Model):
             date_str = self.date.strftime('%d.%m.%Y') if self.date else 'н/д'
             return f"{payment_type}: {employee_name} - {final_salary:.2f} руб. ({date_str})"
         except AttributeError:
-            return "Выплата зарплаты"
\ No newline at end of file
+            return "Выплата зарплаты"
+
+
+class Purchase(PaymentBase):
+    """Выплата текущего (незакрытого) периода"""
+    
+    class Meta:
+        indexes = [
+            # Ведомость сотрудника: выборка по сотруднику в порядке дат
+            models.Index(fields=['product', 'date'], name='shop_purchase_product_date'),
+            # Выборки и удаление по сроку хранения (см. shop.deletion)
+            models.Index(fields=['date'], name='shop_purchase_date'),
+            # Сумма премий сотрудника только по индексу (топ по премиям)
+            models.Index(fields=['product', 'bonus_amount'], name='shop_purchase_product_bonus'),
+            # MAX(updated_at) для версии данных — по индексу
+            models.Index(fields=['updated_at'], name='shop_purchase_updated'),
+        ]
+
+
+# =========== АРХИВ ЗАКРЫТЫХ ПЕРИОДОВ ===========
+class PurchaseArchive(PaymentBase):
+    """Выплата закрытого месяца, перенесенная из Purchase командой archive_payments"""
+    id = models.BigIntegerField("ID выплаты", primary_key=True)  # id сохраняется
+    date = models.DateTimeField("Дата выплаты")
+    
+    class Meta:
+        verbose_name = "Архивная выплата"
+        verbose_name_plural = "Архив выплат"
+        indexes = [
+            models.Index(fields=['product', 'date'], name='shop_archive_product_date'),
+            models.Index(fields=['date'], name='shop_archive_date'),
+            models.Index(fields=['product', 'bonus_amount'], name='shop_archive_product_bonus'),
+            models.Index(fields=['updated_at'], name='shop_archive_updated'),
+        ]
+
+
+class PaymentPeriod(models.Model):
+    """Закрытый месяц: его выплаты лежат только в PurchaseArchive"""
+    month = models.DateField("Месяц", unique=True)  # первое число месяца
+    payments_count = models.PositiveIntegerField("Выплат в архиве", default=0)
+    closed_at = models.DateTimeField("Закрыт", auto_now=True)
+    
+    class Meta:
+        verbose_name = "Закрытый период"
+        verbose_name_plural = "Закрытые периоды"
+        ordering = ('-month',)
+    
+    def __str__(self):
+        return self.month.strftime('%m.%Y')
+
+
+
+# =========== МАССОВОЕ ИЗМЕНЕНИЕ ОКЛАДОВ ===========
+class SalaryAdjustment(models.Model):
+    """Журнал массовых изменений окладов (см. shop.salary_adjustment)"""
+    
+    SOURCES = [
+        ('admin', 'Админка'),
+        ('command', 'Команда adjust_salaries'),
+    ]
+    
+    percent = models.DecimalField("Изменение, %", max_digits=7, decimal_places=3, default=Decimal('0'))
+    amount = models.DecimalField("Надбавка, руб.", max_digits=12, decimal_places=2, default=Decimal('0'))
+    round_to = models.DecimalField("Округление до", max_digits=12, decimal_places=2, default=Decimal('0.01'))
+    selection = models.JSONField("Отбор сотрудников", default=dict, blank=True)
+    employees_count = models.PositiveIntegerField("Сотрудников")
+    fund_before = models.DecimalField("Фонд до", max_digits=16, decimal_places=2)
+    fund_after = models.DecimalField("Фонд после", max_digits=16, decimal_places=2)
+    groups = models.JSONField("По группам", default=list, blank=True)
+    source = models.CharField("Источник", max_length=20, choices=SOURCES, default='admin')
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Кто применил",
+    )
+    created_at = models.DateTimeField("Применено", auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Изменение окладов"
+        verbose_name_plural = "Изменения окладов"
+        ordering = ('-created_at',)
+    
+    @property
+    def fund_delta(self):
+        return self.fund_after - self.fund_before
+    
+    def __str__(self):
+        return f"{self.created_at:%d.%m.%Y %H:%M}: {self.employees_count} сотрудников, {self.fund_delta:+} руб."
+
+# =========== ФОНОВЫЕ ОТЧЕТЫ ===========
+class ReportJob(models.Model):
+    """Заказ отчета: файл формирует команда report_worker, страница статуса
+    показывает прогресс, готовый файл хранится до expires_at"""
+    
+    KINDS = [
+        ('payments', 'Выплаты'),
+        ('employees', 'Сотрудники'),
+    ]
+    FORMATS = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+        ('json', 'JSON'),
+    ]
+    PENDING, RUNNING, DONE, FAILED, EXPIRED = 'PENDING', 'RUNNING', 'DONE', 'FAILED', 'EXPIRED'
+    STATUSES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Формируется'),
+        (DONE, 'Готов'),
+        (FAILED, 'Ошибка'),
+        (EXPIRED, 'Удален по сроку'),
+    ]
+    
+    kind = models.CharField("Данные", max_length=20, choices=KINDS)
+    format = models.CharField("Формат", max_length=10, choices=FORMATS, default='csv')
+    filters = models.JSONField("Фильтры", default=dict, blank=True)
+    status = models.CharField("Статус", max_length=10, choices=STATUSES, default=PENDING)
+    rows_total = models.PositiveIntegerField("Строк всего", null=True, blank=True)
+    rows_done = models.PositiveIntegerField("Строк готово", default=0)
+    file_name = models.CharField("Файл", max_length=200, blank=True)
+    file_size = models.PositiveBigIntegerField("Размер, байт", null=True, blank=True)
+    error = models.TextField("Ошибка", blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Заказал",
+    )
+    created_at = models.DateTimeField("Создан", auto_now_add=True)
+    started_at = models.DateTimeField("Начат", null=True, blank=True)
+    # Обновляется вместе с прогрессом: по нему находятся задания упавших воркеров
+    heartbeat_at = models.DateTimeField("Последний прогресс", null=True, blank=True)
+    finished_at = models.DateTimeField("Завершен", null=True, blank=True)
+    expires_at = models.DateTimeField("Хранится до", null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Отчет"
+        verbose_name_plural = "Отчеты"
+        ordering = ('-created_at',)
+        indexes = [
+            # Очередь воркера: старейшее задание в статусе PENDING
+            models.Index(fields=['status', 'created_at'], name='shop_reportjob_queue'),
+        ]
+    
+    @property
+    def progress(self):
+        """Доля готовых строк, 0..1 (None, пока число строк неизвестно)"""
+        if self.status == self.DONE:
+            return 1.0
+        if not self.rows_total:
+            return None
+        return min(self.rows_done / self.rows_total, 1.0)
+    
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED, self.EXPIRED)
+    
+    def __str__(self):
+        return f"Отчет #{self.pk}: {self.get_kind_display()}, {self.format.upper()} ({self.get_status_display()})"
+
+
+# =========== OUTBOX СОБЫТИЙ ===========
+class OutboxEvent(models.Model):
+    """Событие для внешних систем (учет, HR). Пишется в той же транзакции,
+    что и выплата или изменение оклада; доставляет команда
+    outbox_dispatcher (см. shop.outbox)"""
+    
+    PAYMENT_CREATED = 'payment.created'
+    SALARY_CHANGED = 'salary.changed'
+    TOPICS = [
+        (PAYMENT_CREATED, 'Выплата'),
+        (SALARY_CHANGED, 'Изменение оклада'),
+    ]
+    
+    topic = models.CharField("Тема", max_length=50, choices=TOPICS)
+    # Не внешний ключ: события переживают удаление сотрудника
+    employee_id = models.BigIntegerField("Сотрудник")
+    payload = models.JSONField("Данные", encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    delivered_at = models.DateTimeField("Доставлено", null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Событие outbox"
+        verbose_name_plural = "События outbox"
+        ordering = ('id',)
+        indexes = [
+            # Очередь диспетчера: только недоставленные, по порядку id
+            models.Index(fields=['id'], condition=models.Q(delivered_at__isnull=True), name='shop_outbox_pending'),
+            # Очистка доставленных по сроку хранения
+            models.Index(fields=['delivered_at'], name='shop_outbox_delivered'),
+        ]
+    
+    def as_message(self):
+        """Сообщение для приемника: id — ключ для отбрасывания повторов"""
+        return {
+            'id': self.pk,
+            'topic': self.topic,
+            'employee_id': self.employee_id,
+            'created_at': self.created_at,
+            'payload': self.payload,
+        }
+    
+    def __str__(self):
+        return f"#{self.pk} {self.topic}: сотрудник {self.employee_id}"
+
+
+class OutboxOffset(models.Model):
+    """Прогресс доставки в приемник"""
+    
+    sink = models.CharField("Приемник", max_length=255, unique=True)
+    last_event_id = models.BigIntegerField("Последнее доставленное событие", default=0)
+    delivered_count = models.PositiveBigIntegerField("Доставлено событий", default=0)
+    updated_at = models.DateTimeField("Обновлено", auto_now=True)
+    
+    class Meta:
+        verbose_name = "Смещение outbox"
+        verbose_name_plural = "Смещения outbox"
+    
+    def __str__(self):
+        return f"{self.sink}: до #{self.last_event_id}"
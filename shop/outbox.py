@@ -0,0 +1,235 @@
+"""Transactional outbox: события о выплатах и окладах для внешних систем.
+
+Учету и HR нужно знать о каждой выплате и каждом изменении оклада. Вместо
+опроса Purchase и выгрузок CSV событие пишется в OutboxEvent в той же
+транзакции, что и само изменение: нет выплаты — нет события, и наоборот.
+
+Команда outbox_dispatcher читает недоставленные события пачками по id
+(SELECT ... FOR UPDATE SKIP LOCKED: несколько диспетчеров не ждут друг
+друга и не берут одни и те же строки), передает пачку приемнику и в той же
+транзакции отмечает ее доставленной. Доставка "хотя бы один раз": если
+транзакция не зафиксировалась после отправки, пачка уйдет повторно —
+приемник отбрасывает повторы по id события. Доставленные события
+удаляются пачками по сроку хранения.
+
+Приемники (SHOP_OUTBOX_SINK, адрес — SHOP_OUTBOX_TARGET):
+    file   — JSON Lines в файл, каждая пачка дописывается и сбрасывается на диск;
+    socket — JSON Lines в Unix-сокет;
+    http   — пачка JSON-массивом в POST (заглушка для будущей шины).
+"""
+import json
+import os
+import socket
+import urllib.request
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .deletion import delete_in_batches
+from .models import OutboxEvent, OutboxOffset
+
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_SEND_TIMEOUT = 10
+
+
+# =========== ЗАПИСЬ СОБЫТИЙ ===========
+def payment_created(sender, instance, created, raw=False, **kwargs):
+    """post_save Purchase: новая выплата"""
+    if not created or raw:
+        return
+    OutboxEvent.objects.create(
+        topic=OutboxEvent.PAYMENT_CREATED,
+        employee_id=instance.product_id,
+        payload={
+            'payment_id': instance.pk,
+            'payment_type': instance.payment_type,
+            'base_salary': instance.base_salary,
+            'bonus_amount': instance.bonus_amount,
+            'deductions': instance.deductions,
+            'final_amount': instance.final_amount,
+            'date': instance.date,
+            'description': instance.address,
+        },
+    )
+
+
+def salary_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """post_save Product: новый сотрудник или изменившийся оклад"""
+    if raw or (update_fields is not None and 'price' not in update_fields):
+        return
+    salary = Decimal(str(instance.price)).quantize(Decimal('0.01'))
+    previous = instance._saved_price
+    if not created and previous is not None and Decimal(previous) == salary:
+        return
+    OutboxEvent.objects.create(
+        topic=OutboxEvent.SALARY_CHANGED,
+        employee_id=instance.pk,
+        payload={
+            'salary': salary,
+            'previous_salary': None if created else previous,
+            'adjustment_id': None,
+        },
+    )
+    instance._saved_price = salary
+
+
+def record_adjusted_salaries(employees, new_salary, adjustment, batch_size=OUTBOX_BATCH_SIZE):
+    """События для сотрудников, которых изменит массовый UPDATE (сигналов он
+    не шлет). Вызывать в транзакции изменения до UPDATE: прежний оклад
+    читается из строки (она блокируется до конца транзакции), новый считает
+    то же выражение new_salary. Оклад, не изменившийся после округления,
+    события не дает"""
+    rows = (
+        employees.select_for_update(of=('self',))
+        .annotate(new_salary=new_salary).exclude(new_salary=F('price'))
+        .order_by('id').values_list('id', 'price', 'new_salary')
+        .iterator(chunk_size=batch_size)
+    )
+    while batch := list(islice(rows, batch_size)):
+        OutboxEvent.objects.bulk_create([
+            OutboxEvent(
+                topic=OutboxEvent.SALARY_CHANGED,
+                employee_id=employee_id,
+                payload={
+                    'salary': _money(salary),
+                    'previous_salary': _money(previous),
+                    'adjustment_id': adjustment.pk,
+                },
+            )
+            for employee_id, previous, salary in batch
+        ])
+
+
+def _money(value):
+    return Decimal(value).quantize(Decimal('0.01'))
+
+# =========== ПРИЕМНИКИ ===========
+def encode_messages(events):
+    """Пачка событий в JSON Lines"""
+    return ''.join(
+        json.dumps(event.as_message(), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+        for event in events
+    ).encode('utf-8')
+
+
+class FileSink:
+    """Дописывает пачку в файл JSON Lines"""
+    kind = 'file'
+
+    def __init__(self, target):
+        self.path = target
+
+    def send(self, events):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'ab') as stream:
+            stream.write(encode_messages(events))
+            stream.flush()
+            # Пачка отмечается доставленной только после записи на диск
+            os.fsync(stream.fileno())
+
+
+class SocketSink:
+    """Передает пачку в Unix-сокет потребителя"""
+    kind = 'socket'
+
+    def __init__(self, target):
+        self.path = target
+
+    def send(self, events):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(OUTBOX_SEND_TIMEOUT)
+            connection.connect(self.path)
+            connection.sendall(encode_messages(events))
+
+
+class HttpSink:
+    """POST пачки JSON-массивом; ответ не 2xx — пачка не доставлена"""
+    kind = 'http'
+
+    def __init__(self, target):
+        self.url = target
+
+    def send(self, events):
+        body = json.dumps(
+            [event.as_message() for event in events], cls=DjangoJSONEncoder, ensure_ascii=False,
+        ).encode('utf-8')
+        request = urllib.request.Request(
+            self.url, data=body, method='POST', headers={'Content-Type': 'application/json'},
+        )
+        # HTTPError (4xx/5xx) прерывает доставку пачки
+        with urllib.request.urlopen(request, timeout=OUTBOX_SEND_TIMEOUT):
+            pass
+
+
+OUTBOX_SINKS = {'file': FileSink, 'socket': SocketSink, 'http': HttpSink}
+
+
+def outbox_sink(kind=None, target=None):
+    kind = kind or settings.SHOP_OUTBOX_SINK
+    return OUTBOX_SINKS[kind](target or settings.SHOP_OUTBOX_TARGET)
+
+
+def sink_name(sink):
+    """Имя приемника для OutboxOffset: вид и адрес"""
+    target = getattr(sink, 'path', None) or getattr(sink, 'url', '')
+    return f"{sink.kind}:{target}"[:OutboxOffset._meta.get_field('sink').max_length]
+
+
+# =========== ДОСТАВКА ===========
+def dispatch_batch(sink, batch_size=OUTBOX_BATCH_SIZE):
+    """Доставить старейшую пачку недоставленных событий. Возвращает число
+    доставленных; ошибка приемника откатывает пачку в очередь"""
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.filter(delivered_at__isnull=True)
+            .order_by('id')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        if not events:
+            return 0
+        sink.send(events)
+
+        OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(delivered_at=timezone.now())
+        _advance_offset(sink_name(sink), events[-1].pk, len(events))
+    return len(events)
+
+
+def _advance_offset(name, last_event_id, count):
+    """Сдвинуть смещение приемника одним UPDATE после отправки: строку
+    смещения диспетчеры блокируют лишь до фиксации своей пачки, а не на
+    время sink.send()"""
+    values = {
+        'last_event_id': Greatest(F('last_event_id'), Value(last_event_id)),
+        'delivered_count': F('delivered_count') + count,
+    }
+    if OutboxOffset.objects.filter(sink=name).update(**values):
+        return
+    try:
+        with transaction.atomic():
+            OutboxOffset.objects.create(sink=name, last_event_id=last_event_id, delivered_count=count)
+    except IntegrityError:
+        # Строку только что создал другой диспетчер
+        OutboxOffset.objects.filter(sink=name).update(**values)
+
+
+def prune_delivered(retention_hours=None, batch_size=OUTBOX_BATCH_SIZE * 10, now=None):
+    """Удалить события, доставленные раньше срока хранения"""
+    if retention_hours is None:
+        retention_hours = settings.SHOP_OUTBOX_RETENTION_HOURS
+    cutoff = (now or timezone.now()) - timedelta(hours=retention_hours)
+    delivered = OutboxEvent.objects.filter(delivered_at__lt=cutoff).order_by('delivered_at')
+    return delete_in_batches(delivered, batch_size)
+
+
+def pending_count():
+    return OutboxEvent.objects.filter(delivered_at__isnull=True).count()
+
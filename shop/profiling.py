@@ -0,0 +1,122 @@
+"""Профилирование одного запроса: cProfile, SQL и память (tracemalloc).
+
+Используется ProfilingMiddleware только для персонала и только по явному
+запросу, поэтому в обычных запросах не стоит ничего. tracemalloc глобален
+для процесса, так что одновременно профилируется не больше одного запроса.
+"""
+import cProfile
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack
+
+from django.db import connections
+
+PROFILE_TOP_FUNCTIONS = 30
+PROFILE_TOP_LINES = 20
+PROFILE_MAX_STATEMENTS = 200
+
+_profile_lock = threading.Lock()
+
+
+class ProfileBusy(Exception):
+    """Другой запрос уже профилируется"""
+
+
+class SQLRecorder:
+    """Execute wrapper: текст и время каждого запроса ко всем БД"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'ms': (time.perf_counter() - started) * 1000,
+                'many': many,
+            })
+
+    def report(self):
+        repeated = Counter(statement['sql'] for statement in self.statements)
+        return {
+            'count': len(self.statements),
+            'total_ms': sum(statement['ms'] for statement in self.statements),
+            'slowest': sorted(self.statements, key=lambda s: s['ms'], reverse=True)[:PROFILE_MAX_STATEMENTS],
+            'repeated': [
+                {'sql': sql, 'count': count}
+                for sql, count in repeated.most_common(10) if count > 1
+            ],
+        }
+
+
+def profile_call(func, *args, **kwargs):
+    """Выполняет func под профилировщиками; возвращает (результат, отчет).
+
+    Пик памяти — за весь вызов; по строкам — память, еще занятая в момент
+    возврата (например, отрендеренный ответ), крупнейшие строки первыми.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfileBusy("Уже идет профилирование другого запроса")
+    try:
+        recorder = SQLRecorder()
+        profiler = cProfile.Profile()
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            profiler.enable()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                profiler.disable()
+        elapsed = time.perf_counter() - started
+
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        if not was_tracing:
+            tracemalloc.stop()
+    finally:
+        _profile_lock.release()
+
+    return result, {
+        'total_ms': elapsed * 1000,
+        'functions': _top_functions(profiler),
+        'sql': recorder.report(),
+        'memory': {
+            'peak_bytes': peak,
+            'top_lines': [
+                {'line': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 'bytes': stat.size, 'blocks': stat.count}
+                for stat in snapshot.statistics('lineno')[:PROFILE_TOP_LINES]
+            ],
+        },
+    }
+
+
+def _top_functions(profiler):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, lineno, name), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            'function': f"{filename}:{lineno}({name})",
+            'calls': ncalls,
+            'own_ms': tottime * 1000,
+            'cumulative_ms': cumtime * 1000,
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:PROFILE_TOP_FUNCTIONS]
@@ -0,0 +1,312 @@
+"""Фоновые отчеты: выгрузка выплат и сотрудников в CSV, XLSX или JSON.
+
+Представление только создает ReportJob в статусе PENDING. Отдельный
+процесс (команда report_worker) забирает задания из очереди, читает строки
+пачками по id (keyset, без OFFSET) и пишет их в файл <id>-<токен>.<формат>.part
+в SHOP_REPORT_DIR, обновляя прогресс после каждой пачки. Готовый файл
+переименовывается без .part, поэтому недописанный файл никогда не отдается.
+
+Задание забирается условным UPDATE ... WHERE status = 'PENDING': из
+нескольких воркеров его получает тот, чей UPDATE изменил строку, — это
+работает в любой СУБД. Файл хранится SHOP_REPORT_TTL_HOURS часов, затем
+cleanup_reports удаляет его и помечает задание EXPIRED.
+
+openpyxl (XLSX) — необязательная зависимость и импортируется при первом
+обращении.
+"""
+import csv
+import json
+import os
+import secrets
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.utils import timezone
+
+from .archive import payment_querysets
+from .models import Product, ReportJob
+from .routers import read_from_replica
+
+REPORT_CHUNK_SIZE = 5000
+
+# (поле values_list, заголовок колонки)
+PAYMENT_COLUMNS = (
+    ('id', 'ID выплаты'),
+    ('product_id', 'ID сотрудника'),
+    ('employee_name', 'Сотрудник'),
+    ('payment_type', 'Тип выплаты'),
+    ('base_salary', 'Оклад'),
+    ('bonus_amount', 'Премия'),
+    ('deductions', 'Удержания'),
+    ('final_amount', 'Итого'),
+    ('date', 'Дата'),
+    ('address', 'Комментарий'),
+)
+EMPLOYEE_COLUMNS = (
+    ('id', 'ID'),
+    ('name', 'ФИО'),
+    ('position_name', 'Должность'),
+    ('level', 'Уровень'),
+    ('price', 'Оклад'),
+    ('quantity', 'Стаж (лет)'),
+    ('updated_at', 'Изменено'),
+)
+REPORT_COLUMNS = {'payments': PAYMENT_COLUMNS, 'employees': EMPLOYEE_COLUMNS}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImproperlyConfigured("Для отчетов XLSX нужен пакет openpyxl: pip install openpyxl")
+    return openpyxl
+
+
+def xlsx_available():
+    try:
+        _openpyxl()
+    except ImproperlyConfigured:
+        return False
+    return True
+
+
+def report_dir():
+    return Path(settings.SHOP_REPORT_DIR)
+
+
+def report_path(job):
+    return report_dir() / job.file_name
+
+
+def delete_report_file(job):
+    if job.file_name:
+        report_path(job).unlink(missing_ok=True)
+
+
+# =========== ВЫБОРКИ ===========
+def _day_start(value):
+    return timezone.make_aware(datetime.combine(value, time.min))
+
+
+def report_querysets(kind, filters):
+    """Querysets строк отчета; фильтры — из ReportJob.filters.
+
+    Выплаты: date_from, date_to (даты ISO, включительно), employee,
+    payment_type. Сотрудники: level, position (id должности), min_salary,
+    max_salary.
+    """
+    if kind == 'payments':
+        start = end = None
+        if filters.get('date_from'):
+            start = _day_start(datetime.fromisoformat(filters['date_from']).date())
+        if filters.get('date_to'):
+            end = _day_start(datetime.fromisoformat(filters['date_to']).date() + timedelta(days=1))
+        querysets = []
+        for payments in payment_querysets(start, end):
+            if filters.get('employee'):
+                payments = payments.filter(product_id=filters['employee'])
+            if filters.get('payment_type'):
+                payments = payments.filter(payment_type=filters['payment_type'])
+            querysets.append(payments.annotate(employee_name=F('product__name')))
+        return querysets
+
+    if kind == 'employees':
+        employees = Product.objects.annotate(position_name=F('position_ref__name'))
+        if filters.get('level'):
+            employees = employees.filter(level=filters['level'])
+        if filters.get('position'):
+            employees = employees.filter(position_ref_id=filters['position'])
+        if filters.get('min_salary') not in (None, ''):
+            employees = employees.filter(price__gte=Decimal(str(filters['min_salary'])))
+        if filters.get('max_salary') not in (None, ''):
+            employees = employees.filter(price__lte=Decimal(str(filters['max_salary'])))
+        return [employees]
+
+    raise ValueError(f"Неизвестный вид отчета: {kind}")
+
+
+def iter_chunks(querysets, fields, chunk_size=REPORT_CHUNK_SIZE):
+    """Пачки кортежей fields по возрастанию id; каждая пачка — один запрос
+    WHERE id > последний ORDER BY id LIMIT chunk_size"""
+    for queryset in querysets:
+        last_id = None
+        while True:
+            chunk = queryset.order_by('id')
+            if last_id is not None:
+                chunk = chunk.filter(id__gt=last_id)
+            rows = list(chunk.values_list(*fields)[:chunk_size])
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1][0]
+            if len(rows) < chunk_size:
+                break
+
+
+# =========== ФОРМАТЫ ===========
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _local(value):
+    """Даты — в местном времени без зоны (в XLSX/CSV зона не хранится)"""
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+class CSVReportWriter:
+    def __init__(self, path, columns):
+        # utf-8-sig: Excel открывает кириллицу без ручного выбора кодировки
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([title for _, title in columns])
+
+    def write(self, rows):
+        self.writer.writerows([[_local(value) for value in row] for row in rows])
+
+    def close(self):
+        self.file.close()
+
+
+class JSONReportWriter:
+    """Массив объектов, записываемый по мере поступления строк"""
+
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.fields = [field for field, _ in columns]
+        self.first = True
+        self.file.write('[')
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write('\n' if self.first else ',\n')
+            self.first = False
+            json.dump(
+                {field: _json_value(value) for field, value in zip(self.fields, row)},
+                self.file, ensure_ascii=False,
+            )
+
+    def close(self):
+        self.file.write('\n]\n')
+        self.file.close()
+
+
+class XLSXReportWriter:
+    """Write-only книга openpyxl: строки сбрасываются на диск, а не копятся"""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.workbook = _openpyxl().Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Отчет')
+        self.sheet.append([title for _, title in columns])
+
+    def write(self, rows):
+        for row in rows:
+            self.sheet.append([_local(value) for value in row])
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+REPORT_WRITERS = {'csv': CSVReportWriter, 'json': JSONReportWriter, 'xlsx': XLSXReportWriter}
+
+
+# =========== ОЧЕРЕДЬ ===========
+def claim_next_job():
+    """Забрать старейшее задание из очереди или вернуть None"""
+    while True:
+        job = ReportJob.objects.filter(status=ReportJob.PENDING).order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        now = timezone.now()
+        claimed = ReportJob.objects.filter(pk=job.pk, status=ReportJob.PENDING).update(
+            status=ReportJob.RUNNING, started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            job.status, job.started_at, job.heartbeat_at = ReportJob.RUNNING, now, now
+            return job
+        # Задание перехватил другой воркер — берем следующее
+
+
+def run_job(job, chunk_size=REPORT_CHUNK_SIZE):
+    """Сформировать файл задания; ошибка сохраняется в job.error"""
+    columns = REPORT_COLUMNS[job.kind]
+    fields = [field for field, _ in columns]
+    job.file_name = f"{job.pk}-{secrets.token_hex(8)}.{job.format}"
+    path = report_path(job)
+    partial = path.with_name(path.name + '.part')
+    report_dir().mkdir(parents=True, exist_ok=True)
+
+    try:
+        # Отчет — чтение большого объема: с реплики, если она есть
+        with read_from_replica():
+            querysets = report_querysets(job.kind, job.filters)
+            job.rows_total = sum(queryset.count() for queryset in querysets)
+            ReportJob.objects.filter(pk=job.pk).update(rows_total=job.rows_total, file_name=job.file_name)
+
+            writer = REPORT_WRITERS[job.format](partial, columns)
+            try:
+                for rows in iter_chunks(querysets, fields, chunk_size):
+                    writer.write(rows)
+                    job.rows_done += len(rows)
+                    ReportJob.objects.filter(pk=job.pk).update(
+                        rows_done=job.rows_done, heartbeat_at=timezone.now(),
+                    )
+            finally:
+                writer.close()
+        os.replace(partial, path)
+    except Exception as e:
+        partial.unlink(missing_ok=True)
+        job.status = ReportJob.FAILED
+        job.error = f"{type(e).__name__}: {e}"
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+
+    job.status = ReportJob.DONE
+    job.file_size = path.stat().st_size
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + timedelta(hours=settings.SHOP_REPORT_TTL_HOURS)
+    job.save(update_fields=['status', 'rows_total', 'rows_done', 'file_name', 'file_size', 'finished_at', 'expires_at'])
+    return job
+
+
+def requeue_stale_jobs(timeout=timedelta(minutes=10)):
+    """Вернуть в очередь задания, по которым воркер давно не сообщал прогресс
+    (процесс упал или был убит); возвращает их число"""
+    return ReportJob.objects.filter(
+        status=ReportJob.RUNNING, heartbeat_at__lt=timezone.now() - timeout,
+    ).update(status=ReportJob.PENDING, rows_done=0, started_at=None, heartbeat_at=None)
+
+
+def cleanup_reports(now=None):
+    """Удалить файлы с истекшим сроком и брошенные .part; возвращает число
+    истекших заданий"""
+    now = now or timezone.now()
+    expired = list(ReportJob.objects.filter(status=ReportJob.DONE, expires_at__lte=now))
+    for job in expired:
+        delete_report_file(job)
+    ReportJob.objects.filter(pk__in=[job.pk for job in expired]).update(status=ReportJob.EXPIRED)
+
+    # Недописанные файлы старше срока хранения остались от упавших воркеров
+    if report_dir().is_dir():
+        limit = (now - timedelta(hours=settings.SHOP_REPORT_TTL_HOURS)).timestamp()
+        for partial in report_dir().glob('*.part'):
+            if partial.stat().st_mtime < limit:
+                partial.unlink(missing_ok=True)
+    return len(expired)
@@ -0,0 +1,201 @@
+"""Штат в памяти воркера: типизированные массивы NumPy вместо моделей ORM.
+
+Для сводок по всему штату нужны только оклад, стаж и уровень, поэтому
+каждый процесс держит их в плотных массивах, упорядоченных по id:
+    ids      int64  — id сотрудника
+    salary   int64  — оклад в копейках (без ошибок округления float)
+    service  int16  — стаж, лет
+    level    int8   — индекс уровня в LEVEL_CODES
+Это 19 байт на сотрудника (~18 МБ на 1 млн).
+
+Версия данных — (число строк, максимальный id, последний updated_at); ее
+проверка стоит трех запросов по индексам. При обновлении дочитываются
+строки с updated_at не раньше прошлой проверки минус ROSTER_COMMIT_WINDOW,
+удаления находятся сверкой id. Обновление не меняет массивы на месте, а
+подменяет объект Roster целиком, поэтому читающие потоки всегда видят
+согласованный снимок.
+
+updated_at ставится в save(), до коммита, поэтому максимум updated_at
+не годится как курсор: транзакция, начатая раньше, но зафиксированная
+позже другой, приносит строку со временем меньше уже известного и версию
+не меняет. Окно от времени прошлой проверки находит такую строку, если
+от save() до коммита прошло не больше ROSTER_COMMIT_WINDOW (расхождение
+часов серверов входит в этот запас). Более долгие транзакции исправляет
+полная загрузка, которая выполняется не реже раза в
+ROSTER_FULL_RELOAD_SECONDS — это верхняя граница устаревания штата.
+"""
+import threading
+import time
+from datetime import timedelta
+from itertools import islice
+
+import numpy as np
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Product
+
+LEVEL_CODES = [code for code, _ in Product.EMPLOYEE_TYPES]
+ROSTER_CHUNK_SIZE = 50_000
+# Если изменилось больше этой доли штата, дешевле перечитать всё
+FULL_RELOAD_SHARE = 0.25
+# Насколько раньше прошлой проверки перечитываются строки: допустимое
+# время от save() до коммита
+ROSTER_COMMIT_WINDOW = timedelta(minutes=1)
+# Верхняя граница устаревания для транзакций длиннее окна
+ROSTER_FULL_RELOAD_SECONDS = 3600
+
+ROSTER_FIELDS = ('id', 'price', 'quantity', 'level')
+
+
+class Roster:
+    """Снимок штата: массивы после создания не меняются"""
+
+    def __init__(self, ids, salary, service, level, version, checked_at, loaded_at=None):
+        self.ids = ids
+        self.salary = salary
+        self.service = service
+        self.level = level
+        self.version = version
+        # Когда начато последнее чтение из БД; refresh_roster сдвигает
+        # отметку и у объекта, который возвращает без изменений
+        self.checked_at = checked_at
+        # Время (time.monotonic) последней полной загрузки
+        self.loaded_at = time.monotonic() if loaded_at is None else loaded_at
+
+    def __len__(self):
+        return self.ids.size
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.salary.nbytes + self.service.nbytes + self.level.nbytes
+
+    def level_counts(self):
+        counts = np.bincount(self.level, minlength=len(LEVEL_CODES))
+        return dict(zip(LEVEL_CODES, counts.tolist()))
+
+    def salary_summary(self):
+        """Фонд, среднее, медиана, минимум и максимум окладов в рублях"""
+        if not len(self):
+            return {}
+        fund = int(self.salary.sum())
+        return {
+            'total_salary_fund': fund / 100,
+            'average_salary': fund / 100 / len(self),
+            'median_salary': float(np.median(self.salary)) / 100,
+            'max_salary': int(self.salary.max()) / 100,
+            'min_salary': int(self.salary.min()) / 100,
+        }
+
+
+def current_version():
+    # Отдельные запросы: одиночный MAX берется из индекса, а общий агрегат
+    # вместе с COUNT заставил бы SQLite читать всю таблицу
+    employees = Product.objects.order_by()
+    return (
+        employees.count(),
+        employees.aggregate(value=Max('id'))['value'],
+        employees.aggregate(value=Max('updated_at'))['value'],
+    )
+
+
+def _arrays(rows):
+    """Массивы из кортежей ROSTER_FIELDS, читая пачками"""
+    level_index = {code: i for i, code in enumerate(LEVEL_CODES)}
+    parts = []
+    rows = iter(rows)
+    while chunk := list(islice(rows, ROSTER_CHUNK_SIZE)):
+        parts.append((
+            np.fromiter((row[0] for row in chunk), dtype=np.int64, count=len(chunk)),
+            np.fromiter((round(row[1] * 100) for row in chunk), dtype=np.int64, count=len(chunk)),
+            np.fromiter((row[2] for row in chunk), dtype=np.int16, count=len(chunk)),
+            np.fromiter((level_index[row[3]] for row in chunk), dtype=np.int8, count=len(chunk)),
+        ))
+    if not parts:
+        return (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int16), np.empty(0, np.int8))
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def load_roster(version=None, checked_at=None):
+    """Полная загрузка штата"""
+    checked_at = checked_at or timezone.now()
+    version = version or current_version()
+    rows = Product.objects.order_by('id').values_list(*ROSTER_FIELDS).iterator(ROSTER_CHUNK_SIZE)
+    return Roster(*_arrays(rows), version=version, checked_at=checked_at)
+
+
+def refresh_roster(roster):
+    """Roster для текущей версии данных: тот же объект, если ничего не менялось"""
+    checked_at = timezone.now()
+    version = current_version()
+    if time.monotonic() - roster.loaded_at >= ROSTER_FULL_RELOAD_SECONDS:
+        return load_roster(version, checked_at)
+    count = version[0]
+    if roster.version[2] is None or count == 0:
+        if version != roster.version:
+            return load_roster(version, checked_at)
+        roster.checked_at = checked_at
+        return roster
+
+    since = roster.checked_at - ROSTER_COMMIT_WINDOW
+    if version[2] != roster.version[2] and version[2] < since:
+        # Изменение старше окна (транзакция длиннее него): дочитывать нечего
+        return load_roster(version, checked_at)
+
+    # Окно перечитывается и при неизменной версии: в нем могут оказаться
+    # строки транзакций, зафиксированных после прошлой проверки
+    changed = Product.objects.filter(updated_at__gte=since)
+    if changed.count() > FULL_RELOAD_SHARE * count:
+        return load_roster(version, checked_at)
+    new_ids, new_salary, new_service, new_level = _arrays(
+        changed.order_by('id').values_list(*ROSTER_FIELDS).iterator(ROSTER_CHUNK_SIZE)
+    )
+
+    ids, salary, service, level = roster.ids, roster.salary, roster.service, roster.level
+    positions = np.searchsorted(ids, new_ids)
+    existing = positions < ids.size
+    existing[existing] = ids[positions[existing]] == new_ids[existing]
+    added = ~existing
+    if version == roster.version and not added.any() and (
+        np.array_equal(salary[positions], new_salary)
+        and np.array_equal(service[positions], new_service)
+        and np.array_equal(level[positions], new_level)
+    ):
+        roster.checked_at = checked_at
+        return roster
+
+    # Измененные — на свои места в копиях массивов, новые — в конец
+    salary, service, level = salary.copy(), service.copy(), level.copy()
+    salary[positions[existing]] = new_salary[existing]
+    service[positions[existing]] = new_service[existing]
+    level[positions[existing]] = new_level[existing]
+    if added.any():
+        ids = np.concatenate([ids, new_ids[added]])
+        salary = np.concatenate([salary, new_salary[added]])
+        service = np.concatenate([service, new_service[added]])
+        level = np.concatenate([level, new_level[added]])
+        order = np.argsort(ids, kind='stable')
+        ids, salary, service, level = ids[order], salary[order], service[order], level[order]
+
+    if ids.size != count:
+        # Были удаления: оставляем только существующие id
+        alive = np.fromiter(
+            Product.objects.order_by().values_list('id', flat=True).iterator(ROSTER_CHUNK_SIZE),
+            dtype=np.int64,
+        )
+        keep = np.isin(ids, alive, assume_unique=True)
+        ids, salary, service, level = ids[keep], salary[keep], service[keep], level[keep]
+
+    return Roster(ids, salary, service, level, version, checked_at, loaded_at=roster.loaded_at)
+
+
+_roster = None
+_roster_lock = threading.Lock()
+
+
+def get_roster():
+    """Актуальный штат этого процесса (загружается при первом обращении)"""
+    global _roster
+    with _roster_lock:
+        _roster = load_roster() if _roster is None else refresh_roster(_roster)
+        return _roster
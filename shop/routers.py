@@ -0,0 +1,55 @@
+"""Маршрутизация чтения на реплику.
+
+Реплика (алиас 'replica') подключается, только если задан
+REPLICA_DATABASE_URL. На нее уходят чтения запросов, которые
+ReplicaRoutingMiddleware пометил как "только чтение": безопасные методы
+без недавней собственной записи пользователя. Всё остальное — записи,
+чтения внутри транзакции, фоновые команды — идет на основную БД.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+# Читать ли с реплики в текущем запросе (контекст, а не поток — годится и для ASGI)
+_read_from_replica = ContextVar('shop_read_from_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    """Разрешает (или запрещает) чтение с реплики внутри блока"""
+    token = _read_from_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not (_read_from_replica.get() and replica_configured()):
+            return DEFAULT_DB_ALIAS
+        # Внутри транзакции читаем то, что только что записали
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия основной БД, связи между ними допустимы
+        databases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
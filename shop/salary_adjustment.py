@@ -0,0 +1,156 @@
+"""Массовое изменение окладов одним UPDATE.
+
+Правило: новый оклад = округлить(оклад * (1 + percent / 100) + amount,
+до кратного round_to). Оно задается выражением над F('price'), поэтому:
+- предпросмотр — один агрегатный запрос с GROUP BY по группам (уровень,
+  должность): число сотрудников, фонд до и после, минимум и максимум
+  нового оклада;
+- применение — один UPDATE ... SET price = <выражение> в транзакции,
+  сколько бы сотрудников ни попало под правило.
+
+Фонд "после" в журнале не предсказывается, а пересчитывается по строкам,
+которые изменил этот UPDATE (у них одинаковый updated_at). События outbox
+об изменении оклада пишутся в той же транзакции перед UPDATE, пока в
+строках еще прежний оклад.
+"""
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Min, Sum, Value
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from .live import notify_payroll_changed
+from .models import Product, SalaryAdjustment
+from .outbox import record_adjusted_salaries
+
+SALARY_FIELD = Product._meta.get_field('price')
+# Наибольший оклад, который помещается в Product.price
+MAX_SALARY = Decimal(10) ** (SALARY_FIELD.max_digits - SALARY_FIELD.decimal_places) - Decimal('0.01')
+MONEY = DecimalField(max_digits=16, decimal_places=2)
+DEFAULT_GROUP_BY = ('level', 'position')
+# Поле группировки -> колонка: должность группируется по целому ключу
+GROUP_COLUMNS = {'position': 'position_ref'}
+
+
+def new_salary_expression(percent=0, amount=0, round_to=Decimal('0.01')):
+    """Выражение нового оклада для UPDATE и агрегатов"""
+    percent, amount, round_to = Decimal(percent), Decimal(amount), Decimal(round_to)
+    if round_to <= 0:
+        raise ValidationError("Шаг округления должен быть положительным")
+    if percent <= -100:
+        raise ValidationError("Снижение не может быть 100% и больше")
+
+    salary = F('price')
+    if percent:
+        salary = salary * Value(1 + percent / 100, output_field=MONEY)
+    if amount:
+        salary = salary + Value(amount, output_field=MONEY)
+    rounded = Round(ExpressionWrapper(salary / Value(round_to, output_field=MONEY), output_field=MONEY))
+    return ExpressionWrapper(rounded * Value(round_to, output_field=MONEY), output_field=MONEY)
+
+
+def _money(value):
+    return Decimal(value or 0).quantize(Decimal('0.01'))
+
+
+def preview_adjustment(employees, percent=0, amount=0, round_to=Decimal('0.01'), group_by=DEFAULT_GROUP_BY):
+    """Итоги правила по queryset сотрудников — один запрос с GROUP BY.
+
+    Возвращает словарь: employees, fund_before, fund_after, delta,
+    min_new, max_new и groups — список групп с теми же полями.
+    """
+    new_salary = new_salary_expression(percent, amount, round_to)
+    columns = [GROUP_COLUMNS.get(field, field) for field in group_by]
+    # Название должности — агрегат в той же группе (группировка по id)
+    labels = {'position_name': Min('position_ref__name')} if 'position' in group_by else {}
+    rows = (
+        employees.order_by()
+        .values(*columns)
+        .annotate(
+            **labels,
+            employees=Count('id'),
+            fund_before=Sum('price'),
+            fund_after=Sum(new_salary),
+            min_new=Min(new_salary),
+            max_new=Max(new_salary),
+        )
+    )
+
+    groups = []
+    for row in rows:
+        group = {field: row[column] for field, column in zip(group_by, columns)}
+        if 'position' in group:
+            group['position'] = row['position_name']
+        group.update(
+            employees=row['employees'],
+            fund_before=_money(row['fund_before']),
+            fund_after=_money(row['fund_after']),
+            min_new=_money(row['min_new']),
+            max_new=_money(row['max_new']),
+        )
+        group['delta'] = group['fund_after'] - group['fund_before']
+        groups.append(group)
+    groups.sort(key=lambda group: tuple(str(group[field] or '') for field in group_by))
+
+    summary = {
+        'employees': sum(group['employees'] for group in groups),
+        'fund_before': sum((group['fund_before'] for group in groups), Decimal('0.00')),
+        'fund_after': sum((group['fund_after'] for group in groups), Decimal('0.00')),
+        'min_new': min((group['min_new'] for group in groups), default=None),
+        'max_new': max((group['max_new'] for group in groups), default=None),
+        'groups': groups,
+    }
+    summary['delta'] = summary['fund_after'] - summary['fund_before']
+    return summary
+
+
+def validate_preview(preview):
+    """Новые оклады должны быть неотрицательны и помещаться в Product.price"""
+    if preview['min_new'] is not None and preview['min_new'] < 0:
+        raise ValidationError(f"Оклад станет отрицательным: {preview['min_new']}")
+    if preview['max_new'] is not None and preview['max_new'] > MAX_SALARY:
+        raise ValidationError(f"Оклад превысит {MAX_SALARY}: {preview['max_new']}")
+
+
+def _json_groups(groups):
+    return [
+        {key: str(value) if isinstance(value, Decimal) else value for key, value in group.items()}
+        for group in groups
+    ]
+
+
+def apply_adjustment(employees, percent=0, amount=0, round_to=Decimal('0.01'),
+                     selection=None, user=None, source='admin', group_by=DEFAULT_GROUP_BY):
+    """Применить правило одним UPDATE и записать SalaryAdjustment"""
+    with transaction.atomic():
+        preview = preview_adjustment(employees, percent, amount, round_to, group_by)
+        validate_preview(preview)
+
+        # Запись журнала нужна событиям до UPDATE; число сотрудников и фонд
+        # "после" уточняются по его результату
+        adjustment = SalaryAdjustment.objects.create(
+            percent=Decimal(percent),
+            amount=Decimal(amount),
+            round_to=Decimal(round_to),
+            selection=selection or {},
+            employees_count=preview['employees'],
+            fund_before=preview['fund_before'],
+            fund_after=preview['fund_after'],
+            groups=_json_groups(preview['groups']),
+            source=source,
+            created_by=user,
+        )
+        new_salary = new_salary_expression(percent, amount, round_to)
+        record_adjusted_salaries(employees, new_salary, adjustment)
+
+        # updated_at — версия данных для кеша и штата в памяти (update() не
+        # трогает auto_now); по этой же отметке пересчитываем фонд "после"
+        changed_at = timezone.now()
+        adjustment.employees_count = employees.order_by().update(price=new_salary, updated_at=changed_at)
+        fund_after = Product.objects.filter(updated_at=changed_at).aggregate(fund=Sum('price'))['fund']
+        adjustment.fund_after = _money(fund_after)
+        adjustment.save(update_fields=['employees_count', 'fund_after'])
+        notify_payroll_changed()
+        return adjustment
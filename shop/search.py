@@ -0,0 +1,131 @@
+"""Индексированный поиск сотрудников и выплат.
+
+PostgreSQL: триграммные GIN-индексы (pg_trgm) по UPPER(поле) — именно это
+выражение строит lookup icontains, поэтому обычный фильтр идет по индексу.
+SQLite: FTS5-таблицы с токенизатором trigram, которые синхронизируются
+триггерами. На остальных СУБД остается обычный icontains.
+
+Должность ищется в справочнике shop_position, а сотрудники отбираются по
+найденным целым ключам position_ref.
+"""
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Position
+
+# FTS5 trigram ищет подстроки не короче трех символов
+MIN_FTS_TERM_LENGTH = 3
+
+# Таблица FTS5 -> (исходная таблица, индексируемые колонки)
+SQLITE_FTS_TABLES = {
+    'shop_product_fts': ('shop_product', ('name',)),
+    'shop_position_fts': ('shop_position', ('name',)),
+    'shop_purchase_fts': ('shop_purchase', ('address',)),
+}
+
+
+# =========== ПОИСК ===========
+def search_employees(queryset, term):
+    """Сотрудники, у которых ФИО или должность содержат term"""
+    term = term.strip()
+    if not term:
+        return queryset
+    if _use_fts(queryset, term):
+        return queryset.filter(
+            Q(id__in=_fts_rowids('shop_product_fts', term))
+            | Q(position_ref__in=_fts_rowids('shop_position_fts', term))
+        )
+    positions = Position.objects.filter(name__icontains=term).values('id')
+    return queryset.filter(Q(name__icontains=term) | Q(position_ref__in=positions))
+
+
+def search_payments(queryset, term):
+    """Выплаты по ФИО сотрудника или описанию выплаты"""
+    term = term.strip()
+    if not term:
+        return queryset
+    if _use_fts(queryset, term):
+        return queryset.filter(
+            Q(id__in=_fts_rowids('shop_purchase_fts', term))
+            | Q(product_id__in=_fts_rowids('shop_product_fts', term))
+        )
+    return queryset.filter(Q(product__name__icontains=term) | Q(address__icontains=term))
+
+
+def _use_fts(queryset, term):
+    return connections[queryset.db].vendor == 'sqlite' and len(term) >= MIN_FTS_TERM_LENGTH
+
+
+def _fts_rowids(table, term):
+    # Фраза в кавычках: trigram-токенизатор ищет её как подстроку
+    phrase = '"%s"' % term.replace('"', '""')
+    return RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [phrase])
+
+
+# =========== ИНДЕКСЫ ===========
+def install_search_indexes(connection):
+    """Создает поисковые индексы для текущей СУБД (идемпотентно).
+
+    В SQLite пересоздание таблицы при миграциях удаляет её триггеры,
+    поэтому функция вызывается и из миграции, и после каждого migrate.
+    Таблицы, которых еще нет (ранние миграции), пропускаются.
+    """
+    if connection.vendor == 'postgresql':
+        _install_postgresql_trigram(connection)
+    elif connection.vendor == 'sqlite':
+        _install_sqlite_fts(connection)
+
+
+def _install_postgresql_trigram(connection):
+    with connection.cursor() as cursor:
+        tables = set(connection.introspection.table_names(cursor))
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, column in (('shop_product', 'name'),
+                              ('shop_position', 'name'),
+                              ('shop_purchase', 'address')):
+            if table not in tables:
+                continue
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm '
+                f'ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+            )
+
+
+def _install_sqlite_fts(connection):
+    with connection.cursor() as cursor:
+        tables = set(connection.introspection.table_names(cursor))
+        for fts_table, (table, columns) in SQLITE_FTS_TABLES.items():
+            if table not in tables:
+                continue
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{fts_table}_%'],
+            )
+            if cursor.fetchone()[0] == 3:
+                continue
+
+            column_list = ', '.join(columns)
+            new_values = ', '.join(f'new.{c}' for c in columns)
+            old_values = ', '.join(f'old.{c}' for c in columns)
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+                f"{column_list}, content='{table}', content_rowid='id', tokenize='trigram')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) "
+                f"VALUES ('delete', old.id, {old_values}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE ON {table} BEGIN "
+                f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) "
+                f"VALUES ('delete', old.id, {old_values}); "
+                f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+            )
+            # Триггеров не было — индекс мог отстать от таблицы
+            cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
@@ -0,0 +1,60 @@
+"""Синтетический штат и выплаты для бенчмарков и нагрузочных тестов"""
+import random
+from decimal import Decimal
+
+from .models import Position, Product, Purchase
+
+POSITIONS = [
+    "Разработчик", "Аналитик", "Тестировщик", "Менеджер", "Дизайнер",
+    "Бухгалтер", "Администратор", "Инженер", "Специалист",
+]
+LEVELS = [None, None, None, 'LEAD', 'MANAGER']  # чаще — уровень по стажу
+FIRST_NAMES = ["Иван", "Петр", "Анна", "Мария", "Сергей", "Ольга", "Дмитрий", "Елена"]
+LAST_NAMES = ["Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Волков"]
+
+
+def seed_payroll(employees, payments=0, batch_size=10000, seed=42, progress=None):
+    """Создает employees сотрудников и payments выплат пачками bulk_create.
+
+    Возвращает список id созданных сотрудников.
+    """
+    rng = random.Random(seed)
+    position_ids = [Position.objects.resolve(name).id for name in POSITIONS]
+    employee_ids = []
+    salaries = {}
+
+    for start in range(0, employees, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, employees)):
+            batch.append(Product(
+                name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}",
+                price=Decimal(rng.randrange(30000, 300000, 100)),
+                quantity=rng.randint(0, 25),
+                position_ref_id=rng.choice(position_ids),
+                employee_type=rng.choice(LEVELS),
+            ))
+        for obj in Product.objects.bulk_create(batch):
+            employee_ids.append(obj.id)
+            salaries[obj.id] = obj.price
+        if progress:
+            progress(f"сотрудники: {len(employee_ids)}/{employees}")
+
+    payment_types = [code for code, _ in Purchase.PAYMENT_TYPES]
+    for start in range(0, payments, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, payments)):
+            payment = Purchase(
+                product_id=rng.choice(employee_ids),
+                person=str(rng.randrange(0, 50000, 500)),
+                address=f"Выплата {i}",
+                payment_type=rng.choice(payment_types),
+            )
+            # bulk_create не вызывает save(): суммы заполняем сами
+            payment.base_salary = salaries[payment.product_id]
+            payment.fill_amounts()
+            batch.append(payment)
+        Purchase.objects.bulk_create(batch)
+        if progress:
+            progress(f"выплаты: {min(start + batch_size, payments)}/{payments}")
+
+    return employee_ids
@@ -0,0 +1,205 @@
+"""Журнал медленных запросов с планами EXPLAIN.
+
+Execute wrapper ставится на каждое новое соединение (сигнал
+connection_created), если задан порог SHOP_SLOW_QUERY_MS. Запросы быстрее
+порога стоят одного perf_counter(). Медленный запрос попадает в очередь;
+фоновый поток снимает для него EXPLAIN (один раз на отпечаток запроса) и
+пишет JSON-строку в логгер "shop.slow_queries" — в настройках это
+RotatingFileHandler. Команда slow_queries сводит журнал по отпечаткам.
+"""
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger('shop.slow_queries')
+
+SLOW_QUERY_QUEUE_SIZE = 1000
+EXPLAIN_CACHE_SIZE = 1000
+
+# Представление или действие админки, выполняющее запрос (ставит QuerySourceMiddleware)
+_query_source = ContextVar('shop_query_source', default=None)
+
+_explaining = threading.local()
+_queue = queue.Queue(maxsize=SLOW_QUERY_QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+_plans = {}
+
+
+# =========== ИСТОЧНИК ЗАПРОСОВ ===========
+def set_query_source(source):
+    """Отметить, какое представление выполняет запросы текущего контекста.
+    Возвращает токен для reset_query_source"""
+    return _query_source.set(source)
+
+
+def reset_query_source(token):
+    """Вернуть источник, бывший до set_query_source"""
+    _query_source.reset(token)
+
+
+# =========== НОРМАЛИЗАЦИЯ ===========
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """Текст запроса без значений: литералы и параметры -> ?, IN (?, ?, ...) -> IN (...)"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.md5(normalized_sql.encode()).hexdigest()[:16]
+
+
+# =========== ПЕРЕХВАТ ===========
+def slow_query_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        threshold = settings.SHOP_SLOW_QUERY_MS
+        if threshold is not None and duration_ms >= threshold and not getattr(_explaining, 'active', False):
+            _enqueue(context['connection'].alias, sql, params, many, duration_ms)
+
+
+def install_slow_query_wrapper(sender, connection, **kwargs):
+    """Обработчик connection_created: ставит обертку один раз на соединение"""
+    if settings.SHOP_SLOW_QUERY_MS is None:
+        return
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
+
+
+def _enqueue(alias, sql, params, many, duration_ms):
+    normalized = normalize_sql(sql)
+    entry = {
+        'timestamp': timezone.now().isoformat(),
+        'fingerprint': fingerprint(normalized),
+        'sql': normalized,
+        'params_count': len(params) if params else 0,
+        'many': many,
+        'duration_ms': round(duration_ms, 3),
+        'database': alias,
+        'source': _query_source.get(),
+    }
+    try:
+        _queue.put_nowait((entry, sql, None if many else params))
+    except queue.Full:
+        return
+    _ensure_worker()
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_drain, name='slow-query-log', daemon=True)
+            _worker.start()
+
+
+def _drain():
+    while True:
+        entry, sql, params = _queue.get()
+        try:
+            entry['plan'] = _explain(entry, sql, params)
+            logger.warning(json.dumps(entry, ensure_ascii=False, default=str), extra={'slow_query': entry})
+        except Exception:
+            logger.exception("Не удалось записать медленный запрос")
+        finally:
+            _queue.task_done()
+
+
+def _explain(entry, sql, params):
+    """План запроса, снятый в фоновом потоке своим соединением; кэш по отпечатку"""
+    if entry['fingerprint'] in _plans:
+        return _plans[entry['fingerprint']]
+    if params is None or not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+
+    connection = connections[entry['database']]
+    prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    _explaining.active = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            plan = [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception as e:
+        plan = [f'EXPLAIN не выполнен: {e}']
+    finally:
+        _explaining.active = False
+        # Фоновый поток живет долго — не держим соединение между запросами
+        connection.close()
+
+    if len(_plans) < EXPLAIN_CACHE_SIZE:
+        _plans[entry['fingerprint']] = plan
+    return plan
+
+
+def wait_for_slow_query_log():
+    """Дождаться записи всех медленных запросов из очереди (тесты, команды)"""
+    _queue.join()
+
+
+# =========== ЖУРНАЛ ===========
+class JsonLinesFormatter(logging.Formatter):
+    """Одна запись журнала — одна JSON-строка"""
+
+    def format(self, record):
+        entry = getattr(record, 'slow_query', None)
+        if entry is None:
+            entry = {'timestamp': timezone.now().isoformat(), 'message': record.getMessage()}
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def aggregate_log(lines):
+    """Сводка по отпечаткам: число, суммарное/среднее/максимальное время,
+    источники, пример запроса и последний план; самые дорогие первыми"""
+    groups = {}
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if 'fingerprint' not in entry:
+            continue
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'],
+            'sql': entry['sql'],
+            'count': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'sources': {},
+            'plan': None,
+            'last_seen': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        source = entry.get('source') or '-'
+        group['sources'][source] = group['sources'].get(source, 0) + 1
+        group['plan'] = entry.get('plan') or group['plan']
+        group['last_seen'] = max(group['last_seen'] or '', entry['timestamp'])
+
+    for group in groups.values():
+        group['mean_ms'] = group['total_ms'] / group['count']
+    return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
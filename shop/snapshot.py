@@ -0,0 +1,261 @@
+"""Колоночные снимки (Parquet) штата и выплат для аналитики и выгрузок.
+
+Снимок — каталог <SHOP_SNAPSHOT_DIR>/<метка времени>/:
+    employees.parquet
+    payments/year=2024/month=03/part-0.parquet   (секции в стиле Hive)
+    manifest.json — пишется последним, каталог без него не считается снимком
+
+Выплаты объединены с сотрудником и типизированы: суммы — decimal(12, 2),
+зафиксированные в выплате (оклад на дату выплаты, премия, удержания, итог).
+Строки читаются серверным курсором (.iterator) и пишутся группами по chunk_size, поэтому
+память не зависит от объема таблиц. Выплаты идут в порядке даты, и каждая
+секция пишется подряд одним файлом. Если настроена реплика, читаем с нее.
+
+pyarrow — необязательная зависимость и импортируется при первом обращении.
+"""
+import json
+import os
+import shutil
+from functools import lru_cache
+from itertools import groupby, islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from .models import Product, Purchase, PurchaseArchive
+from .routers import read_from_replica
+
+SNAPSHOT_CHUNK_SIZE = 50_000
+MANIFEST_NAME = 'manifest.json'
+
+# Снимок денормализован: должность — название из справочника
+EMPLOYEE_COLUMNS = (
+    'id', 'name', 'position_ref__name', 'level', 'employee_type', 'price', 'quantity', 'updated_at',
+)
+PAYMENT_COLUMNS = (
+    'id', 'date', 'product_id', 'product__name', 'product__position_ref__name', 'product__level',
+    'payment_type', 'address', 'base_salary', 'bonus_amount', 'deductions', 'final_amount',
+)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImproperlyConfigured("Для снимков Parquet нужен пакет pyarrow") from e
+    return pyarrow
+
+
+def _schemas(pa):
+    money = pa.decimal128(12, 2)
+    moment = pa.timestamp('us', tz='UTC')
+    employees = pa.schema([
+        ('id', pa.int64()),
+        ('name', pa.string()),
+        ('position', pa.string()),
+        ('level', pa.string()),
+        ('employee_type', pa.string()),
+        ('base_salary', money),
+        ('years_of_service', pa.int32()),
+        ('updated_at', moment),
+    ])
+    payments = pa.schema([
+        ('id', pa.int64()),
+        ('date', moment),
+        ('employee_id', pa.int64()),
+        ('employee_name', pa.string()),
+        ('position', pa.string()),
+        ('level', pa.string()),
+        ('payment_type', pa.string()),
+        ('description', pa.string()),
+        ('base_salary', money),
+        ('bonus', money),
+        ('deductions', money),
+        ('amount', money),
+    ])
+    return employees, payments
+
+
+def _batch(pa, schema, rows):
+    columns = zip(*rows)
+    return pa.record_batch(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+# =========== ВЫГРУЗКА ===========
+def snapshot_root():
+    return Path(settings.SHOP_SNAPSHOT_DIR)
+
+
+def export_snapshot(root=None, chunk_size=SNAPSHOT_CHUNK_SIZE, progress=None):
+    """Пишет новый снимок и возвращает его manifest"""
+    pa = _pyarrow()
+    employees_schema, payments_schema = _schemas(pa)
+    root = Path(root or snapshot_root())
+    started = timezone.now()
+    name = started.strftime('%Y%m%dT%H%M%S%fZ')
+    tmp = root / f'.{name}.tmp'
+    tmp.mkdir(parents=True)
+
+    try:
+        with read_from_replica():
+            employees = _write_employees(pa, employees_schema, tmp, chunk_size)
+            if progress:
+                progress(f"Сотрудников: {employees}")
+            payments, partitions = _write_payments(pa, payments_schema, tmp, chunk_size, progress)
+
+        manifest = {
+            'name': name,
+            'created_at': started.isoformat(),
+            'employees': employees,
+            'payments': payments,
+            'partitions': partitions,
+        }
+        with open(tmp / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, root / name)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return manifest
+
+
+def _write_employees(pa, schema, directory, chunk_size):
+    rows = Product.objects.order_by('id').values_list(*EMPLOYEE_COLUMNS).iterator(chunk_size)
+    count = 0
+    with pa.parquet.ParquetWriter(directory / 'employees.parquet', schema) as writer:
+        for chunk in _chunks(rows, chunk_size):
+            writer.write_batch(_batch(pa, schema, chunk))
+            count += len(chunk)
+        if not count:
+            writer.write_table(schema.empty_table())
+    return count
+
+
+def _write_payments(pa, schema, directory, chunk_size, progress=None):
+    """Архив, затем оперативная таблица: вместе — по возрастанию даты"""
+    (directory / 'payments').mkdir()
+    count = 0
+    partitions = []
+    writer = None
+    try:
+        for model in (PurchaseArchive, Purchase):
+            rows = (
+                model.objects
+                .order_by('date', 'id')
+                .values_list(*PAYMENT_COLUMNS)
+                .iterator(chunk_size)
+            )
+            for chunk in _chunks(rows, chunk_size):
+                for key, group in groupby(chunk, key=lambda row: _partition(row[1])):
+                    if not partitions or partitions[-1] != key:
+                        if writer:
+                            writer.close()
+                        partitions.append(key)
+                        path = directory / 'payments' / key / f'part-{partitions.count(key) - 1}.parquet'
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        writer = pa.parquet.ParquetWriter(path, schema)
+                    writer.write_batch(_batch(pa, schema, list(group)))
+                count += len(chunk)
+                if progress:
+                    progress(f"Выплат: {count}")
+    finally:
+        if writer:
+            writer.close()
+    return count, sorted(set(partitions))
+
+
+def _partition(moment):
+    local = timezone.localtime(moment)
+    return f'year={local.year}/month={local.month:02d}'
+
+
+# =========== ЧТЕНИЕ ===========
+def list_snapshots(root=None):
+    """Manifest завершенных снимков, новые первыми"""
+    root = Path(root or snapshot_root())
+    if not root.is_dir():
+        return []
+    manifests = []
+    for path in sorted(root.iterdir(), reverse=True):
+        if (path / MANIFEST_NAME).is_file():
+            with open(path / MANIFEST_NAME, encoding='utf-8') as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def latest_snapshot(root=None):
+    """Путь к последнему завершенному снимку или None"""
+    snapshots = list_snapshots(root)
+    return Path(root or snapshot_root()) / snapshots[0]['name'] if snapshots else None
+
+
+def prune_snapshots(keep, root=None):
+    """Удаляет завершенные снимки, кроме keep последних"""
+    root = Path(root or snapshot_root())
+    removed = [manifest['name'] for manifest in list_snapshots(root)[keep:]]
+    for name in removed:
+        shutil.rmtree(root / name)
+    return removed
+
+
+@lru_cache(maxsize=4)
+def read_snapshot(path, start=None, end=None):
+    """(сотрудники, выплаты) снимка как два DataFrame; выплаты — за [start, end).
+
+    Файлы отображаются в память (mmap) и читаются только нужные колонки;
+    диапазон дат отсекает группы строк по статистике Parquet (выплаты
+    записаны по порядку дат). Снимок неизменен, поэтому результат
+    кэшируется по пути и периоду.
+    """
+    pa = _pyarrow()
+    path = Path(path)
+    employees = pa.parquet.read_table(
+        path / 'employees.parquet',
+        columns=['name', 'position', 'base_salary', 'years_of_service', 'level'],
+        memory_map=True,
+    )
+    payments = pa.dataset.dataset(
+        path / 'payments', format='parquet', partitioning='hive',
+        filesystem=pa.fs.LocalFileSystem(use_mmap=True),
+    ).to_table(
+        columns=['employee_id', 'employee_name', 'payment_type', 'bonus', 'amount'],
+        filter=_date_filter(pa, start, end),
+    )
+
+    df = employees.set_column(
+        2, 'base_salary', employees.column('base_salary').cast(pa.float64()),
+    ).rename_columns(
+        ['name', 'position', 'base_salary', 'years_of_service', 'employee_type'],
+    ).to_pandas()
+    for name in ('bonus', 'amount'):
+        index = payments.schema.get_field_index(name)
+        payments = payments.set_column(index, name, payments.column(name).cast(pa.float64()))
+    return df, payments.to_pandas()
+
+
+def _date_filter(pa, start, end):
+    """Выражение pyarrow для date в [start, end) или None"""
+    moment = pa.timestamp('us', tz='UTC')
+    date = pa.dataset.field('date')
+    conditions = []
+    if start is not None:
+        conditions.append(date >= pa.scalar(start, type=moment))
+    if end is not None:
+        conditions.append(date < pa.scalar(end, type=moment))
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else conditions[0] & conditions[1]
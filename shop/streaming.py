@@ -0,0 +1,335 @@
+"""Потоковая статистика с ограниченной памятью и слиянием частичных итогов.
+
+Таблицы читаются пачками (серверный курсор), и каждая пачка сворачивается в
+небольшие сливаемые накопители:
+- Moments — количество, сумма, среднее и дисперсия (Welford; пачки и
+  частичные итоги сливаются формулой Чана), минимум и максимум — точно;
+- CoMoments — совместные моменты для корреляции Пирсона, точно;
+- KLLSketch — квантили (медиана, квартили) с ошибкой по рангу: при k=200
+  ошибка не превышает ~1.3% ранга с вероятностью 99%; пока значений меньше
+  емкости нижнего уровня (~k), квантили точные. Память O(k log(n / k)).
+
+Любые два PayrollStats, посчитанные по непересекающимся частям данных
+(пачкам, диапазонам id, процессам), сливаются merge() в итог по их
+объединению — порядок слияния на результат не влияет (для KLL — в пределах
+той же ошибки).
+"""
+import math
+
+import numpy as np
+
+from .archive import payment_querysets, top_employees_by_bonus
+from .models import Product, Purchase, position_names
+
+STREAM_CHUNK_SIZE = 20_000
+KLL_K = 200
+
+
+class Moments:
+    """Количество, сумма, среднее, дисперсия, минимум и максимум"""
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        """Добавить массив значений (одна пачка)"""
+        values = np.asarray(values, dtype=float)
+        if not values.size:
+            return
+        chunk = Moments()
+        chunk.n = values.size
+        chunk.total = float(values.sum())
+        chunk.mean = chunk.total / chunk.n
+        chunk.m2 = float(((values - chunk.mean) ** 2).sum())
+        chunk.min = float(values.min())
+        chunk.max = float(values.max())
+        self.merge(chunk)
+
+    def merge(self, other):
+        if not other.n:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def std(self):
+        """Выборочное стандартное отклонение (как pandas .std())"""
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+
+
+class CoMoments:
+    """Совместные моменты пары (x, y) для корреляции Пирсона"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean_x = self.mean_y = 0.0
+        self.m2_x = self.m2_y = self.c_xy = 0.0
+
+    def add(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if not x.size:
+            return
+        chunk = CoMoments()
+        chunk.n = x.size
+        chunk.mean_x, chunk.mean_y = float(x.mean()), float(y.mean())
+        dx, dy = x - chunk.mean_x, y - chunk.mean_y
+        chunk.m2_x = float((dx * dx).sum())
+        chunk.m2_y = float((dy * dy).sum())
+        chunk.c_xy = float((dx * dy).sum())
+        self.merge(chunk)
+
+    def merge(self, other):
+        if not other.n:
+            return self
+        n = self.n + other.n
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        weight = self.n * other.n / n
+        self.m2_x += other.m2_x + dx * dx * weight
+        self.m2_y += other.m2_y + dy * dy * weight
+        self.c_xy += other.c_xy + dx * dy * weight
+        self.mean_x += dx * other.n / n
+        self.mean_y += dy * other.n / n
+        self.n = n
+        return self
+
+    @property
+    def correlation(self):
+        if self.m2_x <= 0 or self.m2_y <= 0:
+            return None
+        return self.c_xy / math.sqrt(self.m2_x * self.m2_y)
+
+
+class KLLSketch:
+    """Квантильный скетч KLL (Karnin, Lang, Liberty, 2016).
+
+    Уровень h хранит значения с весом 2**h. Переполненный уровень
+    сортируется и уплотняется: каждое второе значение (со случайным сдвигом)
+    переходит на уровень выше. Емкость уровней убывает к нижним как c**глубина.
+    """
+
+    def __init__(self, k=KLL_K, c=2 / 3, seed=None):
+        self.k = k
+        self.c = c
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.c ** depth * self.k)), 2)
+
+    @property
+    def size(self):
+        return sum(items.size for items in self.levels)
+
+    @property
+    def max_size(self):
+        return sum(self.capacity(level) for level in range(len(self.levels)))
+
+    @property
+    def count(self):
+        """Сколько значений представляет скетч"""
+        return sum(items.size << level for level, items in enumerate(self.levels))
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        if values.size:
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+        return self
+
+    def _compress(self):
+        while self.size >= self.max_size:
+            for level, items in enumerate(self.levels):
+                if items.size >= self.capacity(level):
+                    if level + 1 == len(self.levels):
+                        self.levels.append(np.empty(0))
+                    items = np.sort(items)
+                    # Нечетный остаток остается на уровне, остальное уплотняется парами
+                    keep = items[-1:] if items.size % 2 else items[:0]
+                    paired = items[:items.size - keep.size]
+                    promoted = paired[self.rng.integers(2)::2]
+                    self.levels[level] = keep
+                    self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                    break
+
+    def quantiles(self, qs):
+        """Приближенные квантили для долей qs (0..1)"""
+        values = np.concatenate(self.levels)
+        if not values.size:
+            return [None for _ in qs]
+        weights = np.concatenate([
+            np.full(items.size, 1 << level, dtype=np.int64) for level, items in enumerate(self.levels)
+        ])
+        order = np.argsort(values, kind='stable')
+        values, cumulative = values[order], np.cumsum(weights[order])
+        total = cumulative[-1]
+        result = []
+        for q in qs:
+            # Линейная интерполяция между соседними рангами — как quantile() в pandas
+            position = q * (total - 1)
+            lower, upper = math.floor(position), math.ceil(position)
+            low, high = values[np.searchsorted(cumulative, [lower + 1, upper + 1])]
+            result.append(float(low + (high - low) * (position - lower)))
+        return result
+
+
+# =========== АНАЛИТИКА ===========
+class PayrollStats:
+    """Сливаемый частичный итог аналитики по части сотрудников и выплат"""
+
+    def __init__(self, seed=None):
+        self.salary = Moments()
+        self.salary_quantiles = KLLSketch(seed=seed)
+        self.service_salary = CoMoments()
+        self.by_position = {}
+        self.by_level = {}
+        self.bonuses = Moments()
+        self.by_payment_type = {}
+
+    def add_employees(self, rows):
+        """rows — кортежи (оклад, стаж, id должности, уровень)"""
+        if not rows:
+            return
+        salary = np.array([float(row[0]) for row in rows])
+        service = np.array([row[1] for row in rows], dtype=float)
+        self.salary.add(salary)
+        self.salary_quantiles.add(salary)
+        self.service_salary.add(service, salary)
+
+        for groups, column in ((self.by_position, 2), (self.by_level, 3)):
+            keys = np.array([row[column] for row in rows], dtype=object)
+            for key in set(keys.tolist()):
+                if key is None and groups is self.by_position:
+                    continue
+                groups.setdefault(key, Moments()).add(salary[keys == key])
+
+    def add_payments(self, rows):
+        """rows — кортежи (премия, тип выплаты, итог)"""
+        if not rows:
+            return
+        self.bonuses.add([float(row[0]) for row in rows])
+        amounts = np.array([float(row[2]) for row in rows])
+        labels = np.array([Purchase.payment_type_label(row[1]) for row in rows], dtype=object)
+        for label in set(labels.tolist()):
+            self.by_payment_type.setdefault(label, Moments()).add(amounts[labels == label])
+
+    def merge(self, other):
+        self.salary.merge(other.salary)
+        self.salary_quantiles.merge(other.salary_quantiles)
+        self.service_salary.merge(other.service_salary)
+        for groups, other_groups in ((self.by_position, other.by_position), (self.by_level, other.by_level)):
+            for key, moments in other_groups.items():
+                groups.setdefault(key, Moments()).merge(moments)
+        self.bonuses.merge(other.bonuses)
+        for label, moments in other.by_payment_type.items():
+            self.by_payment_type.setdefault(label, Moments()).merge(moments)
+        return self
+
+    def as_analytics(self, names=None):
+        """Словарь analytics в том же виде, что у остальных бэкендов.
+        Должности в частичных итогах — id; names ({id: название}) дает подписи"""
+        if not self.salary.n:
+            return {}
+        by_position = self.by_position
+        if names is not None:
+            by_position = {names[key]: m for key, m in by_position.items()}
+        q1, median, q3 = self.salary_quantiles.quantiles([0.25, 0.5, 0.75])
+        analytics = {
+            'total_employees': self.salary.n,
+            'by_position': {
+                'count': {key: m.n for key, m in by_position.items()},
+                'mean': {key: m.mean for key, m in by_position.items()},
+                'sum': {key: m.total for key, m in by_position.items()},
+            },
+            'by_type': {key: m.mean for key, m in self.by_level.items()},
+            'salary_stats': {
+                'mean': self.salary.mean,
+                'median': median,
+                'std': self.salary.std,
+                'min': self.salary.min,
+                'max': self.salary.max,
+            },
+            'salary_quartiles': {'q1': q1, 'q2': median, 'q3': q3},
+            'correlation_exp_salary': self.service_salary.correlation,
+        }
+        if self.bonuses.n:
+            analytics['bonus_stats'] = {
+                'total_bonuses': self.bonuses.total,
+                'avg_bonus': self.bonuses.mean,
+                'max_bonus': self.bonuses.max,
+                'min_bonus': self.bonuses.min,
+            }
+            analytics['by_payment_type'] = {
+                label: {'count': m.n, 'sum': m.total, 'mean': m.mean}
+                for label, m in sorted(self.by_payment_type.items(), key=lambda item: -item[1].total)
+            }
+        return analytics
+
+
+def _chunks(iterator, size):
+    chunk = []
+    for row in iterator:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def employee_partial(employees=None, chunk_size=STREAM_CHUNK_SIZE, seed=None):
+    """PayrollStats по сотрудникам queryset (например, диапазону id)"""
+    if employees is None:
+        employees = Product.objects.all()
+    stats = PayrollStats(seed=seed)
+    rows = employees.order_by().values_list('price', 'quantity', 'position_ref', 'level').iterator(chunk_size)
+    for chunk in _chunks(rows, chunk_size):
+        stats.add_employees(chunk)
+    return stats
+
+
+def payment_partial(payments, chunk_size=STREAM_CHUNK_SIZE):
+    """PayrollStats с одними выплатами по queryset выплат"""
+    stats = PayrollStats()
+    rows = payments.order_by().values_list('bonus_amount', 'payment_type', 'final_amount')
+    for chunk in _chunks(rows.iterator(chunk_size), chunk_size):
+        stats.add_payments(chunk)
+    return stats
+
+
+def salary_analytics_streaming(chunk_size=STREAM_CHUNK_SIZE, seed=0, start=None, end=None):
+    """Аналитика обходом таблиц пачками; память не зависит от числа строк.
+    Выплаты — за [start, end)"""
+    stats = employee_partial(chunk_size=chunk_size, seed=seed)
+    sources = payment_querysets(start, end)
+    for payments in sources:
+        stats.merge(payment_partial(payments, chunk_size))
+    analytics = stats.as_analytics(position_names(stats.by_position))
+    if 'bonus_stats' in analytics:
+        # Топ — один запрос с LIMIT, а не суммы всех сотрудников в памяти
+        from .analytics import TOP_BONUS_EMPLOYEES
+        analytics['top_employees_by_bonus'] = [
+            (name, float(total)) for name, total in top_employees_by_bonus(sources, TOP_BONUS_EMPLOYEES)
+        ]
+    return analytics
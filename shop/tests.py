@@ -128,14 +128,18 @@ class ViewsTest(TestCase):
         
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'shop/index.html')
+        # Страница отдается потоком — читаем ее один раз
+        content = b''.join(response.streaming_content).decode('utf-8')
         
         # Проверяем наличие сотрудников
-        self.assertContains(response, "Младший сотрудник")
-        self.assertContains(response, "Старший сотрудник")
-        self.assertContains(response, "Junior")
-        self.assertContains(response, "Senior")
+        self.assertIn("Младший сотрудник", content)
+        self.assertIn("Старший сотрудник", content)
+        self.assertIn("Junior", content)
+        self.assertIn("Senior", content)
         
-        # Проверяем наличие аналитики
+        # Аналитика подгружается отдельным фрагментом
+        self.assertIn(reverse('index_analytics'), content)
+        response = self.client.get(reverse('index_analytics'))
         self.assertContains(response, "Фонд оплаты")
         self.assertContains(response, "Средняя зарплата")
     
@@ -208,7 +212,7 @@ class ViewsTest(TestCase):
     
     def test_index_view_analytics_calculations(self):
         """Тест корректности расчетов аналитики на главной странице"""
-        response = self.client.get(reverse('index'))
+        response = self.client.get(reverse('index_analytics'))
         
         # Получаем контекст
         context = response.context
@@ -319,9 +323,9 @@ class IntegrationTest(TestCase):
     def test_full_salary_payment_flow(self):
         """Полный тест потока выплаты зарплаты"""
         # 1. Главная страница
-        response = self.client.get(reverse('index'))
-        self.assertContains(response, "Интеграционный тест")
-        self.assertContains(response, "60000")
+        content = b''.join(self.client.get(reverse('index')).streaming_content).decode('utf-8')
+        self.assertIn("Интеграционный тест", content)
+        self.assertIn("60000", content)
         
         # 2. Страница расчета зарплаты
         response = self.client.get(reverse('process_payment', args=[self.employee.id]))
@@ -431,7 +435,7 @@ class TemplateContentTest(TestCase):
     def test_index_template_structure(self):
         """Тест структуры главной страницы"""
         response = self.client.get(reverse('index'))
-        content = response.content.decode('utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8')
         
         # Проверяем основные блоки
         self.assertIn('Система управления персоналом', content)
@@ -492,4 +496,1942 @@ class PaymentValidationTest(TestCase):
         })
         
         if response.status_code == 200:
-            self.assertContains(response, "Зарплата выплачена")
\ No newline at end of file
+            self.assertContains(response, "Зарплата выплачена")
+
+    def test_payment_with_huge_numbers(self):
+        """Суммы, не помещающиеся в numeric(12,2), отклоняются с 400, а не 500"""
+        for field in ('bonus', 'deductions'):
+            data = {'bonus': '5000', 'deductions': '0', 'description': 'Тест', field: '1e27'}
+            response = self.client.post(reverse('process_payment', args=[self.employee.id]), data)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("должны быть числами", response.content.decode())
+        self.assertFalse(Purchase.objects.filter(product=self.employee).exists())
+
+class ConditionalGetTest(TestCase):
+    """Тесты условных GET-запросов (ETag / Last-Modified)"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.employee = Product.objects.create(
+            name="Кешируемый сотрудник",
+            price=60000,
+            quantity=2
+        )
+    
+    def test_etag_and_cache_control(self):
+        """Страницы отдают ETag, Last-Modified и Cache-Control"""
+        for url in (reverse('index'), reverse('salary_analytics')):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.has_header('ETag'))
+            self.assertTrue(response.has_header('Last-Modified'))
+            self.assertIn('must-revalidate', response['Cache-Control'])
+            self.assertIn('public', response['Cache-Control'])
+    
+    def test_not_modified_before_heavy_work(self):
+        """Повторный запрос с If-None-Match получает 304 без шаблона"""
+        etag = self.client.get(reverse('index'))['ETag']
+        
+        # Только агрегаты версии данных — ни одного запроса за списком
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+    
+    def test_etag_changes_after_payment(self):
+        """После выплаты ETag меняется и страница отдается заново"""
+        etag = self.client.get(reverse('salary_analytics'))['ETag']
+        
+        self.client.post(reverse('process_payment', args=[self.employee.id]), {
+            'bonus': '1000',
+            'deductions': '0',
+            'description': 'Премия'
+        })
+        
+        response = self.client.get(reverse('salary_analytics'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_etag_changes_after_edit_and_archive_delete(self):
+        """Правка выплаты и удаление из архива меняют ETag"""
+        from datetime import date, datetime, timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from .archive import close_periods
+        from .models import PurchaseArchive
+        
+        payment = Purchase.objects.create(product=self.employee, person="1000", address="Премия")
+        Purchase.objects.filter(pk=payment.pk).update(date=timezone.make_aware(datetime(2024, 1, 15)))
+        close_periods(date(2024, 2, 1))
+        Purchase.objects.create(product=self.employee, person="500", address="Премия")
+        
+        etag = self.client.get(reverse('index'))['ETag']
+        edited = Purchase.objects.get(person="500")
+        edited.payment_type = 'BONUS'
+        edited.save()
+        response = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        
+        etag = response['ETag']
+        PurchaseArchive.objects.all().delete()
+        response = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        
+        # Страница аналитики зависит от даты: после полуночи 304 не отдается
+        etag = self.client.get(reverse('salary_analytics'))['ETag']
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with mock.patch('shop.conditional.timezone.localdate', return_value=tomorrow):
+            response = self.client.get(reverse('salary_analytics'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+    
+    def test_late_commit_served_after_validator_period(self):
+        """Правка с updated_at меньше известного максимума видна после смены интервала"""
+        from datetime import timedelta
+        from unittest import mock
+        from django.conf import settings
+        from django.utils import timezone
+        
+        late = Product.objects.create(name="Поздний коммит", price=40000, quantity=1)
+        Product.objects.filter(pk=self.employee.pk).update(updated_at=timezone.now() + timedelta(seconds=1))
+        response = self.client.get(reverse('index'))
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        
+        # Транзакция поставила updated_at раньше и зафиксировалась позже
+        Product.objects.filter(pk=late.pk).update(price=41000, updated_at=late.updated_at)
+        response = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        later = timezone.now() + timedelta(seconds=settings.SHOP_HTTP_VALIDATOR_SECONDS)
+        with mock.patch('shop.conditional.timezone.now', return_value=later):
+            response = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, "41000")
+            response = self.client.get(reverse('index'), HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+
+
+class EmployeeSearchTest(TestCase):
+    """Тесты индексированного поиска и автодополнения"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.developer = Product.objects.create(
+            name="Иван Петров", price=90000, quantity=3, position="Разработчик"
+        )
+        self.analyst = Product.objects.create(
+            name="Мария Сидорова", price=85000, quantity=2, position="Аналитик"
+        )
+        Purchase.objects.create(product=self.analyst, person="0", address="Премия за квартальный отчет")
+    
+    def test_search_employees_by_name_and_position(self):
+        """Поиск по подстроке ФИО и должности без учета регистра"""
+        from .search import search_employees
+        
+        found = search_employees(Product.objects.all(), "петров")
+        self.assertEqual(list(found), [self.developer])
+        
+        found = search_employees(Product.objects.all(), "АНАЛИТ")
+        self.assertEqual(list(found), [self.analyst])
+    
+    def test_search_index_follows_updates(self):
+        """Индекс поиска обновляется при изменении сотрудника"""
+        from .search import search_employees
+        
+        self.developer.position = "Архитектор"
+        self.developer.save()
+        
+        self.assertEqual(list(search_employees(Product.objects.all(), "Архитект")), [self.developer])
+        self.assertEqual(list(search_employees(Product.objects.all(), "Разработ")), [])
+    
+    def test_search_payments_by_description_and_employee(self):
+        """Поиск выплат по описанию и ФИО сотрудника"""
+        from .search import search_payments
+        
+        self.assertEqual(search_payments(Purchase.objects.all(), "квартальн").count(), 1)
+        self.assertEqual(search_payments(Purchase.objects.all(), "Сидоров").count(), 1)
+        self.assertEqual(search_payments(Purchase.objects.all(), "Петров").count(), 0)
+    
+    def test_index_search_box(self):
+        """Поиск на главной сужает список сотрудников"""
+        response = self.client.get(reverse('index'), {'q': 'Сидоров'})
+        
+        self.assertContains(response, "Мария Сидорова")
+        self.assertNotContains(response, "Иван Петров")
+    
+    def test_employee_search_json_pagination(self):
+        """JSON-поиск отдает страницы по 20 и признак продолжения"""
+        from .views import SEARCH_PAGE_SIZE
+        
+        for i in range(SEARCH_PAGE_SIZE + 5):
+            Product.objects.create(name=f"Стажер {i:02d}", price=30000, quantity=1)
+        
+        data = self.client.get(reverse('employee_search'), {'q': 'Стажер'}).json()
+        self.assertEqual(len(data['results']), SEARCH_PAGE_SIZE)
+        self.assertTrue(data['pagination']['more'])
+        
+        data = self.client.get(reverse('employee_search'), {'q': 'Стажер', 'page': 2}).json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertFalse(data['pagination']['more'])
+    
+    def test_admin_payment_form_uses_autocomplete(self):
+        """Форма выплаты в админке не выводит всех сотрудников в <select>"""
+        from django.contrib.auth.models import User
+        
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        
+        response = self.client.get('/admin/shop/purchase/add/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, 'Иван Петров')
+        
+        response = self.client.get('/admin/autocomplete/', {
+            'term': 'петров',
+            'app_label': 'shop',
+            'model_name': 'purchase',
+            'field_name': 'product',
+        })
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['id'] for r in results], [str(self.developer.id)])
+
+
+class EmployeeLevelTest(TestCase):
+    """Тесты действующего уровня (генерируемая колонка level)"""
+    
+    def test_level_follows_service(self):
+        """Уровень без явного типа пересчитывается БД вместе со стажем"""
+        employee = Product.objects.create(name="Растущий", price=50000, quantity=1)
+        self.assertIsNone(employee.employee_type)
+        self.assertEqual(Product.objects.get(pk=employee.pk).level, 'JUNIOR')
+        
+        Product.objects.filter(pk=employee.pk).update(quantity=3)
+        self.assertEqual(Product.objects.get(pk=employee.pk).level, 'MIDDLE')
+        
+        self.client.post(reverse('process_payment', args=[employee.id]), {
+            'bonus': '0', 'deductions': '0', 'description': 'Зарплата'
+        })
+        self.client.post(reverse('process_payment', args=[employee.id]), {
+            'bonus': '0', 'deductions': '0', 'description': 'Зарплата'
+        })
+        employee.refresh_from_db()
+        self.assertEqual(employee.quantity, 5)
+        self.assertEqual(employee.level, 'SENIOR')
+        self.assertEqual(employee.calculated_employee_type, "Senior")
+    
+    def test_explicit_type_wins(self):
+        """Явно заданный уровень не зависит от стажа"""
+        lead = Product.objects.create(name="Лид", price=200000, quantity=1, employee_type='LEAD')
+        self.assertEqual(Product.objects.get(pk=lead.pk).level, 'LEAD')
+        self.assertEqual(lead.calculated_employee_type, "Team Lead")
+    
+    def test_index_counts_by_level(self):
+        """Главная считает численность по действующему уровню"""
+        Product.objects.create(name="A", price=40000, quantity=1)
+        Product.objects.create(name="B", price=60000, quantity=3)
+        Product.objects.create(name="C", price=90000, quantity=1, employee_type='MANAGER')
+        
+        analytics = self.client.get(reverse('index_analytics')).context['analytics']
+        self.assertEqual(analytics['junior_count'], 1)
+        self.assertEqual(analytics['middle_count'], 1)
+        self.assertEqual(analytics['manager_count'], 1)
+    
+    def test_reclassify_command(self):
+        """Команда сбрасывает устаревшие уровни по стажу пачками"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        stale = Product.objects.create(name="Устаревший", price=50000, quantity=7, employee_type='JUNIOR')
+        lead = Product.objects.create(name="Лид", price=200000, quantity=7, employee_type='LEAD')
+        
+        out = StringIO()
+        call_command('reclassify_employees', '--dry-run', stdout=out)
+        self.assertIn("не совпадает со стажем: 1", out.getvalue())
+        self.assertEqual(Product.objects.get(pk=stale.pk).level, 'JUNIOR')
+        
+        call_command('reclassify_employees', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(Product.objects.get(pk=stale.pk).level, 'SENIOR')
+        self.assertEqual(Product.objects.get(pk=lead.pk).level, 'LEAD')
+    
+    def test_reclassify_keeps_matching_levels(self):
+        """Уровень, совпадающий со стажем (например, из админки), сбрасывает только --all"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        chosen = Product.objects.create(name="Назначенный", price=90000, quantity=7, employee_type='SENIOR')
+        
+        out = StringIO()
+        call_command('reclassify_employees', '--dry-run', '--all', stdout=out)
+        self.assertIn("будет сброшено: 1", out.getvalue())
+        call_command('reclassify_employees', stdout=StringIO())
+        self.assertEqual(Product.objects.get(pk=chosen.pk).employee_type, 'SENIOR')
+        
+        call_command('reclassify_employees', '--all', stdout=StringIO())
+        self.assertIsNone(Product.objects.get(pk=chosen.pk).employee_type)
+
+
+class EmployeeLedgerTest(TestCase):
+    """Тесты ведомости выплат сотрудника"""
+    
+    def setUp(self):
+        from datetime import datetime
+        from django.utils import timezone
+        
+        self.client = Client()
+        self.employee = Product.objects.create(name="Ольга Ведомостева", price=1000, quantity=3)
+        # (дата, премия): два года, чтобы проверить сумму с начала года
+        for date, bonus in [((2024, 11, 10), "100"), ((2024, 12, 10), "200"),
+                            ((2025, 1, 10), "300"), ((2025, 1, 20), "не число")]:
+            payment = Purchase.objects.create(product=self.employee, person=bonus, address="Зарплата")
+            Purchase.objects.filter(pk=payment.pk).update(
+                date=timezone.make_aware(datetime(*date, 12, 0))
+            )
+    
+    def test_window_totals(self):
+        """Нарастающий итог, сумма с начала года и изменение к прошлому месяцу"""
+        from decimal import Decimal
+        from .ledger import employee_ledger
+        
+        ledger = employee_ledger(self.employee)
+        payments = ledger['payments']
+        
+        self.assertEqual([p['amount'] for p in payments],
+                         [Decimal('1000'), Decimal('1300'), Decimal('1200'), Decimal('1100')])
+        self.assertEqual([p['running_total'] for p in payments],
+                         [Decimal('4600'), Decimal('3600'), Decimal('2300'), Decimal('1100')])
+        self.assertEqual([p['year_to_date'] for p in payments],
+                         [Decimal('2300'), Decimal('1300'), Decimal('2300'), Decimal('1100')])
+        
+        months = {m['month'].month: m for m in ledger['months']}
+        self.assertEqual(months[1]['month_total'], Decimal('2300'))
+        self.assertEqual(months[1]['month_delta'], Decimal('1100'))
+        self.assertIsNone(months[11]['month_delta'])
+    
+    def test_keyset_pagination_keeps_running_total(self):
+        """На следующей странице нарастающий итог остается верным"""
+        from decimal import Decimal
+        from .ledger import employee_ledger
+        
+        first = employee_ledger(self.employee, limit=2)
+        self.assertIsNotNone(first['next_cursor'])
+        
+        second = employee_ledger(self.employee, before=first['next_cursor'], limit=2)
+        self.assertEqual([p['running_total'] for p in second['payments']],
+                         [Decimal('2300'), Decimal('1100')])
+        self.assertIsNone(second['next_cursor'])
+    
+    def test_detail_page_and_json(self):
+        """HTML-страница и JSON-эндпоинт ведомости"""
+        from decimal import Decimal
+        
+        response = self.client.get(reverse('employee_detail', args=[self.employee.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'shop/employee_detail.html')
+        self.assertContains(response, "Нарастающий итог")
+        
+        data = self.client.get(reverse('employee_payments', args=[self.employee.id])).json()
+        self.assertEqual(len(data['payments']), 4)
+        self.assertEqual(Decimal(data['payments'][0]['running_total']), Decimal('4600'))
+        
+        response = self.client.get(reverse('employee_payments', args=[self.employee.id]), {'before': 'мусор'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_ledger_spans_archive(self):
+        """После архивации ведомость та же: итоги учитывают архивные месяцы"""
+        from datetime import date
+        from .archive import close_periods
+        from .ledger import employee_ledger
+        
+        expected = employee_ledger(self.employee)
+        close_periods(date(2025, 1, 1))
+        self.assertEqual(Purchase.objects.count(), 2)
+        
+        actual = employee_ledger(self.employee)
+        fields = ('id', 'amount', 'running_total', 'year_to_date', 'month_total', 'month_delta')
+        self.assertEqual([{f: p[f] for f in fields} for p in actual['payments']],
+                         [{f: p[f] for f in fields} for p in expected['payments']])
+        
+        first = employee_ledger(self.employee, limit=3)
+        second = employee_ledger(self.employee, before=first['next_cursor'], limit=3)
+        self.assertEqual([p['id'] for p in first['payments'] + second['payments']],
+                         [p['id'] for p in expected['payments']])
+
+
+class AnalyticsBackendParityTest(TestCase):
+    """Сверка SQL-бэкенда аналитики с эталонным расчетом через pandas"""
+    
+    def setUp(self):
+        from .seeding import seed_payroll
+        seed_payroll(employees=60, payments=40, batch_size=25)
+        Purchase.objects.create(product=Product.objects.first(), person="не число", address="Ошибка ввода")
+    
+    def assertAnalyticsEqual(self, expected, actual, path='analytics'):
+        if isinstance(expected, dict):
+            self.assertEqual(set(expected), set(actual), path)
+            for key in expected:
+                self.assertAnalyticsEqual(expected[key], actual[key], f"{path}.{key}")
+        elif isinstance(expected, (list, tuple)):
+            self.assertEqual(len(expected), len(actual), path)
+            for index, (item, other) in enumerate(zip(expected, actual)):
+                self.assertAnalyticsEqual(item, other, f"{path}[{index}]")
+        elif isinstance(expected, str):
+            self.assertEqual(expected, actual, path)
+        elif expected is None or (isinstance(expected, float) and np.isnan(expected)):
+            self.assertTrue(actual is None or np.isnan(actual), path)
+        else:
+            self.assertAlmostEqual(float(expected), float(actual), places=6, msg=path)
+    
+    def test_sql_matches_pandas(self):
+        """SQL-бэкенд возвращает тот же словарь, что и pandas"""
+        from .analytics import compute_salary_analytics
+        
+        self.assertAnalyticsEqual(
+            compute_salary_analytics('pandas'),
+            compute_salary_analytics('sql'),
+        )
+    
+    def test_sql_backend_query_count(self):
+        """SQL-бэкенд не зависит от числа строк по количеству запросов"""
+        from .analytics import compute_salary_analytics
+        
+        # агрегаты, квартили, должности, уровни, горизонт архива,
+        # выплаты по типам, топ по премиям
+        with self.assertNumQueries(7):
+            compute_salary_analytics('sql')
+    
+    def test_empty_database(self):
+        """Без сотрудников оба бэкенда возвращают пустой словарь"""
+        from .analytics import compute_salary_analytics
+        
+        Product.objects.all().delete()
+        self.assertEqual(compute_salary_analytics('sql'), {})
+        self.assertEqual(compute_salary_analytics('pandas'), {})
+    
+    def test_rank_within_position(self):
+        """Место и перцентиль оклада внутри должности"""
+        from .analytics import with_position_rank
+        
+        Product.objects.all().delete()
+        for name, price in [("A", 100), ("B", 300), ("C", 200)]:
+            Product.objects.create(name=name, price=price, position="Тестировщик")
+        
+        ranked = {e.name: e for e in with_position_rank(Product.objects.all())}
+        self.assertEqual(ranked["B"].position_rank, 1)
+        self.assertEqual(ranked["A"].position_rank, 3)
+        self.assertAlmostEqual(ranked["B"].position_percentile, 1.0)
+        self.assertAlmostEqual(ranked["C"].position_percentile, 0.5)
+
+
+class PaymentArchiveTest(TestCase):
+    """Тесты архивации закрытых месяцев"""
+    
+    def setUp(self):
+        from datetime import datetime
+        from django.utils import timezone
+        
+        self.employee = Product.objects.create(name="Архивный", price=1000, quantity=3)
+        for month, bonus in [(1, "100"), (2, "200"), (2, "300")]:
+            payment = Purchase.objects.create(product=self.employee, person=bonus, address="Зарплата")
+            Purchase.objects.filter(pk=payment.pk).update(
+                date=timezone.make_aware(datetime(2024, month, 15))
+            )
+        self.current = Purchase.objects.create(product=self.employee, person="400", address="Текущая")
+    
+    def test_close_periods_moves_rows_in_batches(self):
+        """Выплаты закрытых месяцев переносятся в архив с теми же id"""
+        from datetime import date
+        from .archive import close_periods
+        from .models import PaymentPeriod, PurchaseArchive
+        
+        moved = close_periods(date(2024, 3, 1), batch_size=1)
+        
+        self.assertEqual(moved, {date(2024, 1, 1): 1, date(2024, 2, 1): 2})
+        self.assertEqual(list(Purchase.objects.values_list('id', flat=True)), [self.current.id])
+        self.assertEqual(PurchaseArchive.objects.count(), 3)
+        self.assertEqual(PaymentPeriod.objects.get(month=date(2024, 2, 1)).payments_count, 2)
+    
+    def test_cannot_close_current_month(self):
+        """Текущий месяц закрыть нельзя"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .archive import close_periods
+        
+        with self.assertRaises(ValueError):
+            close_periods(timezone.now() + timedelta(days=40))
+    
+    def test_date_range_prunes_untouched_tables(self):
+        """Запрос с диапазоном дат обращается только к нужным таблицам"""
+        from datetime import date
+        from django.utils import timezone
+        from .archive import close_periods, month_start, payment_querysets
+        from .models import PurchaseArchive
+        
+        close_periods(date(2024, 3, 1))
+        
+        recent = payment_querysets(start=month_start(timezone.now()))
+        self.assertEqual([qs.model for qs in recent], [Purchase])
+        
+        old = payment_querysets(start=month_start(date(2024, 1, 1)), end=month_start(date(2024, 2, 1)))
+        self.assertEqual([qs.model for qs in old], [PurchaseArchive])
+        self.assertEqual(old[0].count(), 1)
+        
+        self.assertEqual(sum(qs.count() for qs in payment_querysets()), 4)
+    
+    def test_all_time_analytics_include_archive(self):
+        """Аналитика за всё время видит и архив"""
+        from datetime import date
+        from .analytics import compute_salary_analytics
+        from .archive import close_periods
+        
+        close_periods(date(2024, 3, 1))
+        
+        for backend in ('sql', 'pandas'):
+            bonus_stats = compute_salary_analytics(backend)['bonus_stats']
+            self.assertAlmostEqual(bonus_stats['total_bonuses'], 1000.0)
+            self.assertAlmostEqual(bonus_stats['avg_bonus'], 250.0)
+            self.assertAlmostEqual(bonus_stats['max_bonus'], 400.0)
+    
+    def test_archive_command(self):
+        """Команда archive_payments закрывает месяцы до указанного"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import PurchaseArchive
+        
+        out = StringIO()
+        call_command('archive_payments', '--before', '2024-02', stdout=out)
+        
+        self.assertIn("перенесено выплат 1", out.getvalue())
+        self.assertEqual(PurchaseArchive.objects.count(), 1)
+
+
+class ReplicaRoutingTest(TestCase):
+    """Маршрутизация чтения на реплику"""
+    
+    def setUp(self):
+        from unittest import mock
+        from .routers import PrimaryReplicaRouter
+        self.router = PrimaryReplicaRouter()
+        for target in ('shop.routers.replica_configured', 'shop.middleware.replica_configured'):
+            patcher = mock.patch(target, return_value=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def outside_transaction(self):
+        """Имитирует основную БД вне транзакции (TestCase сам работает в atomic)"""
+        from types import SimpleNamespace
+        from unittest import mock
+        return mock.patch('shop.routers.connections', {'default': SimpleNamespace(in_atomic_block=False)})
+    
+    def test_reads_stay_on_primary_by_default(self):
+        """Вне помеченного запроса (команды, фоновые задачи) читаем с основной БД"""
+        with self.outside_transaction():
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+    
+    def test_replica_reads_and_primary_writes(self):
+        """Разрешенное чтение уходит на реплику, запись — всегда на основную БД"""
+        from .routers import read_from_replica
+        with self.outside_transaction(), read_from_replica():
+            self.assertEqual(self.router.db_for_read(Product), 'replica')
+            self.assertEqual(self.router.db_for_write(Product), 'default')
+    
+    def test_transaction_sticks_to_primary(self):
+        """Внутри транзакции основной БД чтение не уходит на реплику"""
+        from .routers import read_from_replica
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+    
+    def test_middleware_pins_after_write(self):
+        """Запись закрепляет пользователя за основной БД через cookie"""
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .middleware import ReplicaRoutingMiddleware
+        from .routers import _read_from_replica
+        
+        seen = []
+        def view(request):
+            seen.append(_read_from_replica.get())
+            return HttpResponse()
+        middleware = ReplicaRoutingMiddleware(view)
+        factory = RequestFactory()
+        
+        middleware(factory.get('/'))
+        response = middleware(factory.post('/buy/1/'))
+        self.assertIn(ReplicaRoutingMiddleware.cookie_name, response.cookies)
+        
+        pinned = factory.get('/')
+        pinned.COOKIES[ReplicaRoutingMiddleware.cookie_name] = '1'
+        middleware(pinned)
+        
+        self.assertEqual(seen, [True, False, False])
+        self.assertFalse(_read_from_replica.get())
+
+
+from unittest import skipUnless
+from django.conf import settings
+from django.test import TransactionTestCase
+
+
+@skipUnless('replica' in settings.DATABASES, "Нужен REPLICA_DATABASE_URL")
+class ReplicaDatabaseTest(TransactionTestCase):
+    """Два настоящих алиаса: запуск с REPLICA_DATABASE_URL=sqlite:///replica.sqlite3"""
+    
+    databases = {'default', 'replica'}
+    
+    def test_list_reads_replica_until_own_write(self):
+        """Список читается с реплики, а после своей записи — с основной БД"""
+        Product.objects.using('replica').create(name="Только на реплике", price=1000, quantity=1)
+        client = Client()
+        
+        self.assertContains(client.get(reverse('index')), "Только на реплике")
+        
+        employee = Product.objects.create(name="Только на основной", price=1000, quantity=1)
+        client.post(reverse('process_payment', args=[employee.id]), {'bonus': '100', 'description': 'Тест'})
+        
+        response = client.get(reverse('index'))
+        self.assertContains(response, "Только на основной")
+        self.assertNotContains(response, "Только на реплике")
+
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+@skipUnless(pyarrow, "Нужен pyarrow")
+class ParquetSnapshotTest(TestCase):
+    """Снимки Parquet и аналитика по ним"""
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        from datetime import datetime
+        from django.utils import timezone
+        
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        
+        first = Product.objects.create(name="Иван", price=50000, quantity=1, position="Разработчик")
+        second = Product.objects.create(name="Петр", price=150000, quantity=8, position="Тимлид")
+        Purchase.objects.create(product=first, person="1500.50", address="Январь")
+        Purchase.objects.create(product=second, person="не число", address="Без премии")
+        old = Purchase.objects.create(product=second, person="2000", address="Давно")
+        Purchase.objects.filter(id=old.id).update(date=timezone.make_aware(datetime(2024, 1, 15)))
+    
+    def test_export_partitions_and_types(self):
+        """Выплаты разложены по месяцам, суммы — decimal"""
+        from decimal import Decimal
+        import pyarrow.dataset as ds
+        from .snapshot import export_snapshot, latest_snapshot
+        
+        manifest = export_snapshot(self.root, chunk_size=1)
+        
+        self.assertEqual(manifest['employees'], 2)
+        self.assertEqual(manifest['payments'], 3)
+        self.assertIn('year=2024/month=01', manifest['partitions'])
+        
+        table = ds.dataset(latest_snapshot(self.root) / 'payments', partitioning='hive').to_table()
+        rows = {row['description']: row for row in table.to_pylist()}
+        self.assertEqual(rows['Январь']['bonus'], Decimal('1500.50'))
+        self.assertEqual(rows['Январь']['amount'], Decimal('51500.50'))
+        self.assertEqual(rows['Без премии']['bonus'], Decimal('0'))
+        self.assertEqual(rows['Давно']['employee_name'], "Петр")
+    
+    def test_snapshot_backend_matches_pandas(self):
+        """Аналитика по снимку совпадает с расчетом по ORM"""
+        from .analytics import compute_salary_analytics
+        
+        with self.settings(SHOP_SNAPSHOT_DIR=self.root):
+            from .snapshot import export_snapshot
+            export_snapshot()
+            expected = compute_salary_analytics('pandas')
+            with self.assertNumQueries(0):
+                actual = compute_salary_analytics('snapshot')
+        
+        self.assertEqual(actual['total_employees'], expected['total_employees'])
+        self.assertEqual(actual['by_type'], expected['by_type'])
+        for key, value in expected['salary_stats'].items():
+            self.assertAlmostEqual(actual['salary_stats'][key], value)
+        for key, value in expected['bonus_stats'].items():
+            self.assertAlmostEqual(actual['bonus_stats'][key], value)
+    
+    def test_snapshot_period(self):
+        """Период отбирает выплаты снимка по дате"""
+        from datetime import date
+        from .analytics import compute_salary_analytics
+        
+        with self.settings(SHOP_SNAPSHOT_DIR=self.root):
+            from .snapshot import export_snapshot
+            export_snapshot()
+            analytics = compute_salary_analytics('snapshot', date(2024, 1, 1), date(2024, 1, 31))
+        
+        self.assertEqual(analytics['bonus_stats']['total_bonuses'], 2000.0)
+        self.assertEqual(analytics['top_employees_by_bonus'], [("Петр", 2000.0)])
+    
+    def test_staff_endpoint(self):
+        """Выгрузка через веб доступна только персоналу"""
+        from django.contrib.auth.models import User
+        
+        url = reverse('payroll_snapshots')
+        with self.settings(SHOP_SNAPSHOT_DIR=self.root):
+            self.assertEqual(self.client.post(url).status_code, 302)
+            
+            self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+            created = self.client.post(url)
+            self.assertEqual(created.status_code, 201)
+            listing = self.client.get(url).json()
+        
+        self.assertEqual(listing['snapshots'][0]['name'], created.json()['name'])
+
+
+from django.test import LiveServerTestCase
+
+
+class LoadTestHarnessTest(LiveServerTestCase):
+    """Нагрузочный клиент против настоящего HTTP-сервера"""
+    
+    def test_mix_against_live_server(self):
+        """Все сценарии, включая админку, отвечают без ошибок"""
+        import asyncio
+        from .loadtest import DEFAULT_MIX, admin_session, run_load
+        
+        employee = Product.objects.create(name="Иван", price=50000, quantity=1)
+        results = asyncio.run(run_load(
+            self.live_server_url, [employee.id], DEFAULT_MIX,
+            concurrency=3, requests=24, session_key=admin_session(),
+        ))
+        
+        self.assertEqual(results['total']['requests'], 24)
+        self.assertEqual(results['total']['errors'], 0, results['total']['statuses'])
+        self.assertIsNotNone(results['total']['latency_ms']['p99'])
+        self.assertTrue(Purchase.objects.filter(product=employee).exists())
+    
+    def test_summary_and_mix_parsing(self):
+        """Перцентили по ближайшему рангу, ошибки — сбои и статусы 4xx/5xx"""
+        from .loadtest import parse_mix, summarize
+        
+        samples = [('index', n / 1000, 200) for n in range(1, 101)]
+        samples += [('analytics', 0.5, 500), ('analytics', 0.5, None)]
+        summary = summarize(samples, elapsed=2.0)
+        
+        self.assertEqual(summary['scenarios']['index']['latency_ms']['p95'], 95)
+        self.assertEqual(summary['scenarios']['analytics']['errors'], 2)
+        self.assertEqual(summary['total']['throughput_rps'], 51)
+        
+        self.assertEqual(parse_mix('index=3,analytics=1'), {'index': 3, 'analytics': 1})
+        with self.assertRaises(ValueError):
+            parse_mix('unknown=1')
+
+
+class ProfilingMiddlewareTest(TestCase):
+    """Профилирование запросов по требованию"""
+    
+    def setUp(self):
+        from django.contrib.auth.models import User
+        Product.objects.create(name="Иван", price=50000, quantity=1, position="Разработчик")
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+    
+    def test_report_for_staff(self):
+        """Персонал получает функции, SQL и память"""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('salary_analytics'), {'_profile': '1'})
+        
+        report = response.json()
+        self.assertEqual(report['status'], 200)
+        self.assertTrue(report['functions'])
+        self.assertGreater(report['sql']['count'], 0)
+        self.assertIn('SELECT', report['sql']['slowest'][0]['sql'])
+        self.assertGreater(report['memory']['peak_bytes'], 0)
+    
+    def test_header_and_store(self):
+        """Заголовок X-Profile: store сохраняет отчет, страница не меняется"""
+        import os
+        import tempfile
+        self.client.force_login(self.staff)
+        
+        with tempfile.TemporaryDirectory() as directory, self.settings(SHOP_PROFILE_DIR=directory):
+            response = self.client.get(reverse('index'), headers={'X-Profile': 'store'})
+            self.assertContains(response, "Разработчик")
+            self.assertTrue(os.path.exists(os.path.join(directory, response['X-Profile-Report'])))
+    
+    def test_ignored_for_anonymous(self):
+        """Без прав персонала параметр ничего не делает"""
+        response = self.client.get(reverse('index'), {'_profile': '1'})
+        self.assertContains(response, "Разработчик")
+        self.assertNotIn('X-Profile-Report', response)
+
+
+class SlowQueryLogTest(TestCase):
+    """Журнал медленных запросов"""
+    
+    def test_normalize_and_fingerprint(self):
+        """Запросы, отличающиеся только значениями, дают один отпечаток"""
+        from .slowlog import fingerprint, normalize_sql
+        
+        first = normalize_sql("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'Иван'")
+        second = normalize_sql("SELECT *  FROM t\nWHERE id IN (%s) AND name = 'Петр'")
+        self.assertEqual(first, "SELECT * FROM t WHERE id IN (...) AND name = ?")
+        self.assertEqual(fingerprint(first), fingerprint(second))
+    
+    def test_slow_query_logged_with_source_and_plan(self):
+        """Запрос выше порога пишется с представлением и планом EXPLAIN"""
+        import json
+        import logging
+        from unittest import mock
+        from django.db import connection
+        from .slowlog import aggregate_log, logger, slow_query_wrapper, wait_for_slow_query_log
+        
+        Product.objects.create(name="Иван", price=50000, quantity=1)
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        
+        # Перехват выключен по умолчанию: соединение теста открыто без обертки
+        with self.settings(SHOP_SLOW_QUERY_MS=0), mock.patch.object(logger, 'handlers', [handler]), \
+                connection.execute_wrapper(slow_query_wrapper):
+            self.client.get(reverse('salary_analytics'))
+            wait_for_slow_query_log()
+        
+        entries = [record.slow_query for record in records]
+        self.assertTrue(entries)
+        self.assertTrue(all(entry['source'] == 'salary_analytics' for entry in entries))
+        self.assertTrue(any(entry['plan'] for entry in entries))
+        
+        summary = aggregate_log(json.dumps(entry) for entry in entries)
+        self.assertEqual(sum(group['count'] for group in summary), len(entries))
+
+
+class StreamingStatisticsTest(TestCase):
+    """Потоковые накопители и бэкенд 'streaming'"""
+    
+    assertAnalyticsEqual = AnalyticsBackendParityTest.assertAnalyticsEqual
+    
+    def setUp(self):
+        self.rng = np.random.default_rng(7)
+        self.data = self.rng.lognormal(11, 0.5, 200_000)
+    
+    def test_moments_merge_matches_numpy(self):
+        """Слияние частичных моментов дает точные среднее, отклонение и корреляцию"""
+        from .streaming import CoMoments, Moments
+        
+        x = self.rng.integers(0, 30, self.data.size)
+        parts = np.array_split(np.arange(self.data.size), 7)
+        total, pair = Moments(), CoMoments()
+        for part in parts:
+            chunk, chunk_pair = Moments(), CoMoments()
+            chunk.add(self.data[part])
+            chunk_pair.add(x[part], self.data[part])
+            total.merge(chunk)
+            pair.merge(chunk_pair)
+        
+        self.assertAlmostEqual(total.mean, self.data.mean(), places=6)
+        self.assertAlmostEqual(total.std / self.data.std(ddof=1), 1.0, places=9)
+        self.assertAlmostEqual(pair.correlation, np.corrcoef(x, self.data)[0, 1], places=9)
+    
+    def test_kll_rank_error_bound(self):
+        """Квантили KLL укладываются в заявленную ошибку ранга, в том числе после слияния"""
+        from .streaming import KLLSketch
+        
+        halves = []
+        for seed, half in enumerate(np.array_split(self.data, 2)):
+            sketch = KLLSketch(seed=seed)
+            for chunk in np.array_split(half, 20):
+                sketch.add(chunk)
+            halves.append(sketch)
+        merged = halves[0].merge(halves[1])
+        
+        self.assertEqual(merged.count, self.data.size)
+        self.assertLess(merged.size, 2000)
+        ordered = np.sort(self.data)
+        qs = [0.25, 0.5, 0.75, 0.95]
+        for q, value in zip(qs, merged.quantiles(qs)):
+            rank = np.searchsorted(ordered, value) / ordered.size
+            self.assertLess(abs(rank - q), 0.013, q)
+    
+    def test_backend_matches_pandas(self):
+        """На малом штате (скетч еще не уплотнялся) совпадает с pandas точно"""
+        from .analytics import compute_salary_analytics
+        from .seeding import seed_payroll
+        
+        seed_payroll(employees=60, payments=40, batch_size=25)
+        expected = compute_salary_analytics('pandas')
+        actual = compute_salary_analytics('streaming')
+        
+        self.assertAlmostEqual(actual['salary_quartiles']['q2'], expected['salary_stats']['median'])
+        self.assertAnalyticsEqual(expected, actual)
+
+
+class RosterTest(TestCase):
+    """Штат в массивах NumPy и его инкрементальное обновление"""
+    
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .seeding import seed_payroll
+        seed_payroll(employees=50)
+        # Штат заведен давно: строки вне окна дочитывания
+        Product.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+    
+    def assertRosterMatchesDatabase(self, roster):
+        from .roster import LEVEL_CODES
+        rows = list(Product.objects.order_by('id').values_list('id', 'price', 'quantity', 'level'))
+        self.assertEqual(roster.ids.tolist(), [row[0] for row in rows])
+        self.assertEqual(roster.salary.tolist(), [int(row[1] * 100) for row in rows])
+        self.assertEqual(roster.service.tolist(), [row[2] for row in rows])
+        self.assertEqual([LEVEL_CODES[code] for code in roster.level], [row[3] for row in rows])
+    
+    def test_incremental_refresh(self):
+        """Изменения, добавления и удаления подхватываются без полной загрузки"""
+        from unittest import mock
+        from django.utils import timezone
+        from . import roster as roster_module
+        
+        roster = roster_module.load_roster()
+        self.assertRosterMatchesDatabase(roster)
+        self.assertEqual(roster.nbytes, 19 * len(roster))
+        self.assertIs(roster_module.refresh_roster(roster), roster)
+        
+        first, second = Product.objects.order_by('id')[:2]
+        Product.objects.filter(id=first.id).update(price=1, quantity=30, updated_at=timezone.now())
+        second.delete()
+        Product.objects.create(name="Новый", price=77777, quantity=3, employee_type='LEAD')
+        
+        with mock.patch.object(roster_module, 'load_roster', side_effect=AssertionError):
+            refreshed = roster_module.refresh_roster(roster)
+        self.assertRosterMatchesDatabase(refreshed)
+        self.assertEqual(len(roster), 50)
+    
+    def test_out_of_order_commit(self):
+        """Строка, зафиксированная позже с более ранним updated_at, не теряется"""
+        from datetime import timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from . import roster as roster_module
+        
+        first, second = Product.objects.order_by('id')[:2]
+        started = timezone.now()
+        # Вторая транзакция коммитится первой, со временем позже
+        Product.objects.filter(id=second.id).update(price=2, updated_at=started + timedelta(seconds=10))
+        roster = roster_module.refresh_roster(roster_module.load_roster())
+        version = roster.version
+        
+        # Первая коммитится после обновления штата: версия данных прежняя
+        Product.objects.filter(id=first.id).update(price=1, updated_at=started)
+        self.assertEqual(roster_module.current_version(), version)
+        with mock.patch.object(roster_module, 'load_roster', side_effect=AssertionError):
+            refreshed = roster_module.refresh_roster(roster)
+        self.assertRosterMatchesDatabase(refreshed)
+        self.assertIs(roster_module.refresh_roster(refreshed), refreshed)
+        
+        # Транзакции длиннее окна исправляет периодическая полная загрузка
+        Product.objects.filter(id=first.id).update(price=3, updated_at=started - timedelta(hours=2))
+        self.assertIs(roster_module.refresh_roster(refreshed), refreshed)
+        refreshed.loaded_at -= roster_module.ROSTER_FULL_RELOAD_SECONDS
+        self.assertRosterMatchesDatabase(roster_module.refresh_roster(refreshed))
+    
+    def test_index_summary_from_roster(self):
+        """Главная страница считает сводку по массивам так же, как по моделям"""
+        from statistics import median
+        
+        salaries = [float(price) for price in Product.objects.values_list('price', flat=True)]
+        analytics = self.client.get(reverse('index_analytics')).context['analytics']
+        
+        self.assertAlmostEqual(analytics['total_salary_fund'], sum(salaries))
+        self.assertAlmostEqual(analytics['median_salary'], median(salaries))
+        self.assertEqual(analytics['employee_count'], 50)
+        self.assertEqual(
+            sum(analytics[f'{level}_count'] for level in ('junior', 'middle', 'senior', 'lead', 'manager', 'other')),
+            50,
+        )
+
+
+class PaymentAmountsTest(TestCase):
+    """Суммы выплаты фиксируются при записи и не зависят от текущего оклада"""
+    
+    def setUp(self):
+        self.employee = Product.objects.create(name="Фиксация Ф.Ф.", price=40000, quantity=3)
+    
+    def test_amounts_survive_salary_change(self):
+        """Повышение оклада не меняет прошлые выплаты"""
+        from decimal import Decimal
+        
+        payment = Purchase.objects.create(product=self.employee, person="2500", address="Март")
+        Product.objects.filter(id=self.employee.id).update(price=90000)
+        payment.refresh_from_db()
+        
+        self.assertEqual(payment.base_salary, Decimal('40000.00'))
+        self.assertEqual(payment.bonus_amount, Decimal('2500.00'))
+        self.assertEqual(payment.final_amount, Decimal('42500.00'))
+        self.assertEqual(payment.final_salary, 42500.0)
+    
+    def test_post_stores_deductions(self):
+        """Форма выплаты сохраняет удержания и итоговую сумму"""
+        from decimal import Decimal
+        
+        response = self.client.post(reverse('process_payment', args=[self.employee.id]), {
+            'bonus': '3000',
+            'deductions': '500',
+            'description': 'С удержанием',
+        })
+        self.assertEqual(response.status_code, 200)
+        payment = Purchase.objects.get(product=self.employee)
+        self.assertEqual(payment.deductions, Decimal('500.00'))
+        self.assertEqual(payment.final_amount, Decimal('42500.00'))
+        self.assertContains(response, "42500")
+    
+    def test_non_numeric_bonus_is_zero(self):
+        """Нечисловая премия считается нулевой, как и раньше"""
+        from decimal import Decimal
+        from .models import parse_bonus
+        
+        self.assertEqual(parse_bonus("без премии"), Decimal('0.00'))
+        self.assertEqual(parse_bonus("1500.5"), Decimal('1500.50'))
+        payment = Purchase.objects.create(product=self.employee, person="нет", address="")
+        self.assertEqual(payment.final_amount, Decimal('40000.00'))
+
+
+class ReportJobTest(TransactionTestCase):
+    """Фоновые отчеты: заказ, обработка воркером, скачивание и срок хранения"""
+    # Воркер сам закрывает соединения между заданиями (close_old_connections),
+    # поэтому тест не держит данные в незакоммиченной транзакции
+    
+    def setUp(self):
+        import tempfile
+        from django.contrib.auth.models import User
+        
+        self.report_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.report_dir.cleanup)
+        settings_override = self.settings(SHOP_REPORT_DIR=self.report_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.employee = Product.objects.create(name="Отчетов О.О.", price=50000, quantity=3, position="Аналитик")
+        Product.objects.create(name="Другой Д.Д.", price=30000, quantity=1, position="Тестировщик")
+        for bonus in ("1000", "2000", "3000"):
+            Purchase.objects.create(product=self.employee, person=bonus, address="Отчет")
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(self.staff)
+    
+    def order(self, **data):
+        return self.client.post(reverse('report_jobs'), data)
+    
+    def test_csv_report_end_to_end(self):
+        """Заказ -> воркер пачками -> статус DONE -> скачивание файла"""
+        import csv
+        import io
+        from django.core.management import call_command
+        from .models import ReportJob
+        
+        response = self.order(kind='payments', format='csv', employee=self.employee.id)
+        job = ReportJob.objects.get()
+        self.assertRedirects(response, reverse('report_job_status', args=[job.id]))
+        self.assertEqual(job.status, ReportJob.PENDING)
+        self.assertEqual(job.filters, {'employee': self.employee.id})
+        
+        call_command('report_worker', '--once', '--chunk-size', '2', stdout=io.StringIO())
+        
+        status = self.client.get(reverse('report_job_status', args=[job.id]), {'format': 'json'}).json()
+        self.assertEqual(status['status'], ReportJob.DONE)
+        self.assertEqual((status['rows_done'], status['rows_total'], status['progress']), (3, 3, 1.0))
+        
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="payments-{job.id}.csv"')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(rows[0][:3], ['ID выплаты', 'ID сотрудника', 'Сотрудник'])
+        self.assertEqual([row[5] for row in rows[1:]], ['1000.00', '2000.00', '3000.00'])
+    
+    def test_json_employee_report_with_filters(self):
+        """Фильтры сотрудников сохраняются в задании и применяются к выборке"""
+        import json
+        from .models import ReportJob
+        from .reports import claim_next_job, report_path, run_job
+        
+        self.order(kind='employees', format='json', min_salary='40000', date_from='2020-01-01')
+        job = run_job(claim_next_job())
+        
+        self.assertEqual(job.filters, {'min_salary': '40000'})
+        self.assertEqual(job.status, ReportJob.DONE)
+        data = json.loads(report_path(job).read_text(encoding='utf-8'))
+        self.assertEqual([row['name'] for row in data], ["Отчетов О.О."])
+        self.assertEqual(data[0]['price'], '50000.00')
+        self.assertIsNone(claim_next_job())
+    
+    def test_other_users_cannot_download(self):
+        """Чужой отчет недоступен обычному сотруднику персонала"""
+        from django.contrib.auth.models import User
+        from .models import ReportJob
+        from .reports import claim_next_job, run_job
+        
+        self.order(kind='payments', format='csv')
+        job = run_job(claim_next_job())
+        
+        self.client.force_login(User.objects.create_user('other', password='x', is_staff=True))
+        self.assertEqual(self.client.get(reverse('report_download', args=[job.id])).status_code, 404)
+        self.assertEqual(ReportJob.objects.get().status, ReportJob.DONE)
+    
+    def test_expired_report_is_removed(self):
+        """После срока хранения файл удаляется, а скачивание отвечает 410"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import ReportJob
+        from .reports import claim_next_job, cleanup_reports, report_path, run_job
+        
+        self.order(kind='payments', format='csv')
+        job = run_job(claim_next_job())
+        self.assertTrue(report_path(job).exists())
+        
+        self.assertEqual(cleanup_reports(now=job.expires_at + timedelta(seconds=1)), 1)
+        self.assertFalse(report_path(job).exists())
+        self.assertEqual(ReportJob.objects.get().status, ReportJob.EXPIRED)
+        self.assertEqual(self.client.get(reverse('report_download', args=[job.id])).status_code, 410)
+        self.assertEqual(cleanup_reports(now=timezone.now() + timedelta(days=30)), 0)
+    
+    def test_invalid_order_rejected(self):
+        """Неверный период или недоступный формат не создают задание"""
+        from .models import ReportJob
+        from .reports import xlsx_available
+        
+        response = self.order(kind='payments', format='csv', date_from='2024-05-01', date_to='2024-04-01')
+        self.assertEqual(response.status_code, 400)
+        if not xlsx_available():
+            self.assertEqual(self.order(kind='payments', format='xlsx').status_code, 400)
+        self.assertFalse(ReportJob.objects.exists())
+
+
+class LazyIndexTest(TestCase):
+    """Главная: каркас и строки потоком, аналитика — отдельным фрагментом"""
+    
+    def setUp(self):
+        for n in range(5):
+            Product.objects.create(name=f"Сотрудник {n}", price=40000 + n * 1000, quantity=n)
+    
+    def test_shell_does_not_compute_analytics(self):
+        """Каркас страницы не трогает сводку, строки идут пачками"""
+        from unittest import mock
+        from . import views
+        
+        with mock.patch.object(views, 'get_roster', side_effect=AssertionError), \
+                mock.patch.object(views, 'INDEX_ROWS_CHUNK', 2):
+            response = self.client.get(reverse('index'))
+            self.assertTrue(response.streaming)
+            chunks = [chunk.decode('utf-8') for chunk in response.streaming_content]
+        
+        # Каркас до списка, три пачки строк (2 + 2 + 1) и окончание страницы
+        self.assertEqual(len(chunks), 5)
+        self.assertIn('id="analytics-panel"', chunks[0])
+        self.assertNotIn('Сотрудник 0', chunks[0])
+        self.assertIn('Сотрудник 4', chunks[3])
+        self.assertIn('</html>', chunks[4])
+    
+    async def test_asgi_streams_rows(self):
+        """Под ASGI строки тоже идут пачками, а не собираются в список"""
+        from unittest import mock
+        from . import views
+        
+        with mock.patch.object(views, 'INDEX_ROWS_CHUNK', 2):
+            response = await self.async_client.get(reverse('index'))
+            self.assertTrue(response.is_async)
+            chunks = [chunk.decode('utf-8') async for chunk in response.streaming_content]
+        
+        self.assertEqual(len(chunks), 5)
+        self.assertIn('Сотрудник 4', chunks[3])
+    
+    def test_inline_fallback_and_fragment(self):
+        """Без JavaScript аналитика встраивается сервером; фрагмент кешируется"""
+        response = self.client.get(reverse('index'), {'analytics': 'inline'})
+        self.assertEqual(response.context['analytics']['employee_count'], 5)
+        self.assertContains(response, "Фонд оплаты")
+        
+        fragment = self.client.get(reverse('index_analytics'))
+        self.assertContains(fragment, "Фонд оплаты")
+        self.assertNotContains(fragment, "<html")
+        response = self.client.get(reverse('index_analytics'), HTTP_IF_NONE_MATCH=fragment['ETag'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_empty_list(self):
+        """Пустой штат — строка-заглушка вместо списка"""
+        Product.objects.all().delete()
+        self.assertContains(self.client.get(reverse('index')), "Нет данных о сотрудниках")
+
+
+class SalaryAdjustmentTest(TestCase):
+    """Массовое изменение окладов: предпросмотр одним запросом, применение одним UPDATE"""
+    
+    def setUp(self):
+        self.middle_dev = Product.objects.create(name="Разработчик 1", price=51234, quantity=3, position="Разработчик")
+        self.middle_dev2 = Product.objects.create(name="Разработчик 2", price=60000, quantity=4, position="Разработчик")
+        self.middle_qa = Product.objects.create(name="Тестировщик", price=40000, quantity=3, position="Тестировщик")
+        self.junior_dev = Product.objects.create(name="Стажер", price=30000, quantity=1, position="Разработчик")
+    
+    def test_preview_is_one_query(self):
+        """Число, фонд до/после и разница по группам — одним агрегатом"""
+        from decimal import Decimal
+        from .salary_adjustment import preview_adjustment
+        
+        employees = Product.objects.filter(level='MIDDLE', position_ref__name="Разработчик")
+        with self.assertNumQueries(1):
+            preview = preview_adjustment(employees, percent=7, round_to=100)
+        
+        # 51234 * 1.07 = 54820.38 -> 54800; 60000 * 1.07 = 64200
+        self.assertEqual(preview['employees'], 2)
+        self.assertEqual(preview['fund_before'], Decimal('111234.00'))
+        self.assertEqual(preview['fund_after'], Decimal('119000.00'))
+        self.assertEqual(preview['delta'], Decimal('7766.00'))
+        self.assertEqual((preview['min_new'], preview['max_new']), (Decimal('54800.00'), Decimal('64200.00')))
+        self.assertEqual([(g['level'], g['position']) for g in preview['groups']], [('MIDDLE', "Разработчик")])
+        self.assertEqual(Product.objects.get(pk=self.middle_dev.pk).price, 51234)
+    
+    def test_apply_is_one_update_and_audited(self):
+        """Один UPDATE по всем сотрудникам, журнал с фондом до и после"""
+        from decimal import Decimal
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import SalaryAdjustment
+        from .salary_adjustment import apply_adjustment
+        
+        with CaptureQueriesContext(connection) as queries:
+            adjustment = apply_adjustment(Product.objects.filter(level='MIDDLE'), amount=1000, source='command')
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "shop_product"')]
+        self.assertEqual(len(updates), 1)
+        
+        self.assertEqual(adjustment.employees_count, 3)
+        self.assertEqual(adjustment.fund_before, Decimal('151234.00'))
+        self.assertEqual(adjustment.fund_after, Decimal('154234.00'))
+        self.assertEqual(SalaryAdjustment.objects.get().fund_delta, Decimal('3000.00'))
+        self.assertEqual(Product.objects.get(pk=self.middle_qa.pk).price, 41000)
+        self.assertEqual(Product.objects.get(pk=self.junior_dev.pk).price, 30000)
+    
+    def test_negative_salary_rejected(self):
+        """Правило, уводящее оклад в минус, не применяется"""
+        from django.core.exceptions import ValidationError
+        from .models import SalaryAdjustment
+        from .salary_adjustment import apply_adjustment
+        
+        with self.assertRaises(ValidationError):
+            apply_adjustment(Product.objects.all(), amount=-35000)
+        self.assertFalse(SalaryAdjustment.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.junior_dev.pk).price, 30000)
+    
+    def test_admin_action_preview_then_apply(self):
+        """Действие админки: форма, предпросмотр, применение ко всем отфильтрованным"""
+        from django.contrib.auth.models import User
+        from .models import SalaryAdjustment
+        
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        url = reverse('admin:shop_product_changelist') + '?level__exact=MIDDLE'
+        data = {'action': 'adjust_salaries', 'select_across': '1', '_selected_action': [self.middle_qa.pk]}
+        
+        response = self.client.post(url, data)
+        self.assertContains(response, "Предпросмотр")
+        
+        response = self.client.post(url, {**data, 'percent': '10', 'amount': '0', 'round_to': '100', 'preview': '1'})
+        self.assertContains(response, "Применить к 3 сотрудникам")
+        self.assertFalse(SalaryAdjustment.objects.exists())
+        
+        response = self.client.post(url, {**data, 'percent': '10', 'amount': '0', 'round_to': '100', 'apply': '1'})
+        self.assertEqual(response.status_code, 302)
+        adjustment = SalaryAdjustment.objects.get()
+        self.assertEqual(adjustment.employees_count, 3)
+        self.assertEqual(adjustment.selection['filters'], {'level__exact': 'MIDDLE'})
+        self.assertEqual(Product.objects.get(pk=self.middle_qa.pk).price, 44000)
+    
+    def test_command_previews_unless_applied(self):
+        """Команда без --apply ничего не меняет"""
+        import io
+        from django.core.management import call_command
+        from .models import SalaryAdjustment
+        
+        out = io.StringIO()
+        call_command('adjust_salaries', '--percent', '5', '--level', 'middle', '--position', 'Тестировщик', stdout=out)
+        self.assertIn("ИТОГО", out.getvalue())
+        self.assertEqual(Product.objects.get(pk=self.middle_qa.pk).price, 40000)
+        
+        call_command('adjust_salaries', '--percent', '5', '--level', 'middle', '--position', 'Тестировщик',
+                     '--apply', stdout=out)
+        self.assertEqual(Product.objects.get(pk=self.middle_qa.pk).price, 42000)
+        self.assertEqual(SalaryAdjustment.objects.get().selection, {'level': ['MIDDLE'], 'position': ['Тестировщик']})
+
+
+class LiveEventsTest(TestCase):
+    """Живые обновления: события после коммита, снимок фонда, поток SSE"""
+    
+    def setUp(self):
+        from unittest import mock
+        from . import live, views
+        
+        # Свой брокер на тест, чтобы события не переходили между тестами
+        self.broker = live.LiveBroker()
+        for module in (live, views):
+            patcher = mock.patch.object(module, 'broker', self.broker)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.employee = Product.objects.create(name="Иван Иванов", price=50000, quantity=3, position="Разработчик")
+    
+    def test_broker_delivers_across_threads(self):
+        """Событие из другого потока попадает в очередь подписчика"""
+        import asyncio
+        import threading
+        from asgiref.sync import async_to_sync
+        
+        async def receive():
+            subscription = self.broker.subscribe()
+            thread = threading.Thread(target=self.broker.publish, args=('payment', {'id': 1}))
+            thread.start()
+            event = await asyncio.wait_for(subscription.queue.get(), 5)
+            thread.join()
+            self.broker.unsubscribe(subscription)
+            return event
+        
+        event = async_to_sync(receive)()
+        self.assertEqual((event['event'], event['data']), ('payment', '{"id": 1}'))
+        self.assertEqual(self.broker.subscriber_count, 0)
+    
+    def test_payment_event_sent_on_commit(self):
+        """Новая выплата рассылается только после коммита"""
+        import json
+        
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            payment = Purchase.objects.create(product=self.employee, person="1000", address="Премия")
+            self.assertNotIn('payment', self.broker.latest)
+        
+        self.assertTrue(callbacks)
+        data = json.loads(self.broker.latest['payment']['data'])
+        self.assertEqual(data['id'], payment.pk)
+        self.assertEqual(data['employee_name'], "Иван Иванов")
+        self.assertEqual(data['final_amount'], "51000.00")
+    
+    def test_payroll_snapshot_with_delta(self):
+        """Снимок считается один раз на пачку изменений и несет разницу"""
+        import json
+        from unittest import mock
+        from .live import LiveBroker, PayrollPublisher
+        
+        publisher = PayrollPublisher()
+        # Без подписчиков снимок не считается
+        publisher._dirty.set()
+        self.assertIsNone(publisher.publish_pending())
+        self.assertNotIn('payroll', self.broker.latest)
+        
+        with mock.patch.object(LiveBroker, 'subscriber_count', new_callable=mock.PropertyMock, return_value=1):
+            publisher._dirty.set()
+            first = publisher.publish_pending()
+            self.assertIsNone(first['fund_delta'])
+            self.assertIsNone(publisher.publish_pending())
+            
+            Product.objects.create(name="Петр Петров", price=70000, quantity=6, position="Тимлид")
+            publisher._dirty.set()
+            second = publisher.publish_pending()
+        
+        self.assertEqual(second['fund_delta'], 70000)
+        self.assertEqual(second['employee_count_delta'], 1)
+        self.assertEqual(second['levels']['SENIOR'], 1)
+        self.assertEqual(json.loads(self.broker.latest['payroll']['data'])['employee_count'], 2)
+    
+    def test_bulk_update_marks_payroll_dirty(self):
+        """Массовое изменение окладов (без сигналов) тоже обновляет снимок"""
+        from unittest import mock
+        from . import live
+        from .salary_adjustment import apply_adjustment
+        
+        with mock.patch.object(live.publisher, 'mark_dirty') as mark_dirty:
+            with self.captureOnCommitCallbacks(execute=True):
+                apply_adjustment(Product.objects.all(), percent=10, source='command')
+        mark_dirty.assert_called_once()
+    
+    def test_wsgi_request_rejected(self):
+        """Под WSGI поток не открывается"""
+        response = self.client.get(reverse('live_events'))
+        self.assertEqual(response.status_code, 501)
+    
+    async def test_stream_starts_with_latest_snapshot(self):
+        """Новый подписчик сразу получает последний снимок, без расчета"""
+        self.broker.publish('payroll', {'employee_count': 1})
+        
+        response = await self.async_client.get(reverse('live_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b"retry: 5000\n\n")
+        self.assertEqual(
+            await anext(chunks),
+            b'id: 1\nevent: payroll\ndata: {"employee_count": 1}\n\n',
+        )
+        await chunks.aclose()
+
+
+class BatchedDeletionTest(TestCase):
+    """Удаление сотрудников и выплат пачками, срок хранения выплат"""
+    
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import PurchaseArchive
+        
+        self.leaver = Product.objects.create(name="Уволенный", price=50000, quantity=10, position="Разработчик")
+        self.staying = Product.objects.create(name="Остающийся", price=60000, quantity=2, position="Аналитик")
+        for n in range(7):
+            Purchase.objects.create(product=self.leaver, person="100", address=f"Выплата {n}")
+        Purchase.objects.create(product=self.staying, person="200", address="Выплата")
+        
+        self.old_date = timezone.now() - timedelta(days=4 * 365)
+        for n in range(3):
+            PurchaseArchive.objects.create(
+                id=1000 + n, product=self.leaver, person="0", address="Архив",
+                date=self.old_date, base_salary=50000,
+            )
+    
+    def test_delete_employees_in_batches(self):
+        """Выплаты удаляются пачками до сотрудника, чужие не затрагиваются"""
+        from .deletion import delete_employees
+        from .models import PurchaseArchive
+        
+        messages = []
+        employees, payments = delete_employees(
+            Product.objects.filter(pk=self.leaver.pk), batch_size=3, progress=messages.append,
+        )
+        
+        self.assertEqual((employees, payments), (1, 10))
+        self.assertFalse(Product.objects.filter(pk=self.leaver.pk).exists())
+        self.assertFalse(PurchaseArchive.objects.exists())
+        self.assertEqual(Purchase.objects.get().product, self.staying)
+        # 7 оперативных пачками 3 + 3 + 1, 3 архивных — одной полной и пустой проверкой
+        self.assertIn("удалено 7", ' '.join(messages))
+        self.assertEqual(messages[-1], "Сотрудники: удалено 1 из 1")
+    
+    def test_purge_command(self):
+        """Удаляются только выплаты старше срока, счетчики периодов обновляются"""
+        import io
+        from django.core.management import call_command
+        from .archive import month_start
+        from .models import PaymentPeriod, PurchaseArchive
+        
+        period = PaymentPeriod.objects.create(month=month_start(self.old_date).date(), payments_count=3)
+        Purchase.objects.filter(address="Выплата 0").update(date=self.old_date)
+        
+        out = io.StringIO()
+        call_command('purge_payments', '--older-than-years', '3', '--dry-run', stdout=out)
+        self.assertIn(": 4 (ничего не удалено)", out.getvalue())
+        self.assertEqual(PurchaseArchive.objects.count(), 3)
+        
+        call_command('purge_payments', '--older-than-years', '3', '--batch-size', '2', stdout=out)
+        self.assertIn("удалено выплат", out.getvalue())
+        self.assertFalse(PurchaseArchive.objects.exists())
+        self.assertEqual(Purchase.objects.count(), 7)
+        period.refresh_from_db()
+        self.assertEqual(period.payments_count, 0)
+    
+    def test_admin_delete_uses_batches(self):
+        """Подтверждение в админке показывает выплаты числом, удаление — пачками"""
+        from unittest import mock
+        from django.contrib.auth.models import User
+        from . import admin as shop_admin
+        
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        data = {'action': 'delete_selected', '_selected_action': [self.leaver.pk]}
+        
+        response = self.client.post('/admin/shop/product/', data)
+        self.assertContains(response, "Архив выплат: 3")
+        self.assertNotContains(response, "Выплата 0")
+        
+        with mock.patch.object(shop_admin, 'delete_employees', wraps=shop_admin.delete_employees) as delete:
+            response = self.client.post('/admin/shop/product/', {**data, 'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        delete.assert_called_once()
+        self.assertEqual(list(Product.objects.all()), [self.staying])
+        self.assertEqual(Purchase.objects.count(), 1)
+
+
+from importlib.util import find_spec
+
+
+@skipUnless(find_spec('jinja2'), "Нужен пакет jinja2")
+class TemplateEngineParityTest(TestCase):
+    """Шаблоны списков на Jinja2 выводят то же, что шаблоны Django"""
+    
+    def setUp(self):
+        Product.objects.create(name="Иван О'Нил <b>", price=50000.5, quantity=1, position="Разработчик")
+        Product.objects.create(name="Петр Петров", price=123456.78, quantity=4, position="Аналитик & тестировщик")
+        Product.objects.create(name="Анна", price=90000, quantity=12, employee_type='LEAD')
+        Product.objects.create(name="Олег", price=80000, quantity=0, employee_type='MANAGER')
+    
+    def assertSameHtml(self, first, second):
+        from .jinja_env import comparable_html
+        self.assertEqual(comparable_html(first), comparable_html(second))
+    
+    def test_list_templates_match(self):
+        """Строки главной и полный список — одинаково в обоих движках"""
+        from django.template.loader import get_template
+        
+        employees = list(Product.objects.all())
+        for name in ('shop/_employee_rows.html', 'shop/employee_list.html'):
+            for context in ({'employees': employees}, {'employees': []}):
+                with self.subTest(template=name, rows=len(context['employees'])):
+                    self.assertSameHtml(
+                        get_template(name, using='django').render(context),
+                        get_template(name, using='jinja2').render(context),
+                    )
+    
+    def test_floatformat_matches_django(self):
+        """Быстрый путь floatformat округляет и локализует как фильтр Django"""
+        from decimal import Decimal
+        from django.template.defaultfilters import floatformat as django_floatformat
+        from .jinja_env import floatformat
+        
+        for value, arg in [
+            (Decimal('1234.565'), 2), (Decimal('50000'), 2), (3, 1), (0, 1), (Decimal('-0.001'), 2),
+            (Decimal('-2.5'), 0), (12.25, 1), ('7.5', 2), ('нет', 2), (None, 2), (Decimal('3.14159'), -1),
+        ]:
+            with self.subTest(value=value, arg=arg):
+                self.assertEqual(floatformat(value, arg), django_floatformat(value, arg))
+    
+    def test_index_rows_rendered_by_setting(self):
+        """SHOP_LIST_TEMPLATES переключает строки главной, страница не меняется"""
+        from django.core.exceptions import ImproperlyConfigured
+        from django.test import override_settings
+        
+        pages = {}
+        for engine in ('django', 'jinja2'):
+            with override_settings(SHOP_LIST_TEMPLATES=engine):
+                response = self.client.get(reverse('index'))
+                pages[engine] = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn("Аналитик &amp; тестировщик", pages['jinja2'])
+        self.assertSameHtml(pages['django'], pages['jinja2'])
+        
+        with override_settings(SHOP_LIST_TEMPLATES='mako'), self.assertRaises(ImproperlyConfigured):
+            self.client.get(reverse('index'))
+
+
+# =========== ТЕСТЫ СПРАВОЧНИКА ДОЛЖНОСТЕЙ ===========
+class PositionTest(TestCase):
+    """Должности — справочник с целым ключом вместо свободного текста"""
+    
+    def setUp(self):
+        self.dev = Product.objects.create(name="Иван", price=50000, quantity=3, position="Разработчик")
+        self.dev_typo = Product.objects.create(name="Петр", price=70000, quantity=3, position="  разработчик ")
+        self.qa = Product.objects.create(name="Анна", price=40000, quantity=3, position="Тестировщик")
+    
+    def test_variants_share_one_position(self):
+        """Регистр и пробелы не создают новых должностей; пустая — по умолчанию"""
+        from .models import DEFAULT_POSITION, Position
+        
+        self.assertEqual(self.dev.position_ref_id, self.dev_typo.position_ref_id)
+        self.assertEqual(Product.objects.get(pk=self.dev_typo.pk).position, "Разработчик")
+        self.assertEqual(Position.objects.count(), 2)
+        
+        nobody = Product.objects.create(name="Без должности", price=1000, quantity=0, position="")
+        self.assertEqual(Product.objects.get(pk=nobody.pk).position, DEFAULT_POSITION)
+        
+        self.qa.position = "Разработчик"
+        self.qa.save()
+        self.assertEqual(self.dev.position_ref.employees.count(), 3)
+    
+    def test_search_and_analytics_use_position_key(self):
+        """Поиск находит по названию должности, аналитика группирует по ключу"""
+        from .analytics import salary_analytics_sql
+        from .search import search_employees
+        
+        found = search_employees(Product.objects.all(), "разработчик")
+        self.assertEqual(set(found), {self.dev, self.dev_typo})
+        
+        stats = salary_analytics_sql()
+        self.assertEqual(stats['by_position']['count'], {"Разработчик": 2, "Тестировщик": 1})
+    
+    def test_admin_merge_and_list_editable(self):
+        """Слияние дублей переносит сотрудников; должность меняется в списке"""
+        from django.contrib.auth.models import User
+        from .models import Position
+        
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        developer = self.dev.position_ref
+        duplicate = Position.objects.create(name="Программист")
+        Product.objects.filter(pk=self.dev_typo.pk).update(position_ref=duplicate)
+        
+        response = self.client.post(reverse('admin:shop_position_changelist'), {
+            'action': 'merge_positions', '_selected_action': [developer.pk, duplicate.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Position.objects.filter(pk=duplicate.pk).exists())
+        self.assertEqual(Product.objects.get(pk=self.dev_typo.pk).position_ref_id, developer.pk)
+        
+        url = reverse('admin:shop_product_changelist')
+        response = self.client.get(url)
+        self.assertContains(response, 'name="form-0-position_ref"')
+
+
+# =========== ТЕСТЫ OUTBOX ===========
+class OutboxTest(TestCase):
+    """События для внешних систем пишутся вместе с изменением и доставляются пачками"""
+    
+    def setUp(self):
+        self.employee = Product.objects.create(name="Иван Иванов", price=50000, quantity=3, position="Разработчик")
+    
+    def events(self, topic):
+        from .models import OutboxEvent
+        return list(OutboxEvent.objects.filter(topic=topic).values_list('employee_id', 'payload'))
+    
+    def test_payment_and_salary_events(self):
+        """Выплата — событие payment.created; оклад — только если изменился"""
+        from .models import OutboxEvent
+        
+        self.client.post(reverse('process_payment', args=[self.employee.pk]), {'bonus': '1000', 'deductions': '200'})
+        [(employee_id, payload)] = self.events(OutboxEvent.PAYMENT_CREATED)
+        self.assertEqual(employee_id, self.employee.pk)
+        self.assertEqual(payload['final_amount'], '50800.00')
+        
+        employee = Product.objects.get(pk=self.employee.pk)
+        employee.quantity += 1
+        employee.save()
+        employee.price = 55000
+        employee.save()
+        self.assertEqual(self.events(OutboxEvent.SALARY_CHANGED), [
+            (self.employee.pk, {'salary': '50000.00', 'previous_salary': None, 'adjustment_id': None}),
+            (self.employee.pk, {'salary': '55000.00', 'previous_salary': '50000.00', 'adjustment_id': None}),
+        ])
+    
+    def test_payment_rolled_back_with_event(self):
+        """Не записалось событие — нет и выплаты, стаж не изменился"""
+        from unittest import mock
+        from django.db import DatabaseError
+        from .models import OutboxEvent
+        
+        with mock.patch.object(OutboxEvent.objects, 'create', side_effect=DatabaseError("outbox")):
+            with self.assertRaises(DatabaseError):
+                self.client.post(reverse('process_payment', args=[self.employee.pk]), {'bonus': '0'})
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.employee.pk).quantity, 3)
+    
+    def test_mass_adjustment_records_each_employee(self):
+        """Массовое изменение окладов — событие на каждого сотрудника, чей оклад изменился"""
+        from decimal import Decimal
+        from .models import OutboxEvent
+        from .salary_adjustment import apply_adjustment
+        
+        other = Product.objects.create(name="Петр", price=30000, quantity=1)
+        # +10% и округление до 1000 оставляют 4000 как есть
+        Product.objects.create(name="Без изменений", price=4000, quantity=1)
+        OutboxEvent.objects.all().delete()
+        adjustment = apply_adjustment(Product.objects.all(), percent=10, round_to=1000)
+        self.assertEqual(self.events(OutboxEvent.SALARY_CHANGED), [
+            (self.employee.pk, {'salary': '55000.00', 'previous_salary': '50000.00', 'adjustment_id': adjustment.pk}),
+            (other.pk, {'salary': '33000.00', 'previous_salary': '30000.00', 'adjustment_id': adjustment.pk}),
+        ])
+        self.assertEqual((adjustment.employees_count, adjustment.fund_after), (3, Decimal('92000.00')))
+    
+    def test_salary_payload_same_on_both_paths(self):
+        """Правка одного сотрудника и массовое изменение дают одинаковую схему события"""
+        from .models import OutboxEvent
+        from .salary_adjustment import apply_adjustment
+        
+        self.employee.price = 51000
+        self.employee.save()
+        apply_adjustment(Product.objects.filter(pk=self.employee.pk), amount=1000)
+        saved, adjusted = [payload for _, payload in self.events(OutboxEvent.SALARY_CHANGED)][-2:]
+        self.assertEqual(set(saved), set(adjusted))
+        self.assertEqual(adjusted['previous_salary'], saved['salary'])
+    
+    def test_dispatch_in_batches_and_prune(self):
+        """Диспетчер доставляет пачки по порядку, ведет смещение, чистит доставленное"""
+        import io
+        import json
+        import os
+        import tempfile
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import OutboxEvent, OutboxOffset
+        from .outbox import FileSink, dispatch_batch, prune_delivered, sink_name
+        
+        for salary in (51000, 52000):
+            self.employee.price = salary
+            self.employee.save()
+        with tempfile.TemporaryDirectory() as directory:
+            target = os.path.join(directory, 'events.jsonl')
+            sink = FileSink(target)
+            
+            class BrokenSink(FileSink):
+                def send(self, events):
+                    raise OSError("нет связи")
+            
+            with self.assertRaises(OSError):
+                dispatch_batch(BrokenSink(target))
+            self.assertEqual(OutboxEvent.objects.filter(delivered_at__isnull=True).count(), 3)
+            
+            self.assertEqual(dispatch_batch(sink, batch_size=2), 2)
+            call_command('outbox_dispatcher', '--once', '--sink', 'file', '--target', target, stdout=io.StringIO())
+            with open(target, encoding='utf-8') as stream:
+                messages = [json.loads(line) for line in stream]
+        
+        ids = list(OutboxEvent.objects.values_list('id', flat=True))
+        self.assertEqual([message['id'] for message in messages], ids)
+        self.assertEqual(
+            messages[-1]['payload'], {'salary': '52000.00', 'previous_salary': '51000.00', 'adjustment_id': None},
+        )
+        offset = OutboxOffset.objects.get(sink=sink_name(sink))
+        self.assertEqual((offset.last_event_id, offset.delivered_count), (ids[-1], 3))
+        
+        self.assertEqual(prune_delivered(retention_hours=1), 0)
+        self.assertEqual(prune_delivered(retention_hours=1, now=timezone.now() + timedelta(hours=2)), 3)
+
+
+# =========== ТЕСТЫ СТАТИКИ И СЖАТИЯ ===========
+class StaticAndCompressionTest(TestCase):
+    """Стили — в хешированном статическом файле, страницы сжимаются"""
+    
+    def setUp(self):
+        for n in range(50):
+            Product.objects.create(name=f"Сотрудник {n}", price=40000 + n, quantity=n % 8, position="Разработчик")
+    
+    def page(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+    
+    def test_pages_link_hashed_stylesheet(self):
+        """После collectstatic страницы ссылаются на файл с хешем, без <style>"""
+        import tempfile
+        from django.core.management import call_command
+        from django.test import override_settings
+        
+        manifest = {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'}
+        with tempfile.TemporaryDirectory() as root, \
+                override_settings(STATIC_ROOT=root, STORAGES={**settings.STORAGES, 'staticfiles': manifest}):
+            call_command('collectstatic', '--noinput', '--ignore', 'admin', verbosity=0)
+            for url in (reverse('index'), reverse('salary_analytics')):
+                with self.subTest(url=url):
+                    html = self.page(self.client.get(url)).decode('utf-8')
+                    self.assertRegex(html, r'href="/static/shop/css/shop\.[0-9a-f]{12}\.css"')
+                    self.assertNotIn('<style>', html)
+    
+    def test_streamed_index_gzip(self):
+        """Потоковая главная сжимается gzip по частям и распаковывается в ту же страницу"""
+        import gzip
+        
+        plain = self.page(self.client.get(reverse('index')))
+        response = self.client.get(reverse('index'), headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        compressed = self.page(response)
+        self.assertEqual(gzip.decompress(compressed), plain)
+        self.assertLess(len(compressed) * 5, len(plain))
+    
+    def test_brotli_preferred_when_accepted(self):
+        """Brotli — если клиент его принимает; event-stream не сжимается"""
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .middleware import CompressionMiddleware, brotli
+        
+        if brotli is None:
+            self.skipTest("Нужен пакет Brotli")
+        plain = self.page(self.client.get(reverse('index')))
+        response = self.client.get(reverse('index'), headers={'Accept-Encoding': 'gzip, deflate, br'})
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(self.page(response)), plain)
+        
+        request = RequestFactory().get('/', headers={'Accept-Encoding': 'br'})
+        events = HttpResponse(b'data: x\n\n' * 100, content_type='text/event-stream')
+        self.assertFalse(CompressionMiddleware(lambda r: events).process_response(request, events).has_header('Content-Encoding'))
+    
+    def test_downloads_not_compressed(self):
+        """Файлы для скачивания (JSON-отчет) отдаются без сжатия, с Content-Length"""
+        import io
+        from django.http import FileResponse, HttpResponse
+        from django.test import RequestFactory
+        from .middleware import CompressionMiddleware
+        
+        middleware = CompressionMiddleware(lambda r: None)
+        for encoding in ('gzip', 'br'):
+            with self.subTest(encoding=encoding):
+                request = RequestFactory().get('/', headers={'Accept-Encoding': encoding})
+                report = FileResponse(
+                    io.BytesIO(b'[{"id": 1}]' * 100), as_attachment=True,
+                    filename='report.json', content_type='application/json',
+                )
+                report['Content-Length'] = '1100'
+                response = middleware.process_response(request, report)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response['Content-Length'], '1100')
+                
+                attachment = HttpResponse(b'[{"id": 1}]' * 100, content_type='application/json')
+                attachment['Content-Disposition'] = 'attachment; filename="report.json"'
+                self.assertFalse(middleware.process_response(request, attachment).has_header('Content-Encoding'))
+
+
+# =========== ТЕСТЫ РАЗДЕЛОВ АНАЛИТИКИ ===========
+class AnalyticsSectionsTest(TestCase):
+    """Квартили, выплаты по типам и топ по премиям — агрегатами в БД"""
+    
+    def setUp(self):
+        from datetime import date, datetime
+        from django.utils import timezone
+        from .archive import close_periods
+        
+        self.ivan = Product.objects.create(name="Иван", price=100, quantity=1)
+        self.petr = Product.objects.create(name="Петр", price=200, quantity=3)
+        self.anna = Product.objects.create(name="Анна", price=400, quantity=6)
+        Product.objects.create(name="Олег", price=300, quantity=2)
+        # Иван: 500 в архиве + 100 сейчас; Петр: 300 сейчас; Анна — без премий
+        old = Purchase.objects.create(product=self.ivan, person="500", address="Январь", payment_type='BONUS')
+        Purchase.objects.filter(pk=old.pk).update(date=timezone.make_aware(datetime(2024, 1, 15)))
+        close_periods(date(2024, 2, 1))
+        Purchase.objects.create(product=self.ivan, person="100", address="Зарплата")
+        Purchase.objects.create(product=self.petr, person="300", address="Зарплата", payment_type=None)
+        Purchase.objects.create(product=self.anna, person="нет", address="Отпуск", payment_type='VACATION')
+    
+    def test_sections_match_pandas(self):
+        """SQL-бэкенд считает разделы так же, как pandas, с учетом архива"""
+        from .analytics import compute_salary_analytics
+        
+        for backend in ('sql', 'pandas', 'streaming'):
+            with self.subTest(backend=backend):
+                analytics = compute_salary_analytics(backend)
+                self.assertEqual(analytics['salary_quartiles'], {'q1': 175.0, 'q2': 250.0, 'q3': 325.0})
+                self.assertEqual(analytics['top_employees_by_bonus'], [("Иван", 600.0), ("Петр", 300.0)])
+                self.assertEqual(analytics['bonus_stats']['min_bonus'], 0.0)
+                # Пустой тип выплаты — зарплата; порядок — по сумме выплат
+                self.assertEqual(list(analytics['by_payment_type']), ["Зарплата", "Премия", "Отпускные"])
+                self.assertEqual(analytics['by_payment_type']["Зарплата"]['count'], 2)
+                self.assertEqual(analytics['by_payment_type']["Зарплата"]['sum'], 700.0)
+    
+    def test_top_keeps_same_named_employees(self):
+        """Однофамильцы в топе не сливаются: у каждого своя сумма"""
+        from .analytics import compute_salary_analytics
+        
+        namesake = Product.objects.create(name="Петр", price=250, quantity=2)
+        Purchase.objects.create(product=namesake, person="400", address="Премия", payment_type='BONUS')
+        
+        for backend in ('sql', 'pandas', 'streaming'):
+            with self.subTest(backend=backend):
+                analytics = compute_salary_analytics(backend)
+                self.assertEqual(
+                    analytics['top_employees_by_bonus'],
+                    [("Иван", 600.0), ("Петр", 400.0), ("Петр", 300.0)],
+                )
+        response = self.client.get(reverse('salary_analytics'))
+        for total in ("400,00", "300,00"):
+            self.assertContains(response, f"<tr><td>Петр</td><td>{total} руб.</td></tr>", html=True)
+    
+    def test_page_shows_sections(self):
+        """Страница аналитики показывает новые разделы, включая нулевую минимальную премию"""
+        response = self.client.get(reverse('salary_analytics'))
+        for text in ("Квартили зарплат", "Выплаты по типам", "Топ сотрудников по бонусам", "Минимальная премия"):
+            self.assertContains(response, text)
+
+
+# =========== ТЕСТЫ АНАЛИТИКИ ЗА ПЕРИОД ===========
+class PeriodAnalyticsTest(TestCase):
+    """Выплаты за период from/to, сравнение и кэш закрытых периодов"""
+    
+    def setUp(self):
+        from datetime import date, datetime
+        from django.core.cache import cache
+        from django.utils import timezone
+        from .archive import close_periods
+        
+        cache.clear()
+        self.ivan = Product.objects.create(name="Иван", price=100, quantity=1)
+        self.petr = Product.objects.create(name="Петр", price=200, quantity=3)
+        # Декабрь 2023: 200 у Петра; январь 2024: 500 и 100 у Ивана; все в архиве
+        for employee, amount, day in ((self.petr, "200", date(2023, 12, 10)),
+                                      (self.ivan, "500", date(2024, 1, 15)),
+                                      (self.ivan, "100", date(2024, 1, 20))):
+            payment = Purchase.objects.create(product=employee, person=amount, address="Премия", payment_type='BONUS')
+            Purchase.objects.filter(pk=payment.pk).update(
+                date=timezone.make_aware(datetime(day.year, day.month, day.day, 12)),
+            )
+        close_periods(date(2024, 2, 1))
+        Purchase.objects.create(product=self.petr, person="300", address="Зарплата")
+    
+    def test_period_params(self):
+        """Разбор from/to/compare; открытый период сравнивается по сегодня"""
+        from datetime import date
+        from .analytics import analytics_period
+        
+        self.assertEqual(analytics_period({}), (None, None, None))
+        self.assertEqual(
+            analytics_period({'from': '2024-01-01', 'compare': 'previous'}, today=date(2024, 1, 31)),
+            (date(2024, 1, 1), date(2024, 1, 31), 'previous'),
+        )
+        for params in ({'from': '2024-13-01'}, {'from': '2024-02-01', 'to': '2024-01-01'},
+                       {'to': '2024-01-31', 'compare': 'previous'}, {'from': '2024-01-01', 'compare': 'week'}):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                analytics_period(params)
+    
+    def test_previous_period(self):
+        """Целые месяцы сдвигаются на месяцы, иначе — на длину периода"""
+        from datetime import date
+        from .analytics import previous_period
+        
+        cases = [
+            ((date(2024, 3, 1), date(2024, 3, 31), 'previous'), (date(2024, 2, 1), date(2024, 2, 29))),
+            ((date(2024, 4, 1), date(2024, 6, 30), 'previous'), (date(2024, 1, 1), date(2024, 3, 31))),
+            ((date(2024, 1, 11), date(2024, 1, 20), 'previous'), (date(2024, 1, 1), date(2024, 1, 10))),
+            ((date(2024, 2, 1), date(2024, 2, 29), 'year'), (date(2023, 2, 1), date(2023, 2, 28))),
+        ]
+        for args, expected in cases:
+            with self.subTest(args=args):
+                self.assertEqual(previous_period(*args), expected)
+    
+    def test_backends_filter_period(self):
+        """Все бэкенды считают выплаты только за период; оклады — по штату"""
+        from datetime import date
+        from .analytics import compute_salary_analytics
+        
+        for backend in ('sql', 'pandas', 'streaming'):
+            with self.subTest(backend=backend):
+                analytics = compute_salary_analytics(backend, date(2024, 1, 1), date(2024, 1, 31))
+                self.assertEqual(analytics['total_employees'], 2)
+                self.assertEqual(analytics['bonus_stats']['total_bonuses'], 600.0)
+                self.assertEqual(analytics['by_payment_type']["Премия"]['count'], 2)
+                self.assertEqual(analytics['top_employees_by_bonus'], [("Иван", 600.0)])
+                self.assertEqual(analytics['period'], {'from': date(2024, 1, 1), 'to': date(2024, 1, 31)})
+        # Открытый период задевает только оперативную таблицу
+        analytics = compute_salary_analytics('sql', date(2024, 2, 1))
+        self.assertEqual(analytics['top_employees_by_bonus'], [("Петр", 300.0)])
+        self.assertEqual(list(analytics['by_payment_type']), ["Зарплата"])
+    
+    def test_comparison(self):
+        """Сравнение января с декабрем: изменение в процентах"""
+        from datetime import date
+        from .analytics import compute_salary_analytics
+        
+        analytics = compute_salary_analytics('sql', date(2024, 1, 1), date(2024, 1, 31), 'previous')
+        comparison = analytics['comparison']
+        self.assertEqual((comparison['from'], comparison['to']), (date(2023, 12, 1), date(2023, 12, 31)))
+        metrics = {row['label']: row for row in comparison['metrics']}
+        self.assertEqual(metrics["Сумма премий"]['previous'], 200.0)
+        self.assertEqual(metrics["Сумма премий"]['change'], 200.0)
+        self.assertEqual(metrics["Количество выплат"]['current'], 2.0)
+        # Пустой период сравнения — изменения нет
+        analytics = compute_salary_analytics('sql', date(2024, 1, 1), date(2024, 1, 31), 'year')
+        self.assertIsNone(analytics['comparison']['metrics'][0]['change'])
+    
+    def test_closed_period_cached(self):
+        """Закрытый период повторно — из кэша; удаление выплат сбрасывает кэш"""
+        from datetime import date
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .analytics import payment_sections, period_bounds
+        from .deletion import delete_employee_payments
+        
+        start, end = period_bounds(date(2024, 1, 1), date(2024, 1, 31))
+        first = payment_sections(start, end)
+        # Горизонт архива и COUNT выплат периода для ключа кэша
+        with self.assertNumQueries(2):
+            self.assertEqual(payment_sections(start, end), first)
+        
+        delete_employee_payments([self.ivan.pk])
+        self.assertEqual(payment_sections(start, end), {})
+        # Незакрытый период не кэшируется
+        start, end = period_bounds(date(2024, 1, 1), date.today())
+        payment_sections(start, end)
+        with CaptureQueriesContext(connection) as queries:
+            payment_sections(start, end)
+        self.assertGreater(len(queries), 2)
+    
+    def test_page_period_and_comparison(self):
+        """Страница принимает from/to/compare и отвечает 400 на неверный период"""
+        url = reverse('salary_analytics')
+        response = self.client.get(url, {'from': '2024-01-01', 'to': '2024-01-31', 'compare': 'previous'})
+        self.assertContains(response, "Сравнение с периодом 01.12.2023 — 31.12.2023")
+        self.assertContains(response, "+200,0%")
+        self.assertContains(response, "Этот квартал")
+        self.assertEqual(self.client.get(url, {'from': 'вчера'}).status_code, 400)
@@ -3,6 +3,15 @@ from . import views
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('analytics/summary/', views.index_analytics, name='index_analytics'),
+    path('live/events/', views.live_events, name='live_events'),
     path('buy/<int:employee_id>/', views.process_payment, name='process_payment'),
     path('analytics/', views.salary_analytics, name='salary_analytics'),
+    path('analytics/snapshots/', views.payroll_snapshots, name='payroll_snapshots'),
+    path('reports/', views.report_jobs, name='report_jobs'),
+    path('reports/<int:job_id>/', views.report_job_status, name='report_job_status'),
+    path('reports/<int:job_id>/download/', views.report_download, name='report_download'),
+    path('employees/search/', views.employee_search, name='employee_search'),
+    path('employees/<int:employee_id>/', views.employee_detail, name='employee_detail'),
+    path('employees/<int:employee_id>/payments/', views.employee_payments, name='employee_payments'),
 ]
\ No newline at end of file
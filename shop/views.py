@@ -1,81 +1,204 @@
-from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse
+import asyncio
+import contextvars
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.shortcuts import redirect, render, get_object_or_404
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.template import engines
+from django.template.loader import get_template, render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
 from django.views.decorators.csrf import csrf_exempt
-from .models import Product, Purchase
+from django.views.decorators.http import require_http_methods
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ImproperlyConfigured
+from .models import Product, Purchase, ReportJob
+from .forms import PaymentForm, ReportJobForm
+from .conditional import conditional_page
+from .search import search_employees
+from .ledger import employee_ledger
+from .analytics import analytics_period, compute_salary_analytics, period_shortcuts, with_position_rank
+from .snapshot import export_snapshot, list_snapshots
+from .roster import get_roster
+from .reports import CONTENT_TYPES, report_path
+from .live import LIVE_HEARTBEAT_SECONDS, broker, format_event, live_backend, publisher
+
+# =========== ГЛАВНАЯ СТРАНИЦА ===========
+# Строки списка рендерятся и отдаются пачками по INDEX_ROWS_CHUNK
+INDEX_ROWS_CHUNK = 500
+# Место в index.html, куда потоком вставляются строки списка
+EMPLOYEE_ROWS_MARKER = '<!-- employee-rows -->'
+
+
+def index_analytics_summary():
+    """Сводка по всему штату — из массивов в памяти, без загрузки моделей"""
+    roster = get_roster()
+    analytics = roster.salary_summary()
+    if analytics:
+        level_counts = roster.level_counts()
+        analytics.update({
+            'employee_count': len(roster),
+            'junior_count': level_counts['JUNIOR'],
+            'middle_count': level_counts['MIDDLE'],
+            'senior_count': level_counts['SENIOR'],
+            'lead_count': level_counts['LEAD'],
+            'manager_count': level_counts['MANAGER'],
+            'other_count': level_counts['OTHER'],
+        })
+    return analytics
+
+
+def _iterate_in_context(chunks):
+    """Потоковый ответ читается уже после выхода из middleware: выполняем
+    генератор в контексте представления (реплика, источник запросов)"""
+    context = contextvars.copy_context()
+    while True:
+        try:
+            yield context.run(next, chunks)
+        except StopIteration:
+            return
+
+
+async def _iterate_async(chunks):
+    """Под ASGI синхронный генератор Django сначала собрал бы в список целиком:
+    отдаем его асинхронно, каждая пачка — в потоке синхронного кода"""
+    next_chunk = sync_to_async(lambda: next(chunks, None), thread_sensitive=True)
+    while (chunk := await next_chunk()) is not None:
+        yield chunk
 
-# =========== НОВЫЙ ИМПОРТ ДЛЯ АНАЛИТИКИ ===========
-import pandas as pd
-import numpy as np
-from django.db.models import Sum, Avg, Max, Min
 
+def list_template_engine():
+    """Движок шаблонов больших списков: 'django' или 'jinja2' (см. shop.jinja_env)"""
+    name = settings.SHOP_LIST_TEMPLATES
+    if name not in engines.templates:
+        raise ImproperlyConfigured(
+            f"SHOP_LIST_TEMPLATES = {name!r}: движок не настроен"
+            + (" (нужен пакет jinja2: pip install jinja2)" if name == 'jinja2' else "")
+        )
+    return name
+
+
+def _employee_rows(employees, template):
+    rows = employees.iterator(chunk_size=INDEX_ROWS_CHUNK)
+    rendered_any = False
+    while chunk := list(islice(rows, INDEX_ROWS_CHUNK)):
+        rendered_any = True
+        yield template.render({'employees': chunk})
+    if not rendered_any:
+        yield template.render({'employees': []})
+
+
+@conditional_page
 def index(request):
-    """Главная страница со списком СОТРУДНИКОВ"""
-    employees = Product.objects.all()
-    
-    # =========== АНАЛИТИКА ЗАРПЛАТ ===========
-    salaries = [float(emp.price) for emp in employees]  # Используем price (оклад)
-    
-    if salaries:
-        # Рассчитываем медиану без numpy для надежности
-        sorted_salaries = sorted(salaries)
-        n = len(sorted_salaries)
-        if n % 2 == 0:
-            median_salary = (sorted_salaries[n//2 - 1] + sorted_salaries[n//2]) / 2
-        else:
-            median_salary = sorted_salaries[n//2]
-        
-        # Подсчёт типов сотрудников ТОЛЬКО по явно заданному полю employee_type
-        junior_count = 0
-        middle_count = 0
-        senior_count = 0
-        lead_count = 0
-        manager_count = 0
-        other_count = 0
-        
-        for emp in employees:
-            # Смотрим ТОЛЬКО явно заданный тип в БД (employee_type)
-            emp_type = emp.employee_type  # Это поле: 'JUNIOR', 'MIDDLE', 'SENIOR' и т.д.
-            
-            if emp_type == 'JUNIOR':
-                junior_count += 1
-            elif emp_type == 'MIDDLE':
-                middle_count += 1
-            elif emp_type == 'SENIOR':
-                senior_count += 1
-            elif emp_type == 'LEAD':
-                lead_count += 1
-            elif emp_type == 'MANAGER':
-                manager_count += 1
-            elif emp_type == 'OTHER':
-                other_count += 1
-            # Если employee_type пустое или None - не считаем!
-        
-        analytics = {
-            'total_salary_fund': sum(salaries),  # Сумма всех окладов
-            'average_salary': sum(salaries) / len(salaries),  # Средняя зарплата
-            'median_salary': median_salary,  # Медианная зарплата (без numpy)
-            'max_salary': max(salaries),  # Максимальная зарплата
-            'min_salary': min(salaries),  # Минимальная зарплата
-            'employee_count': len(employees),
-            'junior_count': junior_count,
-            'middle_count': middle_count,  # Добавили middle_count
-            'senior_count': senior_count,
-            'lead_count': lead_count,
-            'manager_count': manager_count,
-            'other_count': other_count,
-        }
-    else:
-        analytics = {}
+    """Главная страница со списком СОТРУДНИКОВ.
+
+    Каркас страницы уходит сразу, строки списка — потоком по мере чтения,
+    а блок аналитики браузер подгружает отдельным запросом (index_analytics).
+    Без JavaScript блок доступен по ссылке ?analytics=inline.
+    """
+    employees = Product.objects.select_related('position_ref')
+    query = request.GET.get('q', '').strip()
     
-    return render(request, 'shop/index.html', {
-        'employees': employees,
-        'analytics': analytics
+    # Поиск сужает только список, аналитика — по всему штату
+    if query:
+        employees = search_employees(employees, query)
+    
+    inline_analytics = request.GET.get('analytics') == 'inline'
+    shell = render_to_string('shop/index.html', {
+        'analytics': index_analytics_summary() if inline_analytics else None,
+        'inline_analytics': inline_analytics,
+        'query': query,
+        'employee_rows': mark_safe(EMPLOYEE_ROWS_MARKER),
+    }, request=request)
+    head, tail = shell.split(EMPLOYEE_ROWS_MARKER, 1)
+    rows_template = get_template('shop/_employee_rows.html', using=list_template_engine())
+    
+    def page():
+        yield head
+        yield from _employee_rows(employees, rows_template)
+        yield tail
+    
+    content = _iterate_in_context(page())
+    if isinstance(request, ASGIRequest):
+        content = _iterate_async(content)
+    return StreamingHttpResponse(content, content_type='text/html; charset=utf-8')
+
+
+@conditional_page
+def index_analytics(request):
+    """Фрагмент с блоком аналитики для главной страницы"""
+    return render(request, 'shop/_analytics_panel.html', {'analytics': index_analytics_summary()})
+
+# =========== ПОИСК СОТРУДНИКОВ ===========
+SEARCH_PAGE_SIZE = 20
+
+@conditional_page
+def employee_search(request):
+    """JSON для автодополнения: постраничный поиск по индексу (формат как у select2)"""
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    
+    employees = search_employees(Product.objects.order_by('name', 'id'), query)
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    # Берем на одну строку больше вместо COUNT(*) по всей выборке
+    rows = list(
+        employees.values('id', 'name', position=F('position_ref__name'))[offset:offset + SEARCH_PAGE_SIZE + 1]
+    )
+    
+    return JsonResponse({
+        'results': [
+            {'id': row['id'], 'text': row['name'], 'position': row['position']}
+            for row in rows[:SEARCH_PAGE_SIZE]
+        ],
+        'pagination': {'more': len(rows) > SEARCH_PAGE_SIZE},
+    })
+
+# =========== ВЕДОМОСТЬ СОТРУДНИКА ===========
+def _ledger_or_400(request, employee):
+    try:
+        return employee_ledger(employee, before=request.GET.get('before'))
+    except ValueError:
+        return None
+
+@conditional_page
+def employee_detail(request, employee_id):
+    """Карточка сотрудника с историей выплат (новые сверху, по курсору)"""
+    employee = get_object_or_404(Product.objects.select_related('position_ref'), id=employee_id)
+    ledger = _ledger_or_400(request, employee)
+    if ledger is None:
+        return HttpResponse("Неверный курсор страницы", status=400)
+    
+    return render(request, 'shop/employee_detail.html', {
+        'employee': employee,
+        'ledger': ledger,
+    })
+
+@conditional_page
+def employee_payments(request, employee_id):
+    """JSON-версия ведомости сотрудника"""
+    employee = get_object_or_404(Product.objects.select_related('position_ref'), id=employee_id)
+    ledger = _ledger_or_400(request, employee)
+    if ledger is None:
+        return JsonResponse({'error': 'Неверный курсор страницы'}, status=400)
+    
+    return JsonResponse({
+        'employee': {'id': employee.id, 'name': employee.name, 'position': employee.position},
+        'payments': ledger['payments'],
+        'next_cursor': ledger['next_cursor'],
     })
 
 @csrf_exempt
 def process_payment(request, employee_id):  # Переименовано buy_product → process_payment
     """Обработка выплаты зарплаты сотруднику (было покупки товара)"""
-    employee = get_object_or_404(Product, id=employee_id)  # Переименовано product → employee
+    employee = get_object_or_404(Product.objects.select_related('position_ref'), id=employee_id)  # Переименовано product → employee
     
     print(f"=== DEBUG ===")
     print(f"Employee: {employee.name}, Position: {employee.position}")
@@ -100,97 +223,197 @@ def process_payment(request, employee_id):  # Переименовано buy_pro
         
         print(f"Bonus: {bonus_str}, Deductions: {deductions_str}")
         
-        # Валидация
-        try:
-            bonus = float(bonus_str)
-            deductions = float(deductions_str)
-        except ValueError:
+        # Валидация: числа должны поместиться в numeric(12,2), иначе quantize
+        # и колонки выплаты не примут значение
+        form = PaymentForm({'bonus': bonus_str, 'deductions': deductions_str})
+        if not form.is_valid():
             return HttpResponse("Бонус и удержания должны быть числами", status=400)
+        bonus = form.cleaned_data['bonus']
+        deductions = form.cleaned_data['deductions']
         
-        # Рассчитываем итоговую зарплату
-        final_salary = employee.calculate_salary(bonus, deductions)
-        
-        # СОЗДАЕМ ЗАПИСЬ О ВЫПЛАТЕ (было Purchase, теперь SalaryPayment)
-        # Используем person для хранения бонуса (как строку)
-        Purchase.objects.create(
-            product=employee,  # Все ещё product в БД, но логически это employee
-            person=str(bonus),  # Храним бонус как строку в person
-            address=description or f"Зарплата за {employee.position}",  # Описание в address
-            # date автоматически установится
-        )
-        
-        # Обновляем "стаж" сотрудника (увеличиваем quantity на 1 месяц = 0.083 года)
-        # Это символическое увеличение стажа при каждой выплате
-        employee.quantity += 1  # quantity теперь символизирует "месяцы работы"
-        employee.save()
+        # Выплата, стаж и событие outbox фиксируются вместе или не фиксируются вовсе
+        with transaction.atomic():
+            # СОЗДАЕМ ЗАПИСЬ О ВЫПЛАТЕ (было Purchase, теперь SalaryPayment)
+            # Премия по-прежнему хранится строкой в person; оклад, удержания и
+            # итог фиксируются в выплате на момент расчета
+            payment = Purchase.objects.create(
+                product=employee,  # Все ещё product в БД, но логически это employee
+                person=f"{bonus:f}",  # Храним бонус как строку в person
+                deductions=deductions,
+                address=description or f"Зарплата за {employee.position}",  # Описание в address
+                # date автоматически установится
+            )
+            
+            # Обновляем "стаж" сотрудника (увеличиваем quantity на 1 месяц = 0.083 года)
+            # Это символическое увеличение стажа при каждой выплате
+            employee.quantity += 1  # quantity теперь символизирует "месяцы работы"
+            employee.save()
         
         return HttpResponse(
             f"✅ Зарплата выплачена сотруднику {employee.name}!<br>"
             f"✅ Должность: {employee.position}<br>"
-            f"✅ Оклад: {employee.base_salary} руб.<br>"
-            f"✅ Бонус: {bonus} руб.<br>"
-            f"✅ Удержания: {deductions} руб.<br>"
-            f"✅ ИТОГО: {final_salary} руб.<br>"
+            f"✅ Оклад: {payment.base_salary} руб.<br>"
+            f"✅ Бонус: {payment.bonus_amount} руб.<br>"
+            f"✅ Удержания: {payment.deductions} руб.<br>"
+            f"✅ ИТОГО: {payment.final_amount} руб.<br>"
             f"✅ Стаж обновлен: {employee.years_of_service} лет"
         )
 
 # =========== НОВАЯ ФУНКЦИЯ ДЛЯ АНАЛИТИКИ ===========
+@conditional_page(daily=True)
 def salary_analytics(request):
-    """Страница аналитики зарплат (новая функция)"""
-    employees = Product.objects.all()
-    payments = Purchase.objects.all()
-    
-    # Аналитика с использованием Pandas (как требуется в задании)
-    if employees:
-        # Создаем DataFrame для анализа
-        data = []
-        for emp in employees:
-            data.append({
-                'name': emp.name,
-                'position': emp.position,
-                'base_salary': float(emp.base_salary),
-                'years_of_service': emp.years_of_service,
-                'employee_type': emp.employee_type
-            })
-        
-        df = pd.DataFrame(data)
-        
-        analytics = {
-            'total_employees': len(df),
-            'by_position': df.groupby('position')['base_salary'].agg(['count', 'mean', 'sum']).to_dict(),
-            'by_type': df.groupby('employee_type')['base_salary'].mean().to_dict(),
-            'salary_stats': {
-                'mean': df['base_salary'].mean(),
-                'median': df['base_salary'].median(),
-                'std': df['base_salary'].std(),
-                'min': df['base_salary'].min(),
-                'max': df['base_salary'].max(),
-            },
-            'correlation_exp_salary': df['years_of_service'].corr(df['base_salary']),
-        }
-        
-        # Анализ выплат
-        if payments.exists():
-            payment_data = []
-            for p in payments:
-                payment_data.append({
-                    'employee': p.product.name,
-                    'bonus': float(p.person) if p.person.replace('.', '', 1).isdigit() else 0,
-                    'date': p.date,
-                    'description': p.address
-                })
-            
-            pdf = pd.DataFrame(payment_data)
-            if not pdf.empty and 'bonus' in pdf.columns:
-                analytics['bonus_stats'] = {
-                    'total_bonuses': pdf['bonus'].sum(),
-                    'avg_bonus': pdf['bonus'].mean(),
-                    'max_bonus': pdf['bonus'].max(),
-                }
-    else:
-        analytics = {}
+    """Страница аналитики зарплат (новая функция); выплаты — за период
+    ?from=ГГГГ-ММ-ДД&to=ГГГГ-ММ-ДД, сравнение — &compare=previous|year"""
+    try:
+        date_from, date_to, compare = analytics_period(request.GET)
+    except ValueError:
+        return HttpResponse("Неверный период", status=400)
+    # Агрегаты считает БД (или pandas — см. SHOP_ANALYTICS_BACKEND)
+    analytics = compute_salary_analytics(date_from=date_from, date_to=date_to, compare=compare)
+    employees = with_position_rank(Product.objects.select_related('position_ref')).order_by(
+        'position_ref__name', 'position_rank', 'id',
+    )
     
     return render(request, 'shop/analytics.html', {
         'analytics': analytics,
-        'employees': employees
-    })
\ No newline at end of file
+        'employees': employees,
+        'period': {'from': date_from, 'to': date_to, 'compare': compare},
+        'period_shortcuts': period_shortcuts(),
+    })
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def payroll_snapshots(request):
+    """Снимки Parquet для аналитиков: GET — список, POST — выгрузить новый"""
+    try:
+        if request.method == 'POST':
+            return JsonResponse(export_snapshot(), status=201)
+        return JsonResponse({'snapshots': list_snapshots()})
+    except ImproperlyConfigured as e:
+        return JsonResponse({'error': str(e)}, status=501)
+
+
+# =========== ФОНОВЫЕ ОТЧЕТЫ ===========
+REPORT_LIST_SIZE = 20
+
+
+def _report_job_for(request, job_id):
+    """Отчет, доступный пользователю: свой или любой для суперпользователя"""
+    jobs = ReportJob.objects.all()
+    if not request.user.is_superuser:
+        jobs = jobs.filter(created_by=request.user)
+    return get_object_or_404(jobs, pk=job_id)
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def report_jobs(request):
+    """Заказ отчета (POST) и список последних отчетов пользователя"""
+    if request.method == 'POST':
+        form = ReportJobForm(request.POST)
+        if form.is_valid():
+            job = ReportJob.objects.create(
+                kind=form.cleaned_data['kind'],
+                format=form.cleaned_data['format'],
+                filters=form.job_filters(),
+                created_by=request.user,
+            )
+            return redirect('report_job_status', job_id=job.pk)
+        status = 400
+    else:
+        form = ReportJobForm()
+        status = 200
+    
+    jobs = ReportJob.objects.filter(created_by=request.user)[:REPORT_LIST_SIZE]
+    return render(request, 'shop/report_jobs.html', {'form': form, 'jobs': jobs}, status=status)
+
+
+@staff_member_required
+def report_job_status(request, job_id):
+    """Страница статуса; ?format=json — то же для опроса скриптом"""
+    job = _report_job_for(request, job_id)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'id': job.pk,
+            'status': job.status,
+            'rows_total': job.rows_total,
+            'rows_done': job.rows_done,
+            'progress': job.progress,
+            'error': job.error,
+            'download_url': reverse('report_download', args=[job.pk]) if job.status == ReportJob.DONE else None,
+            'expires_at': job.expires_at,
+        })
+    return render(request, 'shop/report_job.html', {'job': job})
+
+
+@staff_member_required
+def report_download(request, job_id):
+    """Готовый файл отчета.
+
+    Файл отдается потоком FileResponse (под WSGI gunicorn передает его через
+    sendfile, под ASGI — пачками). Если задан SHOP_REPORT_ACCEL_REDIRECT, Django только проверяет
+    права, а сам файл отдает nginx из internal-location с этим префиксом.
+    """
+    job = _report_job_for(request, job_id)
+    if job.status == ReportJob.EXPIRED:
+        return HttpResponse("Срок хранения отчета истек, закажите его заново", status=410)
+    if job.status != ReportJob.DONE:
+        raise Http404("Отчет еще не готов")
+    
+    filename = f"{job.kind}-{job.pk}.{job.format}"
+    accel_prefix = settings.SHOP_REPORT_ACCEL_REDIRECT
+    if accel_prefix:
+        response = HttpResponse(content_type=CONTENT_TYPES[job.format])
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + job.file_name
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    try:
+        file = open(report_path(job), 'rb')
+    except FileNotFoundError:
+        raise Http404("Файл отчета не найден")
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=CONTENT_TYPES[job.format])
+
+
+# =========== ЖИВЫЕ ОБНОВЛЕНИЯ (SSE) ===========
+# Через сколько браузер переподключается после обрыва
+LIVE_RETRY_MS = 5000
+
+
+async def live_events(request):
+    """Поток Server-Sent Events с событиями payroll и payment (см. shop.live).
+    Соединение открыто, пока клиент не уйдет, поэтому только под ASGI."""
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Живые обновления доступны только через ASGI-сервер", status=501)
+    
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    live_backend().start_listening()
+    subscription = broker.subscribe(last_event_id)
+    if 'payroll' not in broker.latest:
+        publisher.mark_dirty()
+    
+    async def stream():
+        try:
+            yield f"retry: {LIVE_RETRY_MS}\n\n"
+            for event in subscription.backlog:
+                yield format_event(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Комментарий держит соединение через прокси и выявляет ушедших клиентов
+                    yield ": ping\n\n"
+                    continue
+                yield format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток событий
+    response['X-Accel-Buffering'] = 'no'
+    return response
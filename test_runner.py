@@ -1,5 +1,9 @@
 import os
 import sys
+import tempfile
+from django.conf import settings
+from django.db import connections
+from django.test import override_settings
 from django.test.runner import DiscoverRunner
 from django.utils import termcolors
 
@@ -34,6 +38,37 @@ class ColorfulTestRunner(DiscoverRunner):
         self.print_summary(result)
         return self.suite_result(suite, result)
     
+    def setup_databases(self, **kwargs):
+        # Тестовая SQLite — в файле, а не в памяти: у базы в памяти одно
+        # соединение на все потоки LiveServerTestCase, и параллельные запросы
+        # нагрузочного теста к нему зависают. Имя с pid — без вопроса об
+        # удалении базы, оставшейся от прерванного запуска. Транзакции сразу
+        # берут блокировку записи (IMMEDIATE): иначе две транзакции, начавшие
+        # с чтения, не могут повысить блокировку и одна падает с
+        # "database is locked", не дожидаясь таймаута
+        for alias in connections:
+            connection = connections[alias]
+            if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+                connection.settings_dict['TEST']['NAME'] = os.path.join(
+                    tempfile.gettempdir(), f'test_shop_{alias}_{os.getpid()}.sqlite3',
+                )
+                connection.settings_dict['OPTIONS'].update(transaction_mode='IMMEDIATE', timeout=20)
+        return super().setup_databases(**kwargs)
+    
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Манифест хешированной статики появляется только после collectstatic:
+        # в тестах ссылки на статику — без хеша
+        self.static_storage = override_settings(STORAGES={
+            **settings.STORAGES,
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        self.static_storage.enable()
+    
+    def teardown_test_environment(self, **kwargs):
+        self.static_storage.disable()
+        super().teardown_test_environment(**kwargs)
+    
     def run_suite(self, suite, **kwargs):
         """Запускает набор тестов и возвращает результат"""
         from unittest import TextTestRunner
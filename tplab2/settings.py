@@ -1,4 +1,6 @@
 import os
+import tempfile
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -28,12 +30,17 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Для статики на Render
+    # Ниже WhiteNoise: статика уже сжата заранее и сюда не доходит
+    'shop.middleware.CompressionMiddleware',  # gzip/Brotli для HTML и JSON
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'shop.middleware.QuerySourceMiddleware',
+    'shop.middleware.ReplicaRoutingMiddleware',
+    'shop.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'tplab2.urls'  # Замени если у тебя другое имя проекта
@@ -55,6 +62,20 @@ TEMPLATES = [
     },
 ]
 
+# Большие списки сотрудников можно рендерить скомпилированными шаблонами
+# Jinja2 из shop/jinja2/ (SHOP_LIST_TEMPLATES = 'jinja2'); jinja2 —
+# необязательная зависимость, движок подключается, только если он установлен
+SHOP_LIST_TEMPLATES = os.environ.get('SHOP_LIST_TEMPLATES', 'django')
+if find_spec('jinja2'):
+    TEMPLATES.append({
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'environment': 'shop.jinja_env.environment',
+        },
+    })
+
 WSGI_APPLICATION = 'tplab2.wsgi.application'  # Замени если у тебя другое имя проекта
 
 # =========== БАЗА ДАННЫХ ===========
@@ -82,6 +103,22 @@ if DATABASE_URL:
         #ssl_require=True  # Важно для Render
     )
 
+# РЕПЛИКА только для чтения (необязательно). Локально, например:
+#   DATABASE_URL=sqlite:///primary.sqlite3 REPLICA_DATABASE_URL=sqlite:///replica.sqlite3
+#   python manage.py migrate && python manage.py migrate --database replica
+REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        REPLICA_DATABASE_URL,
+        conn_max_age=600,
+        conn_health_checks=True,
+    )
+
+DATABASE_ROUTERS = ['shop.routers.PrimaryReplicaRouter']
+
+# Сколько секунд после своей записи пользователь читает с основной БД
+SHOP_REPLICA_PIN_SECONDS = int(os.environ.get('SHOP_REPLICA_PIN_SECONDS', 10))
+
 # =========== ВАЛИДАЦИЯ ПАРОЛЕЙ ===========
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -108,7 +145,98 @@ USE_TZ = True
 # =========== СТАТИЧЕСКИЕ ФАЙЛЫ ===========
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # Для collectstatic
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# collectstatic дает файлам имена с хешем содержимого и сжатые копии
+# (.gz, .br при установленном Brotli); WhiteNoise отдает хешированные
+# файлы с кешированием на год (STATICFILES_STORAGE в Django 5 не действует)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+
+# =========== HTTP-КЕШИРОВАНИЕ ===========
+# Сколько секунд браузер и обратный прокси могут отдавать страницы
+# без перепроверки (дальше — условный GET с ETag/Last-Modified)
+SHOP_HTTP_CACHE_MAX_AGE = int(os.environ.get('SHOP_HTTP_CACHE_MAX_AGE', '5'))
+# Сколько секунд ETag/Last-Modified остаются в силе. Версия данных строится
+# по count/max(id)/max(updated_at), а updated_at ставится до коммита: правка
+# со временем меньше уже известного максимума, зафиксированная позже, версию
+# не меняет. Поэтому валидаторы меняются и по времени — устаревшая страница
+# отдается не дольше SHOP_HTTP_VALIDATOR_SECONDS + SHOP_HTTP_CACHE_MAX_AGE
+SHOP_HTTP_VALIDATOR_SECONDS = int(os.environ.get('SHOP_HTTP_VALIDATOR_SECONDS', '60'))
+
+# =========== АНАЛИТИКА ===========
+# 'sql' — агрегаты считает БД, 'pandas' — расчет через DataFrame (эталон),
+# 'snapshot' — pandas по последнему снимку Parquet (нужен pyarrow),
+# 'streaming' — пачками с постоянной памятью, квантили приближенные (KLL)
+SHOP_ANALYTICS_BACKEND = os.environ.get('SHOP_ANALYTICS_BACKEND', 'sql')
+# Сколько секунд кэш (CACHES['default']) хранит разделы выплат закрытых
+# периодов; ограничивает устаревание ФИО в топе после переименований
+SHOP_ANALYTICS_CACHE_SECONDS = int(os.environ.get('SHOP_ANALYTICS_CACHE_SECONDS', '86400'))
+
+# Каталог снимков Parquet (команда export_snapshot)
+SHOP_SNAPSHOT_DIR = os.environ.get('SHOP_SNAPSHOT_DIR', os.path.join(BASE_DIR, 'snapshots'))
+
+# =========== ЖИВЫЕ ОБНОВЛЕНИЯ (SSE) ===========
+# 'local' — рассылка в пределах процесса (один ASGI-воркер),
+# 'postgres' — через NOTIFY/LISTEN между всеми процессами
+SHOP_LIVE_BACKEND = os.environ.get('SHOP_LIVE_BACKEND', 'local')
+
+# =========== ФОНОВЫЕ ОТЧЕТЫ ===========
+# Файлы отчетов (команда report_worker) и срок их хранения
+SHOP_REPORT_DIR = os.environ.get('SHOP_REPORT_DIR', os.path.join(BASE_DIR, 'reports'))
+SHOP_REPORT_TTL_HOURS = int(os.environ.get('SHOP_REPORT_TTL_HOURS', '24'))
+# Префикс internal-location nginx, указывающего на SHOP_REPORT_DIR:
+# если задан, файл отдает nginx по X-Accel-Redirect, а не Django
+SHOP_REPORT_ACCEL_REDIRECT = os.environ.get('SHOP_REPORT_ACCEL_REDIRECT') or None
+
+# =========== OUTBOX СОБЫТИЙ ===========
+# Куда outbox_dispatcher доставляет события о выплатах и окладах:
+# 'file' — JSON Lines в файл, 'socket' — в Unix-сокет, 'http' — POST на URL
+SHOP_OUTBOX_SINK = os.environ.get('SHOP_OUTBOX_SINK', 'file')
+SHOP_OUTBOX_TARGET = os.environ.get('SHOP_OUTBOX_TARGET', os.path.join(BASE_DIR, 'outbox', 'events.jsonl'))
+# Сколько часов хранить доставленные события
+SHOP_OUTBOX_RETENTION_HOURS = int(os.environ.get('SHOP_OUTBOX_RETENTION_HOURS', '24'))
+
+# =========== ПРОФИЛИРОВАНИЕ ===========
+# Персонал: ?_profile=1 (или заголовок X-Profile) — JSON-отчет вместо страницы,
+# ?_profile=store — страница как обычно, отчет сохраняется в SHOP_PROFILE_DIR
+SHOP_PROFILE_DIR = os.environ.get('SHOP_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+# =========== МЕДЛЕННЫЕ ЗАПРОСЫ ===========
+# Запросы дольше порога (мс) пишутся с планом EXPLAIN в ротируемый JSON-журнал.
+# Перехват включается явно, например SHOP_SLOW_QUERY_MS=200; журнал по
+# умолчанию — во временном каталоге, а не в дереве проекта.
+# Сводка: python manage.py slow_queries
+SHOP_SLOW_QUERY_MS = float(os.environ.get('SHOP_SLOW_QUERY_MS') or 0) or None
+SHOP_SLOW_QUERY_LOG = os.environ.get(
+    'SHOP_SLOW_QUERY_LOG', os.path.join(tempfile.gettempdir(), 'shop_slow_queries.jsonl'),
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json_lines': {'()': 'shop.slowlog.JsonLinesFormatter'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SHOP_SLOW_QUERY_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'encoding': 'utf-8',
+            'delay': True,
+            'formatter': 'json_lines',
+        },
+    },
+    'loggers': {
+        'shop.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -121,12 +249,4 @@ if DEBUG:
     print("=== DATABASE CONFIGURATION ===")
     print(f"DATABASE_URL from env: {os.environ.get('DATABASE_URL')}")
     print(f"DATABASES default config: {DATABASES['default']}")
-    
-    # Проверка подключения к базе
-    try:
-        from django.db import connection
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-        print("✅ DATABASE: Connection successful")
-    except Exception as e:
-        print(f"❌ DATABASE: Connection failed - {e}")
\ No newline at end of file
+    
\ No newline at end of file